@@ -1,9 +1,13 @@
 import streamlit as st
 from dotenv import load_dotenv
+from utils import warmup
 
 # Load environment variables
 load_dotenv()
 
+# Import and build the RAG pipeline in the background while the user logs in
+warmup.start()
+
 st.set_page_config(
     page_title="Temasek Poly Assistant",
     layout="wide",
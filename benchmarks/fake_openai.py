@@ -0,0 +1,124 @@
+"""Deterministic, offline stand-ins for the OpenAI clients used by the app.
+
+Embeddings are hashed bags of words, so texts sharing vocabulary land close
+together and retrieval quality can be measured meaningfully. Every call sleeps
+for a configurable latency to model the network round trip.
+"""
+import re
+import math
+import time
+import hashlib
+from types import SimpleNamespace
+from typing import List, Optional, Any, Iterator
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+EMBEDDING_DIMENSIONS = 256
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        vector[int.from_bytes(digest[:4], 'little') % dimensions] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+def fake_reply(prompt: str) -> str:
+    """A short, deterministic answer derived from the prompt"""
+    words = re.findall(r"\w+", prompt)
+    return "Based on the context, " + " ".join(words[-24:])
+
+
+class _Embeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, input, model, **kwargs):
+        self.owner._wait()
+        self.owner.calls["embeddings"] += 1
+        inputs = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=fake_embedding(text)) for i, text in enumerate(inputs)]
+        return SimpleNamespace(data=data, model=model)
+
+
+class _Completions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, **kwargs):
+        self.owner._wait()
+        self.owner.calls["chat"] += 1
+        prompt = " ".join(str(message.get("content", "")) for message in messages)
+        content = fake_reply(prompt)
+        usage = SimpleNamespace(
+            prompt_tokens=len(prompt.split()),
+            completion_tokens=len(content.split()),
+            total_tokens=len(prompt.split()) + len(content.split())
+        )
+        message = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, index=0)], usage=usage, model=model)
+
+
+class FakeOpenAIClient:
+    """Replaces helper_functions.llm.client"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {"embeddings": 0, "chat": 0}
+        self.embeddings = _Embeddings(self)
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeEmbeddings(Embeddings):
+    """Replaces langchain_openai.OpenAIEmbeddings"""
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [fake_embedding(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return fake_embedding(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Stands in for llm.get_chat_model(); streams its reply word by word"""
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    prompt_token_latency: float = 0.0  # Prefill cost, so longer prompts answer later
+    model_name: str = "fake-gpt"
+    temperature: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-openai-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        prompt = " ".join(str(message.content) for message in messages)
+        time.sleep(self.prompt_token_latency * len(prompt.split()))
+        return fake_reply(prompt)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        text = self._reply(messages)
+        time.sleep(self.token_latency * len(text.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for word in self._reply(messages).split():
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
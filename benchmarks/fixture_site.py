@@ -0,0 +1,49 @@
+"""A local HTTP site for crawl benchmarks: N interlinked pages plus robots.txt"""
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def make_handler(pages: int, latency: float, crawl_delay: float = 0.0):
+    robots = "User-agent: *\nDisallow: /private\n"
+    if crawl_delay:
+        robots += f"Crawl-delay: {crawl_delay}\n"
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/robots.txt":
+                self._send(robots, "text/plain")
+                return
+            time.sleep(latency)
+            try:
+                page = int(self.path.strip("/").removeprefix("page") or 0)
+            except ValueError:
+                self.send_error(404)
+                return
+            links = "".join(f'<a href="/page{(page * 7 + k) % pages}">Course {k}</a>' for k in range(1, 6))
+            body = (
+                f"<html><head><title>Page {page}</title></head><body>"
+                f"<nav>Menu</nav><h1>Course {page}</h1>"
+                f"<p>Course {page} teaches skills in topic {page % 13}. Fee ${100 + page}.</p>"
+                f"{links}<a href='/private'>hidden</a><footer>Footer</footer></body></html>"
+            )
+            self._send(body, "text/html")
+
+        def _send(self, body: str, content_type: str):
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return FixtureHandler
+
+def start_fixture_site(pages: int = 200, latency: float = 0.02, crawl_delay: float = 0.0) -> ThreadingHTTPServer:
+    """Serve the fixture site on a free localhost port in a daemon thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(pages, latency, crawl_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
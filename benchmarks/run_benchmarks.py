@@ -0,0 +1,466 @@
+"""Offline benchmark suite.
+
+Swaps every OpenAI client for the deterministic fakes in fake_openai.py and
+measures indexing, retrieval (Chroma and the NumPy index, alone and under
+concurrent load), chat turns, intent classification,
+startup import time and crawling.
+Results are written as JSON; pass --baseline to flag regressions against an
+earlier run.
+
+    python -m benchmarks.run_benchmarks --output bench.json [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+
+from benchmarks.fake_openai import FakeOpenAIClient, FakeEmbeddings, FakeChatModel
+from benchmarks.fixture_site import start_fixture_site
+
+SAMPLE_QUESTIONS = [
+    "How much is the data analytics course?",
+    "What SkillsFuture funding can I use for part-time courses?",
+    "Can my company collaborate with TP on a research project?",
+    "Do you offer a specialist diploma in cybersecurity?",
+    "How do I enrol in a short course on sustainability?",
+    "What internship partnerships are available for businesses?",
+    "Where is the Temasek Polytechnic campus?",
+    "What are the entry requirements for the AI course?",
+]
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+@contextmanager
+def fake_openai(latency: float, token_latency: float, cache_path: str, prompt_token_latency: float = 0.0):
+    """Point every OpenAI entry point at deterministic local fakes"""
+    from helper_functions import llm, embeddings
+    import langchain_openai
+
+    def chat_model(model="gpt-4o-mini", temperature=0):
+        return FakeChatModel(latency=latency, token_latency=token_latency, prompt_token_latency=prompt_token_latency)
+
+    client = FakeOpenAIClient(latency=latency)
+    patches = [
+        (llm, "client", client),
+        (embeddings, "_cache", embeddings.EmbeddingCache(cache_path)),
+        (langchain_openai, "OpenAIEmbeddings", lambda **kwargs: FakeEmbeddings(latency=latency)),
+        (llm, "get_chat_model", chat_model),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield client
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+
+def bench_indexing(client, persist_directory):
+    from utils.vector_store import build_vectorstore, IngestProgress
+
+    results = {}
+    for run in ("cold", "warm"):
+        calls_before = client.calls["embeddings"]
+        progress = IngestProgress()
+        start = time.perf_counter()
+        vector_store = build_vectorstore(persist_directory, progress=progress)
+        results[run] = {
+            "seconds": time.perf_counter() - start,
+            "embedding_calls": client.calls["embeddings"] - calls_before,
+            "chunks": progress.chunks,
+            "changes": progress.changes,
+            "dedup": {
+                "boilerplate_segments": progress.boilerplate_segments,
+                "duplicate_chunks": progress.duplicate_chunks,
+                "tokens_removed": progress.tokens_removed,
+                "tokens_indexed": progress.tokens_indexed,
+            },
+        }
+    return results, vector_store
+
+def bench_retrieval(vector_store, persist_directory, k, samples, seed=0):
+    """Latency and recall@k, using a span of each sampled chunk as its own query"""
+    from utils.vector_store import get_retriever
+    from utils.bm25 import BM25Index
+
+    index = BM25Index.load(persist_directory)
+    rng = random.Random(seed)
+    positions = rng.sample(range(len(index.ids)), min(samples, len(index.ids)))
+    queries = []
+    for position in positions:
+        words = index.texts[position].split()
+        start = rng.randrange(max(1, len(words) - 12))
+        queries.append((" ".join(words[start:start + 12]), index.ids[position]))
+
+    retrievers = {
+        "dense": vector_store.as_retriever(search_kwargs={"k": k}),
+        "hybrid": get_retriever(vector_store, persist_directory, k=k, compress=False),
+        "hybrid_compressed": get_retriever(vector_store, persist_directory, k=k, compress=True),
+    }
+    results = {}
+    for name, retriever in retrievers.items():
+        latencies = []
+        hits = 0
+        for query, expected in queries:
+            start = time.perf_counter()
+            documents = retriever.invoke(query)
+            latencies.append(time.perf_counter() - start)
+            hits += any(document.metadata.get("chunk_id") == expected for document in documents[:k])
+        results[name] = {"latency": summarize(latencies), f"recall_at_{k}": hits / len(queries)}
+
+    latencies = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+    results["bm25_only"] = {"latency": summarize(latencies)}
+    return results
+
+def bench_concurrent_retrieval(client, vector_store, persist_directory, k, concurrency, searches_per_session, seed=1):
+    """Concurrent sessions searching on their own vs through the micro-batching retrieval service"""
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.vector_store import get_retriever
+    from utils.retrieval_service import RetrievalService
+    from utils.bm25 import BM25Index
+
+    index = BM25Index.load(persist_directory)
+    rng = random.Random(seed)
+    results = {}
+    for name in ("per_session", "batched"):
+        # Fresh queries for each mode, so neither is answered from the embedding cache
+        queries = []
+        for _ in range(concurrency * searches_per_session):
+            words = index.texts[rng.randrange(len(index.ids))].split()
+            start = rng.randrange(max(1, len(words) - 10))
+            queries.append(" ".join(words[start:start + 10]) + f" {rng.random():.6f}")
+        service = RetrievalService(vector_store) if name == "batched" else None
+        retriever = get_retriever(vector_store, persist_directory, k=k, compress=False, service=service)
+
+        def search(query):
+            started = time.perf_counter()
+            retriever.invoke(query)
+            return time.perf_counter() - started
+
+        calls_before = client.calls["embeddings"]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(search, queries))
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "latency": summarize(latencies),
+            "searches_per_second": len(queries) / elapsed,
+            "embedding_calls": client.calls["embeddings"] - calls_before,
+        }
+    return results
+
+def bench_vector_index(workdir, k, samples, seed=0):
+    """Open time, search latency, memory and top-k agreement of the NumPy backend per storage mode"""
+    from helper_functions.embeddings import CachedOpenAIEmbeddings
+    from utils.vector_store import build_vectorstore
+    from utils.numpy_index import NumpyVectorStore
+
+    embedding = CachedOpenAIEmbeddings()
+    source = build_vectorstore(os.path.join(workdir, "vector_index"), backend="numpy")
+    results = {}
+    exact = None
+    for dtype, dimensions in (("float32", None), ("int8", None), ("int8", 128)):
+        name = f"{dtype}_{dimensions or 'full'}"
+        directory = os.path.join(workdir, f"vector_index_{name}")
+        # Re-embedding the same chunks is served from the embedding cache
+        store = NumpyVectorStore(embedding, dtype=dtype, dimensions=dimensions)
+        store.add_texts(source.texts, source.metadatas, ids=source.ids)
+        store.save(directory)
+
+        start = time.perf_counter()
+        store = NumpyVectorStore(embedding, directory)
+        open_seconds = time.perf_counter() - start
+
+        rng = random.Random(seed)
+        queries = [embedding.embed_query(store.texts[position][:200])
+                   for position in rng.sample(range(len(store)), min(samples, len(store)))]
+        latencies = []
+        top = []
+        for query in queries:
+            start = time.perf_counter()
+            hits = store.search_vector(query, k)
+            latencies.append(time.perf_counter() - start)
+            top.append({store.ids[position] for position, _ in hits})
+        if exact is None:
+            exact = top
+        results[name] = {
+            "open_ms": open_seconds * 1000,
+            "search": summarize(latencies),
+            "vector_bytes": store.nbytes,
+            f"recall_at_{k}": statistics.fmean(len(a & b) / k for a, b in zip(top, exact)),
+        }
+    return results
+
+def bench_chat(vector_store, persist_directory, latency, token_latency, prompt_token_latency=0.0):
+    """Per-turn latency through create_chat_chain/process_query and the staged pipeline"""
+    from helper_functions import llm as llm_client
+    from utils.bm25 import tokenize
+    from utils.vector_store import get_retriever
+    from utils.chat_chain import (
+        create_chat_chain, process_query, create_answer_chain,
+        create_contextualize_chain, pre_retrieve, stream_answer
+    )
+
+    llm = FakeChatModel(latency=latency, token_latency=token_latency, prompt_token_latency=prompt_token_latency)
+    retriever = get_retriever(vector_store, persist_directory)
+    chain = create_chat_chain(vector_store, "adult_learner", llm=llm, retriever=retriever)
+    answer_chain = create_answer_chain(llm, "adult_learner")
+    contextualize_chain = create_contextualize_chain(llm)
+
+    def classify(question):
+        return "adult_learner"
+
+    results = {}
+    for with_history in (False, True):
+        history = [("What courses do you offer?", "We offer many CET courses.", [])] if with_history else []
+        label = "with_history" if with_history else "first_turn"
+
+        chain_latencies = []
+        pipeline_latencies = []
+        first_token = []
+        for question in SAMPLE_QUESTIONS:
+            start = time.perf_counter()
+            process_query(chain, question, history)
+            chain_latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            prepared = pre_retrieve(question, history, classify, contextualize_chain, retriever)
+            stream = stream_answer(answer_chain, prepared["standalone_question"], prepared["documents"])
+            for _ in stream:
+                pass
+            pipeline_latencies.append(time.perf_counter() - start)
+            first_token.append(pipeline_latencies[-1] - stream.total_time + (stream.time_to_first_token or 0))
+
+        results[label] = {
+            "process_query": summarize(chain_latencies),
+            "pipeline": summarize(pipeline_latencies),
+            "pipeline_time_to_first_token": summarize(first_token),
+        }
+
+    # Whole chunks against MMR + sentence extraction: prompt context size, turn
+    # latency, and how many of the question's terms found in the full context survive
+    full_retriever = get_retriever(vector_store, persist_directory, compress=False)
+    compressed_retriever = get_retriever(vector_store, persist_directory, compress=True)
+    coverage = {"full": [], "compressed": []}
+    for name, variant in (("full", full_retriever), ("compressed", compressed_retriever)):
+        context_tokens = []
+        latencies = []
+        for question in SAMPLE_QUESTIONS:
+            start = time.perf_counter()
+            prepared = pre_retrieve(question, [], classify, contextualize_chain, variant)
+            for _ in stream_answer(answer_chain, question, prepared["documents"]):
+                pass
+            latencies.append(time.perf_counter() - start)
+            context = " ".join(document.page_content for document in prepared["documents"])
+            context_tokens.append(llm_client.count_tokens(context))
+            coverage[name].append(set(tokenize(question)) & set(tokenize(context)))
+        results[f"context_{name}"] = {
+            "pipeline": summarize(latencies),
+            "context_tokens_mean": statistics.fmean(context_tokens),
+        }
+    results["context_compressed"]["question_term_coverage"] = statistics.fmean(
+        len(kept & full) / len(full) if full else 1.0 for kept, full in zip(coverage["compressed"], coverage["full"])
+    )
+    return results
+
+def bench_classifier(repeats=20):
+    from utils.intent_classifier import IntentClassifier, create_intent_classification_crew
+
+    # A zero-size cache measures the classifier itself rather than the LRU
+    classifier = IntentClassifier(cache_size=0)
+    classifier._crew_classify = lambda question: "general question"
+    latencies = []
+    for _ in range(repeats):
+        for question in SAMPLE_QUESTIONS:
+            start = time.perf_counter()
+            classifier(question)
+            latencies.append(time.perf_counter() - start)
+    results = {
+        "local": summarize(latencies),
+        "fallback_rate": classifier.fallback_rate,
+    }
+
+    try:
+        classify = create_intent_classification_crew()
+        crew_latencies = []
+        for question in SAMPLE_QUESTIONS[:3]:
+            start = time.perf_counter()
+            classify(question)
+            crew_latencies.append(time.perf_counter() - start)
+        results["crew"] = summarize(crew_latencies)
+    except Exception as e:
+        # CrewAI versions differ in which LLM objects they accept
+        results["crew"] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+# Import paths of the app's startup: the Home page, the Assistant page before a
+# question is asked, and the full pipeline the warm-up thread loads
+STARTUP_IMPORTS = {
+    "home": "import streamlit, dotenv, utils.warmup",
+    "assistant_first_render": "import streamlit, utils.warmup",
+    "pipeline": "import utils.knowledge_base, utils.chat_chain, utils.context_window",
+}
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) rows from python -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        rows.append((name.strip(), int(fields[0]), int(fields[1]), (len(name) - len(name.lstrip())) // 2))
+    return rows
+
+def bench_startup(repeats=3):
+    """Import time of each startup path in a fresh interpreter, plus the slowest packages of the full pipeline"""
+    root = Path(__file__).resolve().parent.parent
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    results = {}
+    slowest = []
+    for name, statement in STARTUP_IMPORTS.items():
+        seconds = []
+        for _ in range(repeats):
+            completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=root, env=env,
+                                       capture_output=True, text=True)
+            rows = parse_importtime(completed.stderr)
+            seconds.append(sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1e6)
+        results[name] = summarize(seconds)
+        if name == "pipeline":
+            # Own import time summed per top-level package, from the last run
+            by_package = Counter()
+            for module, own, _, _ in rows:
+                by_package[module.split('.')[0]] += own
+            slowest = by_package.most_common(10)
+    results["slowest_pipeline_packages_ms"] = {package: own / 1000 for package, own in slowest}
+    return results
+
+def bench_crawl(pages, concurrency_levels, page_latency, rate_limit):
+    """Crawl throughput against one local host with the given politeness delay.
+
+    Requests to one host start at least the delay apart, so throughput can
+    never exceed 1 / delay pages per second whatever the concurrency. The
+    results record the delay used and the scraper's default, which caps a
+    real single-site crawl that sets no other.
+    """
+    from webScraper import EthicalWebScraper, DEFAULT_RATE_LIMIT
+
+    server = start_fixture_site(pages=pages, latency=page_latency)
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+    results = {"per_host_delay_seconds": rate_limit, "scraper_per_host_delay_seconds": DEFAULT_RATE_LIMIT}
+    try:
+        for concurrency in concurrency_levels:
+            with tempfile.TemporaryDirectory() as output_dir:
+                scraper = EthicalWebScraper(base_url, output_dir, concurrency=concurrency, rate_limit=rate_limit)
+                start = time.perf_counter()
+                scraped = scraper.scrape_site(max_pages=pages, resume=False)
+                elapsed = time.perf_counter() - start
+            results[f"concurrency_{concurrency}"] = {
+                "pages": scraped,
+                "seconds": elapsed,
+                "pages_per_second": scraped / elapsed if elapsed else 0.0,
+            }
+    finally:
+        server.shutdown()
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "platform": platform.platform(), "commit": commit,
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def find_regressions(results, baseline, tolerance, path=""):
+    """Compare numeric leaves: timings should not grow, rates and recall should not shrink"""
+    regressions = []
+    for key, value in results.items():
+        if key not in baseline or key in ("environment", "config"):
+            continue
+        name = f"{path}.{key}" if path else key
+        old = baseline[key]
+        if isinstance(value, dict) and isinstance(old, dict):
+            regressions.extend(find_regressions(value, old, tolerance, name))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            lower_is_better = key.endswith("_ms") or key == "seconds"
+            higher_is_better = key.endswith(("per_second", "coverage")) or key.startswith("recall")
+            if lower_is_better and value > old * (1 + tolerance):
+                regressions.append(f"{name}: {old:.4g} -> {value:.4g}")
+            elif higher_is_better and value < old * (1 - tolerance):
+                regressions.append(f"{name}: {old:.4g} -> {value:.4g}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated OpenAI round trip")
+    parser.add_argument("--token-latency-ms", type=float, default=2, help="Simulated delay per streamed token")
+    parser.add_argument("--prompt-token-latency-ms", type=float, default=0.05, help="Simulated prefill delay per prompt token")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--retrieval-samples", type=int, default=50)
+    parser.add_argument("--retrieval-concurrency", type=int, default=16, help="Sessions searching at once")
+    parser.add_argument("--crawl-pages", type=int, default=100)
+    parser.add_argument("--crawl-concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--crawl-page-latency-ms", type=float, default=20)
+    parser.add_argument("--crawl-rate-limit", type=float, default=0.005, help="Per-host politeness delay in seconds; the scraper's default is 1s, which caps a real crawl at 1 page/s")
+    args = parser.parse_args(argv)
+
+    latency = args.latency_ms / 1000
+    token_latency = args.token_latency_ms / 1000
+    prompt_token_latency = args.prompt_token_latency_ms / 1000
+    results = {"environment": environment(), "config": vars(args)}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        persist_directory = os.path.join(workdir, "chroma_db")
+        with fake_openai(latency, token_latency, os.path.join(workdir, "embeddings.sqlite3"), prompt_token_latency) as client:
+            results["indexing"], vector_store = bench_indexing(client, persist_directory)
+            results["retrieval"] = bench_retrieval(vector_store, persist_directory, args.k, args.retrieval_samples)
+            results["concurrent_retrieval"] = bench_concurrent_retrieval(
+                client, vector_store, persist_directory, args.k, args.retrieval_concurrency, args.retrieval_samples // 5)
+            results["vector_index"] = bench_vector_index(workdir, args.k, args.retrieval_samples)
+            results["chat"] = bench_chat(vector_store, persist_directory, latency, token_latency, prompt_token_latency)
+            results["classifier"] = bench_classifier()
+    results["startup"] = bench_startup()
+    results["crawl"] = bench_crawl(args.crawl_pages, args.crawl_concurrency,
+                                   args.crawl_page_latency_ms / 1000, args.crawl_rate_limit)
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from helper_functions import llm
+from helper_functions import tracing
+
+DEFAULT_MODEL = 'text-embedding-3-small'
+
+# Tunables, overridable from the environment
+CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '.cache/embeddings.sqlite3')
+MAX_BATCH_TOKENS = int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', '20000'))
+MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '512'))
+MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4'))
+# Document embeddings kept on disk; the oldest are dropped beyond this (about 6 KB each)
+MAX_CACHE_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '50000'))
+# Query embeddings are only kept in memory, for the most recent queries
+QUERY_CACHE_ENTRIES = int(os.getenv('EMBEDDING_QUERY_CACHE_ENTRIES', '2048'))
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent (model, text hash) -> embedding cache backed by SQLite.
+
+    Holds at most max_entries embeddings; the ones written longest ago are
+    dropped first.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_CACHE_ENTRIES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                )
+                for row_hash, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, key, array('f', vector).tobytes()) for key, vector in items.items()]
+            )
+            # INSERT OR REPLACE gives rewritten rows a new rowid, so rowid order is write order
+            excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                    (excess,)
+                )
+            self._conn.commit()
+
+
+class MemoryEmbeddingCache:
+    """EmbeddingCache's interface over a bounded in-memory LRU, for query embeddings"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in hashes:
+                vector = self._entries.get((model, key))
+                if vector is not None:
+                    self._entries.move_to_end((model, key))
+                    found[key] = vector
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._entries[(model, key)] = vector
+                self._entries.move_to_end((model, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+_query_cache = MemoryEmbeddingCache()
+
+# Counters for checking that warm rebuilds stay off the network
+stats = {"api_calls": 0, "texts_embedded": 0, "cache_hits": 0}
+_stats_lock = threading.Lock()
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+def _record(**counts):
+    with _stats_lock:
+        for key, value in counts.items():
+            stats[key] += value
+
+def make_batches(texts: List[str], max_tokens: int = MAX_BATCH_TOKENS, max_size: int = MAX_BATCH_SIZE) -> List[List[str]]:
+    """Greedily pack texts into batches bounded by token count and input count"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = llm.count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _embed_batch(batch: List[str], model: str) -> List[List[float]]:
+    """Embed one batch through the shared client, with retries and coalescing of identical batches"""
+    def call():
+        response = llm.call_with_retries(lambda: llm.client.embeddings.create(input=batch, model=model))
+        # Only the caller that made the request accounts for it
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            tracing.record_usage(model, usage.prompt_tokens or 0)
+        _record(api_calls=1, texts_embedded=len(batch))
+        return response
+
+    with tracing.span("embedding.batch", model=model, texts=len(batch)):
+        key = llm.request_key("embeddings", model=model, input=[text_hash(text) for text in batch])
+        response = llm.in_flight.run(key, call)
+    return [x.embedding for x in sorted(response.data, key=lambda x: x.index)]
+
+def embed_texts(texts: List[str], model: str = DEFAULT_MODEL, max_concurrency: int = MAX_CONCURRENCY,
+                persist: bool = True) -> List[List[float]]:
+    """Embed texts through the cache, sending only unseen texts in concurrent batches.
+
+    Pass persist=False for queries: their new embeddings go to the in-memory
+    query cache instead of SQLite, so the interactive path never writes to disk.
+    """
+    if not texts:
+        return []
+
+    cache = get_cache()
+    hashes = [text_hash(text) for text in texts]
+    unique = list(dict.fromkeys(hashes))
+    vectors = _query_cache.get_many(model, unique)
+    if len(vectors) < len(unique):
+        vectors.update(cache.get_many(model, [key for key in unique if key not in vectors]))
+    _record(cache_hits=sum(1 for key in hashes if key in vectors))
+
+    # Each distinct uncached text is embedded once, however often it repeats
+    missing = {}
+    for key, text in zip(hashes, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+
+    if missing:
+        batches = make_batches(list(missing.values()))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(batches)))) as executor:
+            # Each batch runs in the caller's context, so it keeps the trace and rate-limit session
+            futures = [executor.submit(contextvars.copy_context().run, _embed_batch, batch, model) for batch in batches]
+            for batch, future in zip(batches, futures):
+                embedded = {text_hash(text): vector for text, vector in zip(batch, future.result())}
+                (cache if persist else _query_cache).put_many(model, embedded)
+                vectors.update(embedded)
+
+    return [vectors[key] for key in hashes]
+
+
+class CachedOpenAIEmbeddings(Embeddings):
+    """LangChain embeddings adapter over embed_texts, used by the vector store"""
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return embed_texts(list(texts), model=self.model)
+
+    def embed_query(self, text: str) -> List[float]:
+        return embed_texts([text], model=self.model, persist=False)[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Several queries in one call, kept in memory like embed_query"""
+        return embed_texts(list(texts), model=self.model, persist=False)
@@ -1,19 +1,308 @@
 import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
+import httpx
+import openai
 from openai import OpenAI
 import tiktoken
+from helper_functions import tracing
+from helper_functions import rate_limit
 
 load_dotenv('.env')
 
-# Pass the API Key to the OpenAI Client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# One bounded pool of keep-alive connections shared by every OpenAI caller
+MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+REQUEST_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+MAX_RETRIES = 5
+MAX_BACKOFF = 30
+MAX_RETRY_AFTER = 120
 
-def get_embedding(input, model='text-embedding-3-small'):
-    response = client.embeddings.create(
-        input=input,
-        model=model
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+# Account-wide OpenAI quota shared by every session in this process
+REQUESTS_PER_MINUTE = float(os.getenv('OPENAI_RPM', '500'))
+TOKENS_PER_MINUTE = float(os.getenv('OPENAI_TPM', '200000'))
+# Completion tokens assumed when a request does not cap them
+COMPLETION_TOKENS_ESTIMATE = 400
+
+# Every request on the shared clients waits here for its turn at the quota
+scheduler = rate_limit.FairScheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+def estimate_request_tokens(request: httpx.Request) -> int:
+    """Tokens a chat or embedding request will use: its input plus the completion allowance"""
+    try:
+        body = json.loads(request.content or b'{}')
+    except (ValueError, httpx.RequestNotRead):
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    tokens = 0
+    for message in body.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = ' '.join(part.get("text", "") for part in content if isinstance(part, dict))
+        tokens += count_tokens(content or "")
+    if "messages" in body:
+        tokens += body.get("max_completion_tokens") or body.get("max_tokens") or COMPLETION_TOKENS_ESTIMATE
+    inputs = body.get("input")
+    if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    for item in inputs or []:
+        # LangChain sends pre-tokenized input as lists of token ids
+        tokens += len(item) if isinstance(item, list) else count_tokens(item)
+    return tokens
+
+def _reported_tokens(response: httpx.Response) -> Optional[int]:
+    try:
+        return response.json().get("usage", {}).get("total_tokens")
+    except (ValueError, AttributeError):
+        return None
+
+def _is_stream(request: httpx.Request) -> bool:
+    return b'"stream":true' in (request.content or b'').replace(b' ', b'')
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """Admits each request through the shared scheduler before sending it.
+
+    Non-streamed responses settle the token estimate with the reported usage;
+    streamed ones keep the estimate.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, scheduler: rate_limit.FairScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = estimate_request_tokens(request)
+        self.scheduler.acquire(estimate)
+        response = self.transport.handle_request(request)
+        if not _is_stream(request) and response.status_code == 200:
+            response.read()
+            actual = _reported_tokens(response)
+            if actual is not None:
+                self.scheduler.settle(estimate, actual)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ScheduledAsyncTransport(httpx.AsyncBaseTransport):
+    """ScheduledTransport for the async client"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: rate_limit.FairScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = estimate_request_tokens(request)
+        await self.scheduler.aacquire(estimate)
+        response = await self.transport.handle_async_request(request)
+        if not _is_stream(request) and response.status_code == 200:
+            await response.aread()
+            actual = _reported_tokens(response)
+            if actual is not None:
+                self.scheduler.settle(estimate, actual)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+http_client = httpx.Client(
+    transport=ScheduledTransport(httpx.HTTPTransport(limits=_limits), scheduler),
+    timeout=REQUEST_TIMEOUT
+)
+# Only ever used from the shared event loop below, since async connections belong to one loop
+http_async_client = httpx.AsyncClient(
+    transport=ScheduledAsyncTransport(httpx.AsyncHTTPTransport(limits=_limits), scheduler),
+    timeout=REQUEST_TIMEOUT
+)
+
+# Pass the API Key to the OpenAI Client; retries are handled here so they can honour rate-limit headers
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=http_client, max_retries=0)
+
+# Counters for the admin page: upstream calls, calls saved by coalescing, retries
+stats = {"requests": 0, "coalesced": 0, "retries": 0}
+_stats_lock = threading.Lock()
+
+def _record(**counts):
+    with _stats_lock:
+        for key, value in counts.items():
+            stats[key] += value
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop that owns the async connection pool, started on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+def run_async(coroutine):
+    """Run a coroutine on the shared event loop from synchronous code and wait for its result.
+
+    Context variables (e.g. the current trace) are carried over to the task.
+    """
+    context = contextvars.copy_context()
+
+    async def in_context():
+        for variable, value in context.items():
+            variable.set(value)
+        return await coroutine
+
+    return asyncio.run_coroutine_threadsafe(in_context(), get_event_loop()).result()
+
+
+def _parse_duration(value: str) -> float:
+    """Parse OpenAI reset headers such as "1s", "6m0s" or "20ms" into seconds"""
+    seconds = 0.0
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's hint if it gave one, else jittered exponential backoff"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    hints = []
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            hints.append(float(headers.get(name)) * scale)
+        except (TypeError, ValueError):
+            pass
+    if isinstance(error, openai.RateLimitError):
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            if headers.get(name):
+                hints.append(_parse_duration(headers[name]))
+    hints = [hint for hint in hints if 0 < hint <= MAX_RETRY_AFTER]
+    if hints:
+        # A little jitter keeps clients that were throttled together from retrying together
+        return max(hints) * random.uniform(1.0, 1.2)
+    return min(MAX_BACKOFF, 2 ** attempt) * random.uniform(0.5, 1.5)
+
+def call_with_retries(call, max_retries: int = MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            _record(requests=1)
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            _record(retries=1)
+            time.sleep(retry_delay(e, attempt))
+
+class InFlightRequests:
+    """Lets concurrent identical requests share one upstream call.
+
+    The first caller for a key becomes the leader and makes the call; callers
+    arriving while it is in flight wait for the same result (or exception).
+    Covers direct completions and embedding batches; LangChain chains call
+    the SDK themselves and are not coalesced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key, call):
+        future, leader = self._join(key)
+        if not leader:
+            _record(coalesced=1)
+            return future.result()
+        try:
+            result = call()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+in_flight = InFlightRequests()
+
+def request_key(kind: str, **params) -> str:
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _record_usage(model, response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        tracing.record_usage(model, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+def create_chat_completion(**params):
+    """Chat completion through the shared pool, with retries and in-flight coalescing.
+
+    Token usage is attributed to the caller that made the upstream request.
+    """
+    def call():
+        response = call_with_retries(lambda: client.chat.completions.create(**params))
+        _record_usage(params.get("model"), response)
+        return response
+    return in_flight.run(request_key("chat", **params), call)
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str = "gpt-4o-mini", temperature: float = 0):
+    """Shared LangChain chat model using the pooled connections.
+
+    The OpenAI SDK's own retries (which honour Retry-After) cover LangChain
+    calls; stream_usage and the tracing callback report token usage. Identical
+    calls are not coalesced. Its async methods must run on the shared loop,
+    e.g. via run_async.
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=model,
+        temperature=temperature,
+        max_retries=MAX_RETRIES,
+        stream_usage=True,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        callbacks=[tracing.TracingCallbackHandler()],
     )
-    return [x.embedding for x in response.data]
+
+def get_embedding(input, model='text-embedding-3-small'):
+    # Batched, concurrent and cached; see helper_functions/embeddings.py
+    from helper_functions.embeddings import embed_texts
+    if isinstance(input, str):
+        input = [input]
+    return embed_texts(list(input), model=model)
 
 
 # This is the "Updated" helper function for calling LLM
@@ -24,38 +313,45 @@ def get_completion(prompt, model="gpt-4o-mini", temperature=0, top_p=1.0, max_to
       output_json_structure = None
 
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create( #originally was openai.chat.completions
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        n=1,
-        response_format=output_json_structure,
-    )
+    with tracing.span("llm.completion", model=model):
+        response = create_chat_completion( #originally was openai.chat.completions
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            n=1,
+            response_format=output_json_structure,
+        )
     return response.choices[0].message.content
 
 # Note that this function directly take in "messages" as the parameter.
 def get_completion_by_messages(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        n=1
-    )
+    with tracing.span("llm.completion", model=model):
+        response = create_chat_completion(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            n=1
+        )
     return response.choices[0].message.content
 
 # This function is for calculating the tokens given the "message"
 # ⚠️ This is simplified implementation that is good enough for a rough estimation
 
+@lru_cache(maxsize=None)
+def get_encoding(model='gpt-4o-mini'):
+    # Building an encoding is far more expensive than using one, so do it once per model
+    return tiktoken.encoding_for_model(model)
+
 def count_tokens(text):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
+    encoding = get_encoding()
     return len(encoding.encode(text))
 
 
 def count_tokens_from_message(messages):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
+    encoding = get_encoding()
     value = ' '.join([x.get('content') for x in messages])
     return len(encoding.encode(value))
\ No newline at end of file
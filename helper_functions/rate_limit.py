@@ -0,0 +1,221 @@
+import time
+import asyncio
+import threading
+import contextvars
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+# How often a queued coroutine re-checks whether it has reached the head of the queue
+ASYNC_POLL_SECONDS = 0.01
+
+class TokenBucket:
+    """Continuously refilled budget of units (requests or tokens) per minute.
+
+    Callers reserve units up front and may drive the balance negative; the
+    debt is paid off by waiting, so reservations are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        # Allow a burst of ten seconds' worth by default
+        self.capacity = capacity if capacity is not None else rate_per_minute / 6
+        self.balance = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.balance = min(self.capacity, self.balance + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how many seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.balance -= amount
+            return max(0.0, -self.balance / self.rate) if self.rate else 0.0
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount is available, without taking it"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (amount - self.balance) / self.rate) if self.rate else 0.0
+
+    def refund(self, amount: float):
+        """Give back (or, if negative, charge) units once the actual usage is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.balance = min(self.capacity, self.balance + amount)
+
+
+# Priority classes, highest first: a user waiting on a turn goes ahead of indexing and batch jobs
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+WAIT_WINDOW = 1000  # Recent wait times kept per priority for the percentiles
+
+_session = contextvars.ContextVar('rate_limit_session', default=None)
+_priority = contextvars.ContextVar('rate_limit_priority', default=INTERACTIVE)
+
+@contextmanager
+def client_context(session: Optional[str] = None, priority: Optional[int] = None):
+    """Attribute the OpenAI calls made inside the block to a session and priority class"""
+    tokens = [_session.set(session) if session is not None else None,
+              _priority.set(priority) if priority is not None else None]
+    try:
+        yield
+    finally:
+        for variable, token in zip((_session, _priority), tokens):
+            if token is not None:
+                variable.reset(token)
+
+def current_priority() -> int:
+    """Priority class of the calling context (INTERACTIVE unless set with client_context)"""
+    return _priority.get()
+
+
+class _Ticket:
+    __slots__ = ("tokens", "session", "priority", "enqueued")
+
+    def __init__(self, tokens: float, session: str, priority: int):
+        self.tokens = tokens
+        self.session = session
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+
+class FairScheduler:
+    """Process-wide admission control for rate-limited calls.
+
+    Callers queue per (priority, session). Whenever both buckets can cover
+    the call at the head of the queue, it is admitted. The head is taken from
+    the highest priority class with anything waiting, round-robin across its
+    sessions, so one long conversation or a bulk job cannot starve the rest.
+    Calls larger than a bucket's burst capacity are admitted once the bucket
+    is full and pay off the difference as debt.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._condition = threading.Condition()
+        # priority -> session -> waiting tickets; dict order is the round-robin order
+        self._queues: Dict[int, Dict[str, Deque[_Ticket]]] = {}
+        self._waits: Dict[int, Deque[float]] = {}
+        self._admitted: Counter = Counter()
+        self._max_depth = 0
+
+    def _enqueue(self, ticket: _Ticket):
+        sessions = self._queues.setdefault(ticket.priority, {})
+        sessions.setdefault(ticket.session, deque()).append(ticket)
+        self._max_depth = max(self._max_depth, self.depth)
+
+    def _remove(self, ticket: _Ticket):
+        sessions = self._queues[ticket.priority]
+        waiting = sessions.pop(ticket.session)
+        waiting.remove(ticket)
+        if waiting:
+            # The session goes to the back of the round-robin order
+            sessions[ticket.session] = waiting
+
+    def _head(self) -> Optional[_Ticket]:
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _try_admit(self, ticket: _Ticket) -> Optional[float]:
+        """0 if ticket was admitted, else seconds until it could be (None: not at the head)"""
+        if self._head() is not ticket:
+            return None
+        delay = max(self.requests.delay(1), self.tokens.delay(min(ticket.tokens, self.tokens.capacity)))
+        if delay > 0:
+            return delay
+        self.requests.reserve(1)
+        self.tokens.reserve(ticket.tokens)
+        self._remove(ticket)
+        self._admitted[ticket.priority] += 1
+        self._waits.setdefault(ticket.priority, deque(maxlen=WAIT_WINDOW)).append(time.monotonic() - ticket.enqueued)
+        self._condition.notify_all()
+        return 0.0
+
+    def _ticket(self, tokens: float, session: Optional[str], priority: Optional[int]) -> _Ticket:
+        return _Ticket(tokens, session if session is not None else (_session.get() or ""),
+                       priority if priority is not None else _priority.get())
+
+    def acquire(self, tokens: float, session: Optional[str] = None, priority: Optional[int] = None) -> float:
+        """Block until the call is admitted; returns the seconds spent queued.
+
+        session and priority default to those set with client_context().
+        """
+        ticket = self._ticket(tokens, session, priority)
+        with self._condition:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    delay = self._try_admit(ticket)
+                    if delay == 0:
+                        return time.monotonic() - ticket.enqueued
+                    self._condition.wait(delay)
+            except BaseException:
+                if ticket in self._queues[ticket.priority].get(ticket.session, ()):
+                    self._remove(ticket)
+                    self._condition.notify_all()
+                raise
+
+    async def aacquire(self, tokens: float, session: Optional[str] = None, priority: Optional[int] = None) -> float:
+        """acquire() for coroutines: polls instead of blocking the event loop"""
+        ticket = self._ticket(tokens, session, priority)
+        with self._condition:
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_admit(ticket)
+                if delay == 0:
+                    return time.monotonic() - ticket.enqueued
+                await asyncio.sleep(min(delay, ASYNC_POLL_SECONDS) if delay is not None else ASYNC_POLL_SECONDS)
+        except BaseException:
+            with self._condition:
+                if ticket in self._queues[ticket.priority].get(ticket.session, ()):
+                    self._remove(ticket)
+                    self._condition.notify_all()
+            raise
+
+    def set_limits(self, requests_per_minute: float, tokens_per_minute: float):
+        """Replace both budgets, e.g. when a job runs against a different quota"""
+        with self._condition:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+            self._condition.notify_all()
+
+    def settle(self, estimated_tokens: float, actual_tokens: float):
+        """Correct an admitted call's token estimate with its actual usage"""
+        self.tokens.refund(estimated_tokens - actual_tokens)
+        with self._condition:
+            self._condition.notify_all()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(waiting) for sessions in self._queues.values() for waiting in sessions.values())
+
+    def metrics(self) -> Dict:
+        """Queue depth and wait-time percentiles per priority, for capacity planning"""
+        with self._condition:
+            result = {"queue_depth": self.depth, "max_queue_depth": self._max_depth, "priorities": {}}
+            for priority, name in PRIORITY_NAMES.items():
+                sessions = self._queues.get(priority, {})
+                waits = sorted(self._waits.get(priority, ()))
+                def percentile(p):
+                    return waits[min(len(waits) - 1, int(len(waits) * p))] * 1000 if waits else 0.0
+                result["priorities"][name] = {
+                    "queued": sum(len(waiting) for waiting in sessions.values()),
+                    "sessions_waiting": len(sessions),
+                    "admitted": self._admitted[priority],
+                    "wait_p50_ms": percentile(0.50),
+                    "wait_p95_ms": percentile(0.95),
+                    "wait_max_ms": waits[-1] * 1000 if waits else 0.0,
+                }
+        return result
@@ -0,0 +1,14 @@
+import sys
+
+def use_pysqlite3():
+    """Serve `import sqlite3` from pysqlite3, whose SQLite is new enough for Chroma.
+
+    Call it just before importing Chroma or CrewAI. Where pysqlite3-binary is
+    not installed (it only ships Linux wheels), the standard library's sqlite3
+    is kept.
+    """
+    try:
+        import pysqlite3
+    except ImportError:
+        return
+    sys.modules['sqlite3'] = pysqlite3
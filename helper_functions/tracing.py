@@ -0,0 +1,240 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+from typing import Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Set TRACING_ENABLED=0 to turn every span into a shared no-op
+ENABLED = os.getenv('TRACING_ENABLED', '1') != '0'
+WINDOW = 1000          # Samples kept per stage for the rolling percentiles
+RECENT_TRACES = 100
+
+# USD per 1M tokens as (input, output)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    for name, (input_price, output_price) in MODEL_PRICES.items():
+        if model and model.startswith(name):
+            return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    return 0.0
+
+
+class RollingStats:
+    """Fixed-size window of recent samples for one stage"""
+
+    def __init__(self):
+        self.durations = deque(maxlen=WINDOW)
+        self.count = 0
+        self.tokens = 0
+        self.cost = 0.0
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self.durations)
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+        return {
+            "count": self.count,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "tokens": self.tokens,
+            "cost_usd": self.cost,
+        }
+
+
+_lock = threading.Lock()
+_stats: Dict[str, RollingStats] = {}
+_recent = deque(maxlen=RECENT_TRACES)
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def _record(name: str, duration: float, tokens: int = 0, cost: float = 0.0):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = RollingStats()
+        stats.durations.append(duration)
+        stats.count += 1
+        stats.tokens += tokens
+        stats.cost += cost
+
+
+class Span:
+    """Times one stage of a request; token usage reported inside it is attached to it"""
+
+    __slots__ = ("name", "attributes", "start", "duration", "prompt_tokens", "completion_tokens", "cost", "_token")
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_usage(self, model: str, prompt_tokens: int, completion_tokens: int = 0):
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += estimate_cost(model, prompt_tokens, completion_tokens)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        _finish(self)
+        return False
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled, so instrumented code pays one attribute lookup"""
+
+    def set(self, **attributes):
+        pass
+
+    def add_usage(self, model, prompt_tokens, completion_tokens=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    """All spans recorded while handling one user request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.id = uuid.uuid4().hex[:8]
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def tokens(self) -> int:
+        return sum(span.prompt_tokens + span.completion_tokens for span in self.spans)
+
+    @property
+    def cost(self) -> float:
+        return sum(span.cost for span in self.spans)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            "duration_ms": self.duration * 1000,
+            "tokens": self.tokens,
+            "cost_usd": self.cost,
+            "spans": [
+                {"name": span.name, "duration_ms": span.duration * 1000,
+                 "prompt_tokens": span.prompt_tokens, "completion_tokens": span.completion_tokens,
+                 **span.attributes}
+                for span in self.spans
+            ],
+        }
+
+def _finish(span: Span):
+    _record(span.name, span.duration, span.prompt_tokens + span.completion_tokens, span.cost)
+    current = _current_trace.get()
+    if current is not None:
+        current.add(span)
+
+def span(name: str, **attributes):
+    """Context manager timing one stage of the current request"""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attributes)
+
+def record_span(name: str, duration: float, model: Optional[str] = None, prompt_tokens: int = 0, completion_tokens: int = 0, **attributes):
+    """Record a stage that was timed elsewhere, e.g. a generator consumed by the UI"""
+    if not ENABLED:
+        return
+    finished = Span(name, attributes)
+    finished.duration = duration
+    if model:
+        finished.add_usage(model, prompt_tokens, completion_tokens)
+    _finish(finished)
+
+def record_usage(model: str, prompt_tokens: int, completion_tokens: int = 0):
+    """Attach token usage to the innermost open span"""
+    current = _current_span.get()
+    if current is not None:
+        current.add_usage(model, prompt_tokens, completion_tokens)
+
+
+@contextmanager
+def trace(name: str):
+    """Group the spans of one request into a Trace, yielded (None when disabled)"""
+    if not ENABLED:
+        yield None
+        return
+    current = Trace(name)
+    token = _current_trace.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_trace.reset(token)
+        _record(name, current.duration, current.tokens, current.cost)
+        with _lock:
+            _recent.append(current)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Feeds token usage reported by LangChain chat models into the current span"""
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        model = (response.llm_output or {}).get("model_name", "")
+        if not usage:
+            # Streaming responses carry usage on the final message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if metadata:
+                        usage = {"prompt_tokens": metadata.get("input_tokens", 0),
+                                 "completion_tokens": metadata.get("output_tokens", 0)}
+                    model = model or (generation.generation_info or {}).get("model_name", "")
+        if usage:
+            record_usage(model or "gpt-4o-mini", usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+def snapshot() -> Dict[str, Dict]:
+    """Rolling per-stage aggregates"""
+    with _lock:
+        return {name: stats.snapshot() for name, stats in sorted(_stats.items())}
+
+def recent_traces() -> List[Dict]:
+    with _lock:
+        traces = list(_recent)
+    return [current.to_dict() for current in reversed(traces)]
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _recent.clear()
@@ -1,39 +1,34 @@
+import uuid
 import streamlit as st
 
 if not st.session_state.authenticated:
     st.info('Please Login from the Home page and try again.')
     st.stop()
 
-from utils.vector_store import initialize_vectorstore
-from utils.intent_classifier import create_intent_classification_crew
-from utils.chat_chain import create_chat_chain
+from utils import warmup
+from utils.chat_session import ChatHistory
 
-# Initialize session states
+# Normally already running since Home.py; this covers opening the page directly
+warmup.start()
+
+# Initialize session states; only the chat history is kept per session, as
+# compact turns that cite their sources by chunk ID
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
-if 'vector_store' not in st.session_state:
-    st.session_state.vector_store = None
+    st.session_state.chat_history = ChatHistory()
+# Identifies this session to the shared OpenAI rate-limit scheduler
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 st.title("Chat Assistant 💬")
 
 # Button to clear chat history
 if st.button("Clear Chat History"):
-    st.session_state.chat_history = []
+    st.session_state.chat_history.clear()
+    if 'context_window' in st.session_state:
+        st.session_state.context_window.clear()
     st.session_state.user_question = ""
 
 
-# Initialize vectorstore if not already done
-if st.session_state.vector_store is None:
-    with st.spinner("Initializing knowledge base..."):
-        st.session_state.vector_store = initialize_vectorstore()
-        retriever = st.session_state.vector_store.as_retriever()
-        test_query = "test query about ENG related CET courses"  # Adjust based on typical queries
-        retrieved_docs = retriever.get_relevant_documents(test_query)
-        st.write(f"Number of documents retrieved for test query: {len(retrieved_docs)}")
-
-# Initialize intent classifier
-classify_intent = create_intent_classification_crew()
-
 # Chat interface
 st.subheader("Ask me anything about CET courses or industry partnerships!")
 
@@ -52,32 +47,89 @@ user_question = st.session_state.user_question
 # User input
 #user_question = st.text_input("Your question:")
 
+# Display chat history
+for turn in st.session_state.chat_history:
+    st.write("🙋 You:", turn.question)
+    st.write("🤖 Assistant:", turn.answer)
+    # Sources are fetched from the shared store only when asked for
+    if turn.chunk_ids and st.toggle(f"Show sources ({len(turn.chunk_ids)})", key=f"sources_{turn.id}"):
+        from utils.knowledge_base import get_documents
+        for document in get_documents(turn.chunk_ids):
+            st.caption(f"{document.metadata.get('title') or document.metadata.get('source')} · {document.metadata.get('url', '')}")
+    st.write("---")
+
 if user_question:
-    # Classify user intent
-    with st.spinner("Analyzing your question..."):
-        user_type = classify_intent(user_question)
-        if user_type == 'adult_learner':
-            query_type = 'CET Course Query'
-        elif user_type == 'industrial_partner':
-            query_type = 'Industry Partnership Query'
+    # The pipeline is only imported once there is a question, so the page is
+    # interactive without waiting for the warm-up
+    with st.spinner("Initializing knowledge base..."):
+        if not warmup.wait() and warmup.running():
+            # The question is kept, so it is answered on a later rerun once the warm-up is done
+            st.warning("The knowledge base is still being prepared (e.g. a first index build). Please try again in a minute.")
+            st.stop()
+        from utils.knowledge_base import (
+            get_intent_classifier, get_semantic_cache,
+            get_partitioned_retrievers, get_contextualize_chain, get_answer_chain
+        )
+        from utils.chat_chain import pre_retrieve, stream_answer
+        from utils.context_window import ContextWindow
+        from helper_functions import tracing, rate_limit
+
+        # The knowledge base, chains and intent classifier are shared by all sessions;
+        # if the warm-up failed, they are built here
+        get_partitioned_retrievers()
+        classify_intent = get_intent_classifier()
+
+    if 'context_window' not in st.session_state:
+        st.session_state.context_window = ContextWindow()
+
+    # Every stage of this turn is timed and attributed to one trace, and its
+    # OpenAI calls are queued fairly against other sessions' as interactive work
+    with tracing.trace("assistant.turn"), \
+            rate_limit.client_context(session=st.session_state.session_id, priority=rate_limit.INTERACTIVE):
+        # Classify intent while rewriting the question, then answer near-identical
+        # standalone questions from the shared cache or search that audience's partition
+        semantic_cache = get_semantic_cache()
+        with st.spinner("Analyzing your question..."):
+            # Only as much recent history as fits the per-turn token budget goes to the model
+            context_window = st.session_state.context_window
+            prepared = pre_retrieve(
+                user_question,
+                context_window.select_history(user_question),
+                classify_intent,
+                get_contextualize_chain(),
+                get_partitioned_retrievers(),
+                cache=semantic_cache
+            )
+            user_type = prepared["user_type"]
+            standalone_question = prepared["standalone_question"]
+            if user_type == 'adult_learner':
+                query_type = 'CET Course Query'
+            elif user_type == 'industrial_partner':
+                query_type = 'Industry Partnership Query'
+            else:
+                query_type = 'General Query'
+            st.info(f"Query classified as: {query_type}")
+
+        st.write("🙋 You:", user_question)
+        st.write("🤖 Assistant:")
+
+        cached = prepared["cached"]
+        if cached is not None:
+            answer, sources = cached.answer, cached.source_documents
+            st.write(answer)
+            st.caption("Answered from cache")
         else:
-            query_type = 'General Query'
-        st.info(f"Query classified as: {query_type}")
-    
-    chain = create_chat_chain(st.session_state.vector_store, user_type)
-    
-    with st.spinner("Generating response..."):
-        response = chain.invoke({
-            "input": user_question,
-            "chat_history": st.session_state.chat_history
-        })
-        
-        st.session_state.chat_history.append((user_question, response["answer"], response.get('context', [])))
-
-    st.session_state.user_question = ""
-
-# Display chat history
-for question, answer , source in st.session_state.chat_history:
-    st.write("🙋 You:", question)
-    st.write("🤖 Assistant:", answer)
-    st.write("---")
\ No newline at end of file
+            # The prompt's token split and the first-token latency are on the Admin Metrics page
+            with tracing.span("context.fit") as span:
+                documents = context_window.fit_documents(prepared["documents"])
+                span.set(**{f"{part}_tokens": tokens for part, tokens in context_window.usage.items()})
+            # Render tokens as they arrive instead of waiting for the whole answer
+            stream = stream_answer(get_answer_chain(user_type), standalone_question, documents)
+            st.write_stream(stream)
+            answer, sources = stream.answer, stream.source_documents
+            semantic_cache.store(user_type, standalone_question, answer, sources, stream.total_time)
+        st.write("---")
+
+        st.session_state.chat_history.add_turn(user_question, answer, sources)
+        context_window.add_turn(user_question, answer)
+        st.session_state.user_question = ""
@@ -0,0 +1,116 @@
+import streamlit as st
+from datetime import datetime
+
+if not st.session_state.authenticated:
+    st.info('Please Login from the Home page and try again.')
+    st.stop()
+
+from helper_functions import tracing
+from helper_functions import embeddings
+from helper_functions import llm
+from utils import warmup
+from utils import chat_session
+from utils import knowledge_base
+from utils import index_versions
+from utils.knowledge_base import get_intent_classifier, get_semantic_cache
+
+st.title("Admin Metrics 📈")
+
+if st.button("Reset metrics"):
+    tracing.reset()
+
+if not tracing.ENABLED:
+    st.warning("Tracing is disabled (TRACING_ENABLED=0).")
+
+warmup_seconds = f" in {warmup.status['seconds']:.1f}s" if warmup.status["seconds"] is not None else ""
+st.caption(f"Pipeline warm-up: {warmup.status['state']}{warmup_seconds}")
+if warmup.status["error"]:
+    st.warning(f"Warm-up failed: {warmup.status['error']}")
+
+# Index versions are built and validated in the background, then swapped in for every session
+st.subheader("Knowledge base index")
+col1, col2 = st.columns(2)
+if col1.button("Rebuild index"):
+    knowledge_base.rebuild_index()
+if col2.button("Roll back to previous version"):
+    try:
+        st.success(f"Now serving index version {knowledge_base.rollback_index()}")
+    except ValueError as e:
+        st.warning(str(e))
+rebuild = knowledge_base.rebuild_status
+rebuild_seconds = f" in {rebuild['seconds']:.1f}s" if rebuild["seconds"] is not None and rebuild["state"] != "running" else ""
+st.caption(f"Serving index version {knowledge_base.get_index_version()} · last rebuild: {rebuild['state']}{rebuild_seconds}")
+if rebuild["error"]:
+    st.warning(f"Rebuild failed, previous version still serving: {rebuild['error']}")
+# Dense searches from all sessions are micro-batched, locally or by a shared service
+service = knowledge_base.get_retrieval_service()
+if service is not None:
+    where = f"service at {service.url}" if hasattr(service, "url") else "in process"
+    st.caption(f"Batched retrieval ({where}): " + " · ".join(f"{name.replace('_', ' ')} {value}" for name, value in service.stats.items()))
+st.dataframe(
+    [{**version, "created": datetime.fromtimestamp(version["created"]).isoformat(timespec='seconds')}
+     for version in reversed(index_versions.list_versions(knowledge_base.PERSIST_DIRECTORY))],
+    use_container_width=True
+)
+
+# Rolling latency percentiles, token counts and estimated cost per pipeline stage
+st.subheader("Pipeline stages")
+stages = tracing.snapshot()
+if stages:
+    st.dataframe(
+        [{"stage": name, **stats} for name, stats in stages.items()],
+        use_container_width=True
+    )
+else:
+    st.write("No requests traced yet.")
+# Streamed answers: what users wait for before text appears, and what their prompts held
+first_token = stages.get("chain.first_token")
+if first_token:
+    col1, col2 = st.columns(2)
+    col1.metric("Time to first token (p50)", f"{first_token['p50_ms'] / 1000:.2f}s")
+    col2.metric("Time to first token (p95)", f"{first_token['p95_ms'] / 1000:.2f}s")
+st.caption("Each turn's prompt tokens by history, context and question are on its context.fit span under Recent requests.")
+
+st.subheader("Caches and classifier")
+cache_metrics = get_semantic_cache().metrics
+classifier = get_intent_classifier()
+col1, col2, col3 = st.columns(3)
+col1.metric("Semantic cache hit rate", f"{cache_metrics['hit_rate']:.0%}")
+col2.metric("Intent LLM fallback rate", f"{classifier.fallback_rate:.0%}")
+col3.metric("Embedding cache hits", embeddings.stats["cache_hits"])
+
+# Calls made directly through helper_functions.llm (LangChain models retry inside the SDK)
+st.subheader("OpenAI requests")
+col1, col2, col3 = st.columns(3)
+col1.metric("Upstream requests", llm.stats["requests"])
+col2.metric("Coalesced duplicates", llm.stats["coalesced"])
+col3.metric("Retries", llm.stats["retries"])
+
+# Every OpenAI call waits in the shared scheduler for the account's RPM/TPM quota
+queue = llm.scheduler.metrics()
+st.caption(
+    f"Rate-limit queue: {queue['queue_depth']} waiting now, {queue['max_queue_depth']} at most · "
+    f"limits {llm.REQUESTS_PER_MINUTE:.0f} RPM, {llm.TOKENS_PER_MINUTE:.0f} TPM"
+)
+st.dataframe(
+    [{"priority": name, **metrics} for name, metrics in queue["priorities"].items()],
+    use_container_width=True
+)
+
+# Display histories of every live session; documents are only referenced by chunk ID
+st.subheader("Chat sessions")
+sessions = chat_session.memory_stats()
+col1, col2, col3 = st.columns(3)
+col1.metric("Live sessions", sessions["sessions"])
+col2.metric("Turns kept", sessions["turns"])
+col3.metric("Session memory", f"{sessions['bytes'] / 1024:.1f} KiB")
+
+# Per-request breakdown to see which stage dominates a slow turn
+st.subheader("Recent requests")
+for request in tracing.recent_traces():
+    label = (
+        f"{request['started_at']} · {request['name']} · {request['duration_ms']:.0f} ms · "
+        f"{request['tokens']} tokens · ${request['cost_usd']:.5f}"
+    )
+    with st.expander(label):
+        st.dataframe(request["spans"], use_container_width=True)
@@ -0,0 +1,15 @@
+import pytest
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    """knowledge_base over a fresh index in tmp_path, with every OpenAI call faked"""
+    from helper_functions import llm
+    from benchmarks.run_benchmarks import fake_openai
+    from utils import knowledge_base
+    # tiktoken downloads its encoding on first use
+    monkeypatch.setattr(llm, "count_tokens", lambda text: len(text) // 4)
+    monkeypatch.setattr(knowledge_base, "PERSIST_DIRECTORY", str(tmp_path / "index"))
+    knowledge_base.reset()
+    with fake_openai(0.0, 0.0, str(tmp_path / "embeddings.sqlite3")):
+        yield knowledge_base
+    knowledge_base.reset()
@@ -0,0 +1,74 @@
+import json
+import time
+import httpx
+from helper_functions import llm, rate_limit
+from utils import batch_qa
+
+def scheduled_client(scheduler):
+    """A client on the same transport stack as llm.http_client, answering locally"""
+    def handler(request):
+        return httpx.Response(200, json={"data": [], "usage": {"total_tokens": 20}})
+    return httpx.Client(transport=llm.ScheduledTransport(httpx.MockTransport(handler), scheduler))
+
+def admission_times(client, count):
+    start = time.monotonic()
+    times = []
+    for _ in range(count):
+        # Pre-tokenized embedding input: 20 tokens, no tokenizer needed
+        client.post("https://api.openai.com/v1/embeddings", json={"input": [[1] * 20], "model": "m"})
+        times.append(time.monotonic() - start)
+    return times
+
+def test_request_quota_delays_calls_past_the_burst():
+    # 120 RPM: a burst of 20, then one request every half second
+    client = scheduled_client(rate_limit.FairScheduler(120, 10 ** 9))
+    times = admission_times(client, 22)
+    assert times[19] < 0.3
+    assert 0.3 < times[20] < 0.8
+    assert 0.8 < times[21] < 1.3
+
+def test_token_quota_delays_calls_past_the_burst():
+    # 6000 TPM: a burst of 1000 tokens (50 calls of 20), then 100 tokens a second
+    client = scheduled_client(rate_limit.FairScheduler(10 ** 6, 6000))
+    times = admission_times(client, 55)
+    assert times[49] < 0.3
+    assert 0.8 < times[54] < 1.5
+
+def run_batch(knowledge_base, tmp_path, monkeypatch, *flags, existing=None):
+    monkeypatch.setattr(batch_qa, "PERSIST_DIRECTORY", knowledge_base.PERSIST_DIRECTORY)
+    # main() replaces the shared buckets; put the originals back afterwards
+    monkeypatch.setattr(llm.scheduler, "requests", llm.scheduler.requests)
+    monkeypatch.setattr(llm.scheduler, "tokens", llm.scheduler.tokens)
+    questions, answers = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    questions.write_text(''.join(json.dumps({"id": id, "question": "What are the data analytics course fees?"}) + "\n"
+                                 for id in ("1", "2")))
+    if existing is not None:
+        answers.write_text(existing)
+    code = batch_qa.main([str(questions), str(answers), *flags])
+    return code, [json.loads(line) for line in answers.read_text().splitlines()]
+
+def test_rate_flags_configure_the_scheduler_behind_the_shared_client(knowledge_base, tmp_path, monkeypatch):
+    code, results = run_batch(knowledge_base, tmp_path, monkeypatch, "--rpm", "120", "--tpm", "6000")
+    assert code == 0
+    # Every OpenAI call goes through the transport bound to llm.scheduler
+    assert llm.http_client._transport.scheduler is llm.scheduler
+    assert llm.scheduler.requests.rate == 2
+    assert llm.scheduler.tokens.rate == 100
+    assert all(result["answer"] for result in results)
+
+def test_resume_keeps_one_answer_per_question(knowledge_base, tmp_path, monkeypatch):
+    existing = (json.dumps({"id": "1", "question": "q", "answer": "earlier answer"}) + "\n"
+                + json.dumps({"id": "2", "question": "q", "error": "RateLimitError: slow down"}) + "\n"
+                + '{"id": "2", "ans')
+    code, results = run_batch(knowledge_base, tmp_path, monkeypatch, existing=existing)
+    assert code == 0
+    assert sorted(result["id"] for result in results) == ["1", "2"]
+    assert not any("error" in result for result in results)
+    assert next(result for result in results if result["id"] == "1")["answer"] == "earlier answer"
+
+def test_no_resume_starts_a_new_output(knowledge_base, tmp_path, monkeypatch):
+    existing = json.dumps({"id": "1", "question": "q", "answer": "earlier answer"}) + "\n"
+    code, results = run_batch(knowledge_base, tmp_path, monkeypatch, "--no-resume", existing=existing)
+    assert code == 0
+    assert sorted(result["id"] for result in results) == ["1", "2"]
+    assert all(result["answer"] != "earlier answer" for result in results)
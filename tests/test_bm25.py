@@ -0,0 +1,71 @@
+from typing import List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.bm25 import BM25Index, HybridRetriever, contains_term, exact_terms
+
+TEXTS = [
+    "Data Analytics course TGS-2021008563. Course fee $1,400 for the 2024 intake.",
+    "Level 2 Python programming for adults aged 40 and above.",
+    "Industry partnerships: co-develop projects with our students.",
+]
+
+class DenseStub(BaseRetriever):
+    calls: List[str] = []
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.calls.append(query)
+        return [Document(page_content=TEXTS[2], metadata={"chunk_id": "c2"})]
+
+def hybrid():
+    index = BM25Index.build(["c0", "c1", "c2"], TEXTS, [{"chunk_id": f"c{i}"} for i in range(3)])
+    return HybridRetriever(dense_retriever=DenseStub(calls=[]), lexical_index=index, k=2)
+
+def test_exact_terms_are_codes_and_quoted_phrases_only():
+    assert exact_terms('fees for "data analytics" TGS-2021008563') == ["data analytics", "tgs-2021008563"]
+    assert exact_terms("courses for people aged 40") == []
+    assert exact_terms("Level 2 fees $1,400") == []
+
+def test_terms_match_whole_tokens():
+    assert contains_term(TEXTS[0], "tgs-2021008563")
+    assert not contains_term(TEXTS[0], "tgs-2021")
+    assert not contains_term(TEXTS[0], "40")
+    assert contains_term(TEXTS[1], "level 2")
+
+def test_code_queries_skip_dense_search():
+    retriever = hybrid()
+    documents = retriever.invoke("What is TGS-2021008563?")
+    assert documents[0].metadata["chunk_id"] == "c0"
+    assert retriever.dense_retriever.calls == []
+
+def test_numbers_inside_other_numbers_do_not_skip_dense_search():
+    retriever = hybrid()
+    retriever.invoke("courses for people aged 40")
+    retriever.invoke("Level 2 fees")
+    assert len(retriever.dense_retriever.calls) == 2
+
+def test_empty_index_returns_nothing():
+    assert BM25Index.build([], [], []).search("data analytics") == []
+
+def test_rarer_terms_and_higher_frequency_score_higher():
+    index = BM25Index.build(
+        ["a", "b", "c"],
+        ["python course python", "python course", "course fees"],
+        [{"audience": "adult_learner"}, {"audience": "employer"}, {"audience": "adult_learner"}],
+    )
+    # 'python' is in two chunks and 'course' in all three, so 'python' decides the order
+    assert [index.ids[position] for position, _ in index.search("python course", k=3)] == ["a", "b", "c"]
+    assert [index.ids[position] for position, _ in index.search("fees python")][0] == "c"
+    assert [index.ids[position] for position, _ in index.search("python", audiences=["employer"])] == ["b"]
+
+def test_saved_index_scores_the_same(tmp_path):
+    index = BM25Index.build(["c0", "c1", "c2"], TEXTS, [{"chunk_id": f"c{i}"} for i in range(3)])
+    index.save(str(tmp_path))
+    assert BM25Index.load(str(tmp_path)).search("python course fee") == index.search("python course fee")
+
+def test_fusion_ranks_chunks_found_by_both_searches_first():
+    retriever = hybrid()
+    # BM25 ranks c1 then c2; the dense stub returns only c2, so c2 gains a second vote
+    lexical = [retriever.lexical_index.ids[position] for position, _ in retriever.lexical_index.search("students python adults")]
+    assert lexical[:2] == ["c1", "c2"]
+    documents = retriever.invoke("students python adults")
+    assert [document.metadata["chunk_id"] for document in documents] == ["c2", "c1"]
@@ -0,0 +1,53 @@
+import time
+import asyncio
+from utils.chat_chain import pre_retrieve
+from utils.semantic_cache import SemanticCache
+
+class _CountingRetriever:
+    def __init__(self):
+        self.queries = []
+
+    async def ainvoke(self, query):
+        self.queries.append(query)
+        return []
+
+def test_a_cache_hit_skips_retrieval(knowledge_base):
+    cache = SemanticCache()
+    question = "What are the data analytics course fees?"
+    cache.store("general question", question, "They are listed on the course page.", [], 1.0)
+    retriever = _CountingRetriever()
+
+    prepared = pre_retrieve(question, [], lambda q: "general question", None, {"general question": retriever}, cache=cache)
+    assert prepared["cached"].answer == "They are listed on the course page."
+    assert retriever.queries == []
+
+    prepared = pre_retrieve("How do I apply for an industry partnership?", [], lambda q: "general question", None,
+                            retriever, cache=cache)
+    assert prepared["cached"] is None
+    assert retriever.queries == ["How do I apply for an industry partnership?"]
+
+class _SlowRetriever(_CountingRetriever):
+    async def ainvoke(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(0.3)
+        return [query]
+
+def slow_classifier(label):
+    def classify(question):
+        time.sleep(0.3)
+        return label
+    return classify
+
+def test_retrieval_overlaps_a_slow_classifier():
+    retrievers = {"general question": _SlowRetriever(), "adult_learner": _SlowRetriever()}
+    start = time.perf_counter()
+    prepared = pre_retrieve("Any open house this year?", [], slow_classifier("general question"), None, retrievers)
+    assert time.perf_counter() - start < 0.55
+    assert prepared["documents"] == ["Any open house this year?"]
+    assert retrievers["adult_learner"].queries == []
+
+def test_a_speculative_search_is_replaced_when_the_label_differs():
+    retrievers = {"general question": _SlowRetriever(), "adult_learner": _SlowRetriever()}
+    prepared = pre_retrieve("Data analytics fees?", [], slow_classifier("adult_learner"), None, retrievers)
+    assert prepared["user_type"] == "adult_learner"
+    assert retrievers["general question"].queries == retrievers["adult_learner"].queries == ["Data analytics fees?"]
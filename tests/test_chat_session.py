@@ -0,0 +1,19 @@
+from langchain_core.documents import Document
+from utils.chat_session import ChatHistory
+
+def test_turn_ids_survive_older_turns_dropping_out():
+    history = ChatHistory(max_turns=2)
+    first = history.add_turn("q1", "a1").id
+    second = history.add_turn("q2", "a2").id
+    history.add_turn("q3", "a3")
+    assert [turn.question for turn in history] == ["q2", "q3"]
+    assert next(iter(history)).id == second != first
+
+def test_turns_cite_only_real_chunk_ids():
+    documents = [
+        Document(page_content="fees", metadata={"chunk_id": "data/cet_courses/a.json#0", "source": "a.json", "sentence_score": 0.5}),
+        Document(page_content="no id", metadata={"source": "b.json", "sentence_score": 0.9}),
+    ]
+    turn = ChatHistory().add_turn("q", "a", documents)
+    assert turn.chunk_ids == ("data/cet_courses/a.json#0",)
+    assert list(turn.scores) == [0.5]
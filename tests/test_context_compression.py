@@ -0,0 +1,59 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from helper_functions import llm
+from utils.context_compression import ContextCompressor, mmr_select
+
+# Two near-identical chunks and one about something else
+VECTORS = [[1.0, 0.0], [0.99, 0.1], [0.0, 1.0]]
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(llm, "count_tokens", lambda text: len(text.split()))
+
+def test_mmr_skips_a_near_duplicate_of_the_top_result():
+    assert mmr_select([1.0, 0.9, 0.5], VECTORS, k=2) == [0, 2]
+
+def test_mmr_with_lambda_one_ranks_by_relevance_alone():
+    assert mmr_select([1.0, 0.9, 0.5], VECTORS, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+def test_mmr_handles_empty_input_and_large_k():
+    assert mmr_select([], [], k=3) == []
+    assert sorted(mmr_select([1.0, 0.9, 0.5], VECTORS, k=10)) == [0, 1, 2]
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return VECTORS[:len(texts)]
+
+    def embed_query(self, text):
+        return VECTORS[0]
+
+def test_diversify_keeps_k_of_the_retrieved_chunks():
+    documents = [Document(page_content=f"chunk {i}") for i in range(3)]
+    compressor = ContextCompressor(embeddings=FixedEmbeddings(), k=2)
+    assert [document.page_content for document in compressor.diversify(documents, "fees")] == ["chunk 0", "chunk 2"]
+
+def test_extract_keeps_relevant_sentences_once_and_in_order():
+    documents = [
+        Document(page_content="The campus is in Tampines. The course fee is $500. Parking is free.", metadata={"chunk_id": "a"}),
+        # Overlapping chunks repeat sentences; each is kept once
+        Document(page_content="Parking is free. Fee subsidies apply to citizens.", metadata={"chunk_id": "b"}),
+    ]
+    compressed = ContextCompressor(embeddings=FixedEmbeddings()).extract(documents, "course fee subsidies")
+    assert [document.page_content for document in compressed] == ["The course fee is $500.", "Fee subsidies apply to citizens."]
+    assert [document.metadata["chunk_id"] for document in compressed] == ["a", "b"]
+
+def test_extract_stays_within_the_token_budget():
+    documents = [Document(page_content=f"Course fee {i} is listed here. More about fee {i} and the course.")
+                 for i in range(10)]
+    compressed = ContextCompressor(embeddings=FixedEmbeddings(), max_tokens=20).extract(documents, "course fee")
+    assert sum(len(document.page_content.split()) for document in compressed) <= 20
+
+def test_extract_records_the_best_kept_sentence_score():
+    documents = [Document(page_content="Parking is free. The course fee is $500."),
+                 Document(page_content="The campus is in Tampines.")]
+    compressed = ContextCompressor(embeddings=FixedEmbeddings()).extract(documents, "course fee")
+    assert compressed[0].metadata["sentence_score"] > 0
+    # A chunk matching no query term keeps its lead sentence with a zero score
+    assert compressed[1].metadata["sentence_score"] == 0
+    assert "relevance_score" not in compressed[0].metadata
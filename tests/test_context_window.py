@@ -0,0 +1,48 @@
+import pytest
+from langchain_core.documents import Document
+from helper_functions import llm
+from utils.context_window import ContextWindow
+
+QUESTION = "what are the course fees"  # 5 tokens
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word keeps the arithmetic readable
+    monkeypatch.setattr(llm, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(llm, "get_completion", lambda prompt: "earlier turns summarised")
+
+def add_turns(window, count):
+    # "Human: ..." plus "Assistant: ..." with 8 words each: 18 tokens a turn
+    for i in range(count):
+        window.add_turn(f"question{i} " + "q " * 7, f"answer{i} " + "a " * 7)
+
+def test_history_keeps_the_newest_turns_that_fit():
+    window = ContextWindow(max_prompt_tokens=100, context_budget=50)
+    add_turns(window, 5)
+    # 100 - 50 - 5 leaves 45 tokens: two turns of 18
+    history = window.select_history(QUESTION)
+    assert [question.split()[0] for question, _ in history] == ["question3", "question4"]
+    assert window.usage == {"question": 5, "history": 36, "context": 0}
+
+def test_documents_fill_the_remaining_budget_best_first():
+    window = ContextWindow(max_prompt_tokens=100, context_budget=50)
+    add_turns(window, 5)
+    window.select_history(QUESTION)
+    documents = [Document(page_content=f"chunk{i} " + "word " * 19) for i in range(3)]
+    assert window.fit_documents(documents) == documents[:2]
+    assert window.usage["context"] == 40
+    assert window.tokens_used == 81 <= window.max_prompt_tokens
+
+def test_older_turns_are_folded_into_a_summary():
+    window = ContextWindow(max_prompt_tokens=100, context_budget=50, summarize=True)
+    add_turns(window, 5)
+    history = window.select_history(QUESTION)
+    assert history[0] == ("(Summary of the earlier conversation)", "earlier turns summarised")
+    # The 3-token summary leaves room for two turns
+    assert [question.split()[0] for question, _ in history[1:]] == ["question3", "question4"]
+    assert window.usage["history"] == 36 + 3
+
+def test_turns_beyond_max_turns_are_forgotten():
+    window = ContextWindow(max_turns=3)
+    add_turns(window, 5)
+    assert [question.split()[0] for question, _, _ in window.turns] == ["question2", "question3", "question4"]
@@ -0,0 +1,35 @@
+from utils.dedup import BoilerplateFilter, NearDuplicateFilter
+
+COOKIES = "We use cookies to improve your experience."
+PAGE = ("The Diploma in Data Analytics runs over three years and covers statistics, programming, "
+        "machine learning and data visualisation, with an industry project in the final year.")
+
+def test_sentences_repeated_across_pages_are_stripped():
+    pages = [{"text": f"Page {i} is about course {i}. {COOKIES}"} for i in range(5)]
+    boilerplate = BoilerplateFilter().fit(pages)
+    text, removed = boilerplate.strip(pages[0]["text"])
+    assert text == "Page 0 is about course 0."
+    assert removed == [COOKIES]
+
+def test_sentences_on_too_few_pages_are_kept():
+    pages = [{"text": f"Page {i}. {COOKIES}"} for i in range(2)] + [{"text": f"Page {i}."} for i in range(2, 40)]
+    # Two pages is below both the minimum count and 10% of the corpus
+    assert BoilerplateFilter().fit(pages).strip(pages[0]["text"]) == (f"Page 0. {COOKIES}", [])
+
+def test_near_duplicates_are_detected_within_a_partition():
+    duplicates = NearDuplicateFilter()
+    assert duplicates.check("a", PAGE) is None
+    assert duplicates.check("b", PAGE + " Apply now.") == "a"
+    # The same text for another audience is not a duplicate
+    assert duplicates.check("c", PAGE, partition="employer") is None
+
+def test_different_chunks_are_kept():
+    duplicates = NearDuplicateFilter()
+    assert duplicates.check("a", PAGE) is None
+    # Half the words changed leaves the shingle overlap far below the threshold
+    words = PAGE.split()
+    rewritten = ' '.join(word if i % 2 else word.upper() + "s" for i, word in enumerate(words))
+    assert duplicates.check("b", rewritten) is None
+    other = ("Employers can partner with the school on internships, capstone projects and "
+             "customised training for their staff, funded under SkillsFuture schemes.")
+    assert duplicates.check("c", other) is None
@@ -0,0 +1,28 @@
+import sqlite3
+from helper_functions import embeddings
+from helper_functions.embeddings import CachedOpenAIEmbeddings, EmbeddingCache, MemoryEmbeddingCache
+
+def stored(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+def test_queries_are_cached_in_memory_only(knowledge_base, tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "_query_cache", MemoryEmbeddingCache(max_entries=2))
+    path = str(tmp_path / "embeddings.sqlite3")
+    model = CachedOpenAIEmbeddings()
+    before = stored(path)
+
+    first = model.embed_query("How much is the data analytics course?")
+    model.embed_queries(["Who do I contact about partnerships?", "Are there SkillsFuture subsidies?"])
+    assert stored(path) == before
+    assert len(embeddings._query_cache._entries) == 2
+
+    model.embed_documents(["A chunk of course text."])
+    assert stored(path) == before + 1
+    assert model.embed_query("How much is the data analytics course?") == first
+
+def test_disk_cache_drops_the_oldest_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "bounded.sqlite3"), max_entries=3)
+    for key in "abcde":
+        cache.put_many("model", {key: [1.0, 2.0]})
+    assert sorted(cache.get_many("model", list("abcde"))) == ["c", "d", "e"]
@@ -0,0 +1,78 @@
+import json
+import time
+from pathlib import Path
+import pytest
+from utils import index_versions
+from utils.vector_store import IngestProgress
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_rebuild_only_writes_changed_chunks(knowledge_base, tmp_path, backend):
+    root = str(tmp_path / backend)
+    first = index_versions.build(root, backend=backend)
+    progress = IngestProgress()
+    second = index_versions.build(root, progress=progress, backend=backend)
+
+    assert progress.changes["added"] == progress.changes["updated"] == progress.changes["deleted"] == 0
+    assert progress.changes["unchanged"] == index_versions.read_version(root, first)["chunks"]
+    assert index_versions.read_version(root, second)["seeded_from"] == first
+    assert index_versions.current_version(root) == second
+    # The version it was copied from is untouched and can still be rolled back to
+    assert index_versions.count_chunks(index_versions.open_version(root, first)) == progress.chunks
+
+def test_a_version_that_fails_to_open_is_not_retried(knowledge_base, monkeypatch):
+    from utils.bm25 import BM25_FILENAME
+    root = knowledge_base.PERSIST_DIRECTORY
+    serving = knowledge_base.get_index_version()
+    broken = index_versions.build(root)
+    (Path(index_versions.version_directory(root, broken)) / BM25_FILENAME).write_text("{")
+
+    opened = []
+    open_index = knowledge_base._open_index
+    monkeypatch.setattr(knowledge_base, "_open_index", lambda version: opened.append(version) or open_index(version))
+    monkeypatch.setattr(knowledge_base, "VERSION_CHECK_SECONDS", 0)
+    for _ in range(5):
+        knowledge_base._get_index()
+        time.sleep(0.05)
+
+    assert opened == [broken]
+    assert knowledge_base.get_index_version() == serving
+
+def test_a_damaged_active_version_is_replaced_by_a_rebuild(knowledge_base):
+    from utils.bm25 import BM25_FILENAME
+    root = knowledge_base.PERSIST_DIRECTORY
+    good = knowledge_base.get_index_version()
+    broken = index_versions.build(root)
+    (Path(index_versions.version_directory(root, broken)) / BM25_FILENAME).write_text("{")
+    knowledge_base.reset()
+
+    # The previous version serves while the replacement builds from it, not from the damaged copy
+    assert knowledge_base.get_index_version() == good
+    knowledge_base.rebuild_index().join()
+    assert knowledge_base.rebuild_status["state"] == "done", knowledge_base.rebuild_status["error"]
+    replacement = index_versions.current_version(root)
+    assert replacement not in (good, broken)
+    assert index_versions.read_version(root, replacement)["seeded_from"] == good
+    assert knowledge_base.get_index_version() == replacement
+
+def test_seeded_builds_rewrite_the_bm25_index(knowledge_base, tmp_path):
+    from utils.bm25 import BM25_FILENAME
+    root = str(tmp_path / "seeded")
+    first = index_versions.build(root)
+    (Path(index_versions.version_directory(root, first)) / BM25_FILENAME).write_text("{")
+    second = index_versions.build(root)
+    assert index_versions.read_version(root, second)["seeded_from"] == first
+    json.loads((Path(index_versions.version_directory(root, second)) / BM25_FILENAME).read_text())
+
+def test_an_outdated_numpy_index_is_rebuilt_not_opened_empty(knowledge_base, tmp_path):
+    from utils.numpy_index import INDEX_FILENAME, NumpyVectorStore
+    root = str(tmp_path / "numpy")
+    first = index_versions.build(root, backend="numpy")
+    index_path = Path(index_versions.version_directory(root, first)) / INDEX_FILENAME
+    index_path.write_text(json.dumps(dict(json.loads(index_path.read_text()), version=0)))
+    with pytest.raises(ValueError, match="format version"):
+        NumpyVectorStore(None, index_versions.version_directory(root, first))
+
+    progress = IngestProgress()
+    second = index_versions.build(root, progress=progress, backend="numpy")
+    assert index_versions.read_version(root, second)["seeded_from"] is None
+    assert progress.changes["added"] == progress.chunks == index_versions.read_version(root, first)["chunks"]
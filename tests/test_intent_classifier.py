@@ -0,0 +1,49 @@
+import json
+import pytest
+from utils.intent_classifier import IntentClassifier, _load_corpus
+
+def test_corpus_reads_scraper_jsonl_and_json(tmp_path):
+    records = [{"url": "https://example.com/a", "title": "Data analytics", "content": "Part-time course fees"},
+               {"url": "https://example.com/b", "title": "Empty page", "content": ""}]
+    (tmp_path / "dataset.jsonl").write_text("\n".join(json.dumps(record) for record in records) + "\n", encoding="utf-8")
+    (tmp_path / "doc_1.json").write_text(json.dumps({"url": "https://example.com/c", "title": "Partnerships",
+                                                      "content": "Collaborate on research"}), encoding="utf-8")
+
+    texts = _load_corpus(str(tmp_path))
+    assert len(texts) == 2
+    assert any("Part-time course fees" in text for text in texts)
+    assert any("Collaborate on research" in text for text in texts)
+
+@pytest.fixture
+def classifier():
+    classifier = IntentClassifier(threshold=0.5)
+    crew_calls = []
+    classifier._crew_classify = lambda query: crew_calls.append(query) or "industrial_partner"
+    classifier.crew_calls = crew_calls
+    return classifier
+
+def test_confident_predictions_skip_the_llm(classifier):
+    assert classifier.local.predict("skillsfuture course fees")[0] == "adult_learner"
+    assert classifier("skillsfuture course fees") == "adult_learner"
+    assert classifier.crew_calls == []
+
+def test_predictions_below_the_threshold_fall_back(classifier, monkeypatch):
+    confidences = {"sure": 0.9, "borderline": 0.5, "unsure": 0.49}
+    monkeypatch.setattr(classifier.local, "predict", lambda query: ("adult_learner", confidences[query]))
+    assert [classifier(query) for query in ("sure", "borderline", "unsure")] == \
+        ["adult_learner", "adult_learner", "industrial_partner"]
+    assert classifier.crew_calls == ["unsure"]
+    assert classifier.fallback_rate == pytest.approx(1 / 3)
+
+def test_cached_queries_do_not_count_towards_the_fallback_rate(classifier, monkeypatch):
+    monkeypatch.setattr(classifier.local, "predict", lambda query: ("general question", 0.1))
+    classifier("Unsure  query")
+    classifier("unsure query")
+    assert classifier.crew_calls == ["Unsure  query"]
+    assert classifier.stats == {"calls": 2, "cache_hits": 1, "local": 0, "llm_fallbacks": 1}
+    assert classifier.fallback_rate == 1.0
+
+def test_unknown_llm_labels_become_general_questions(classifier, monkeypatch):
+    monkeypatch.setattr(classifier.local, "predict", lambda query: ("adult_learner", 0.0))
+    classifier._crew_classify = lambda query: "I think this is about parking."
+    assert classifier("where do I park") == "general question"
@@ -0,0 +1,44 @@
+import zlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.numpy_index import NumpyVectorStore
+
+DIMENSIONS = 64
+
+class RandomEmbeddings(Embeddings):
+    """Deterministic pseudo-random vectors, one per text"""
+
+    def embed_query(self, text):
+        return np.random.default_rng(zlib.crc32(text.encode())).standard_normal(DIMENSIONS).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+TEXTS = [f"chunk {i}" for i in range(500)]
+METADATAS = [{"audience": "employer" if i % 2 else "adult_learner"} for i in range(500)]
+
+def test_saved_index_reopens_with_the_same_results(tmp_path):
+    store = NumpyVectorStore.from_texts(TEXTS, RandomEmbeddings(), METADATAS, ids=TEXTS, persist_directory=str(tmp_path))
+    store.delete(["chunk 0"])
+    store.add_texts(["chunk 1 revised"], [{"audience": "employer"}], ids=["chunk 1"])
+    store.save()
+
+    reopened = NumpyVectorStore(RandomEmbeddings(), str(tmp_path))
+    assert len(reopened) == 499
+    assert reopened.get(["chunk 1"])["documents"] == ["chunk 1 revised"]
+    for query in ("chunk 1 revised", "chunk 7"):
+        expected = store.similarity_search(query, k=5, filter={"audience": "employer"})
+        assert reopened.similarity_search(query, k=5, filter={"audience": "employer"}) == expected
+        assert expected[0].page_content == query
+
+def test_int8_keeps_the_float32_neighbours():
+    exact = NumpyVectorStore.from_texts(TEXTS, RandomEmbeddings(), ids=TEXTS)
+    quantized = NumpyVectorStore.from_texts(TEXTS, RandomEmbeddings(), ids=TEXTS, dtype="int8")
+    assert quantized.nbytes < exact.nbytes / 3
+
+    queries = RandomEmbeddings().embed_documents([f"query {i}" for i in range(50)])
+    found = expected = 0
+    for exact_hits, quantized_hits in zip(exact.search_vectors(queries, k=10), quantized.search_vectors(queries, k=10)):
+        expected += len(exact_hits)
+        found += len({position for position, _ in exact_hits} & {position for position, _ in quantized_hits})
+    assert found / expected >= 0.9
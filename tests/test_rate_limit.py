@@ -0,0 +1,37 @@
+import time
+import threading
+from helper_functions.rate_limit import BACKGROUND, INTERACTIVE, FairScheduler, TokenBucket
+
+def admission_order(calls):
+    """Queue (label, session, priority) calls in order on a drained scheduler; return the order they are admitted in"""
+    # 10 requests a second, starting 0.3 s in debt so every call is queued before the first is admitted
+    scheduler = FairScheduler(600, 10 ** 9)
+    scheduler.requests.reserve(scheduler.requests.capacity + 2)
+    admitted = []
+    threads = []
+    for label, session, priority in calls:
+        def call(label=label, session=session, priority=priority):
+            scheduler.acquire(0, session=session, priority=priority)
+            admitted.append(label)
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+        while scheduler.depth < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=5)
+    return admitted
+
+def test_sessions_take_turns():
+    calls = [("a1", "a", INTERACTIVE), ("a2", "a", INTERACTIVE), ("a3", "a", INTERACTIVE),
+             ("b1", "b", INTERACTIVE), ("c1", "c", INTERACTIVE)]
+    assert admission_order(calls) == ["a1", "b1", "c1", "a2", "a3"]
+
+def test_interactive_calls_go_before_background_ones():
+    calls = [("batch1", "batch", BACKGROUND), ("batch2", "batch", BACKGROUND), ("chat1", "chat", INTERACTIVE)]
+    assert admission_order(calls) == ["chat1", "batch1", "batch2"]
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(600)
+    assert bucket.capacity == 100
+    assert bucket.reserve(100) == 0
+    assert 0.45 < bucket.reserve(5) <= 0.5
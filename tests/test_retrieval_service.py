@@ -0,0 +1,86 @@
+import json
+import socket
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from utils import retrieval_service
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_service_searches_locally_when_url_is_set(knowledge_base, monkeypatch):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    # The service inherits the RETRIEVAL_SERVICE_URL its replicas are configured with
+    monkeypatch.setattr(retrieval_service, "SERVICE_URL", url)
+    monkeypatch.setattr(knowledge_base, "_retrieval_service_url", url)
+    # `python -m utils.retrieval_service` runs a second copy of the module as __main__
+    spec = importlib.util.spec_from_file_location("retrieval_service_main", retrieval_service.__file__)
+    main_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(main_module)
+
+    server = main_module.serve(port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        response = httpx.post(f"{url}/search", json={"query": "data analytics course fees", "k": 3}, timeout=30)
+        assert response.status_code == 200
+        assert len(response.json()["documents"]) == 3
+        assert isinstance(knowledge_base.get_retrieval_service(), retrieval_service.RetrievalService)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+class _StubService(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        document = {"page_content": "Data analytics course fee", "metadata": {"chunk_id": "stub-1"}}
+        data = json.dumps({"documents": [document]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def test_replica_does_not_open_the_dense_index(knowledge_base, monkeypatch):
+    version = knowledge_base.get_index_version()
+    knowledge_base.reset()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubService)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(knowledge_base, "_retrieval_service_url", f"http://127.0.0.1:{server.server_port}")
+    try:
+        assert knowledge_base.get_index_version() == version
+        knowledge_base.get_partitioned_retrievers()["adult_learner"].invoke("data analytics course fees")
+        assert [document.metadata["chunk_id"] for document in knowledge_base.get_documents(["stub-1"])] == ["stub-1"]
+        assert knowledge_base._index["vector_store"] is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_replica_falls_back_to_its_local_index(knowledge_base, monkeypatch):
+    knowledge_base.get_index_version()
+    knowledge_base.reset()
+    monkeypatch.setattr(knowledge_base, "_retrieval_service_url", f"http://127.0.0.1:{free_port()}")
+    documents = knowledge_base.get_partitioned_retrievers()["adult_learner"].invoke("data analytics course fees")
+    assert documents
+    assert knowledge_base._index["vector_store"] is not None
+    assert knowledge_base.get_retrieval_service().stats["fallbacks"] >= 1
+
+def test_replica_does_not_build_the_first_version(knowledge_base, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "_retrieval_service_url", f"http://127.0.0.1:{free_port()}")
+    with pytest.raises(RuntimeError, match="start the retrieval service"):
+        knowledge_base.get_index_version()
+
+def test_remote_errors_propagate_without_opening_the_fallback():
+    opened = []
+    service = retrieval_service.RemoteRetrievalService("http://retrieval", open_fallback=lambda: opened.append(1))
+    service.client = httpx.Client(base_url="http://retrieval",
+                                  transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+    with pytest.raises(httpx.HTTPStatusError):
+        service.search("data analytics course fees")
+    assert not opened and service.stats["fallbacks"] == 0
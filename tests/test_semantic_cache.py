@@ -0,0 +1,44 @@
+import time
+import pytest
+from utils import semantic_cache
+from utils.semantic_cache import SemanticCache
+
+VECTORS = {
+    "course fees": [1.0, 0.0, 0.0],
+    "how much are the course fees": [0.99, 0.1, 0.0],
+    "campus location": [0.0, 1.0, 0.0],
+    "intake dates": [0.0, 0.0, 1.0],
+}
+
+@pytest.fixture(autouse=True)
+def fixed_embeddings(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "embed_texts", lambda texts, persist=False: [VECTORS[text] for text in texts])
+
+def test_similar_questions_hit_within_a_user_type():
+    cache = SemanticCache()
+    cache.store("adult_learner", "course fees", "S$500", [], latency=2.0)
+    assert cache.lookup("adult_learner", "how much are the course fees").answer == "S$500"
+    assert cache.lookup("adult_learner", "campus location") is None
+    assert cache.lookup("employer", "course fees") is None
+    assert cache.metrics["hits"] == 1 and cache.metrics["misses"] == 2
+    assert cache.metrics["latency_saved_seconds"] == 2.0
+
+def test_entries_expire_after_the_ttl():
+    cache = SemanticCache(ttl_seconds=0.05)
+    cache.store("adult_learner", "course fees", "S$500", [], latency=1.0)
+    assert cache.lookup("adult_learner", "course fees") is not None
+    time.sleep(0.1)
+    assert cache.lookup("adult_learner", "course fees") is None
+    assert cache.metrics["entries"] == 0
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.store("adult_learner", "course fees", "fees", [], latency=1.0)
+    cache.store("adult_learner", "campus location", "campus", [], latency=1.0)
+    # Using the older entry makes the newer one the least recently used
+    assert cache.lookup("adult_learner", "course fees") is not None
+    cache.store("adult_learner", "intake dates", "dates", [], latency=1.0)
+
+    assert cache.lookup("adult_learner", "campus location") is None
+    assert cache.lookup("adult_learner", "course fees").answer == "fees"
+    assert cache.lookup("adult_learner", "intake dates").answer == "dates"
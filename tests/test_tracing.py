@@ -0,0 +1,48 @@
+import pytest
+from helper_functions import tracing
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    tracing.reset()
+    yield
+    tracing.reset()
+
+def test_usage_goes_to_the_innermost_open_span():
+    with tracing.trace("turn") as trace:
+        with tracing.span("answer") as outer:
+            with tracing.span("retrieve") as inner:
+                tracing.record_usage("text-embedding-3-small", 100)
+            # Once the inner span closes, the outer one is current again
+            tracing.record_usage("gpt-4o-mini", 1000, 200)
+
+    assert (inner.prompt_tokens, inner.completion_tokens) == (100, 0)
+    assert (outer.prompt_tokens, outer.completion_tokens) == (1000, 200)
+    # Spans are added as they finish, so the inner one comes first
+    assert [span.name for span in trace.spans] == ["retrieve", "answer"]
+    assert trace.tokens == 1300
+    assert trace.cost == pytest.approx((100 * 0.02 + 1000 * 0.15 + 200 * 0.60) / 1_000_000)
+    assert outer.duration >= inner.duration
+
+def test_stages_are_aggregated_with_and_without_a_trace():
+    with tracing.span("retrieve"):
+        pass
+    with tracing.trace("turn"):
+        with tracing.span("retrieve"):
+            tracing.record_usage("gpt-4o-mini", 10)
+    stats = tracing.snapshot()
+    assert stats["retrieve"]["count"] == 2 and stats["retrieve"]["tokens"] == 10
+    assert stats["turn"]["count"] == 1
+    assert [trace["name"] for trace in tracing.recent_traces()] == ["turn"]
+
+def test_usage_outside_any_span_is_ignored():
+    with tracing.trace("turn") as trace:
+        tracing.record_usage("gpt-4o-mini", 10)
+    assert trace.tokens == 0 and trace.spans == []
+
+def test_disabled_tracing_records_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", False)
+    with tracing.trace("turn") as trace:
+        with tracing.span("retrieve") as span:
+            span.set(hit=True)
+    assert trace is None
+    assert tracing.snapshot() == {}
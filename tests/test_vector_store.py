@@ -0,0 +1,51 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from helper_functions import llm
+from utils.numpy_index import NumpyVectorStore
+from utils.vector_store import sync_vectorstore
+
+class CountingEmbeddings(Embeddings):
+    """Records every text embedded"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(llm, "count_tokens", lambda text: len(text.split()))
+
+def document(source, text, audience="general"):
+    return {"source": source, "text": text, "audience": audience}
+
+def test_sync_embeds_only_what_changed(tmp_path):
+    embeddings = CountingEmbeddings()
+    store = NumpyVectorStore(embeddings, str(tmp_path))
+    first = [document("a", "Course fees"), document("b", "Campus location"),
+             document("c", "Intake dates"), document("d", "Partnerships")]
+    assert sync_vectorstore(store, first, str(tmp_path)) == {"added": 4, "updated": 0, "deleted": 0, "unchanged": 0}
+
+    embeddings.embedded.clear()
+    second = [document("a", "Course fees"), document("b", "Campus moved to Tampines"),
+              document("d", "Partnerships", audience="industrial_partner"), document("e", "Scholarships")]
+    assert sync_vectorstore(store, second, str(tmp_path)) == {"added": 1, "updated": 2, "deleted": 1, "unchanged": 1}
+    # A metadata change re-upserts the chunk just like a text change
+    assert sorted(embeddings.embedded) == ["Campus moved to Tampines", "Partnerships", "Scholarships"]
+    assert sorted(store.get()["documents"]) == ["Campus moved to Tampines", "Course fees", "Partnerships", "Scholarships"]
+
+def test_unchanged_corpus_embeds_nothing(tmp_path):
+    embeddings = CountingEmbeddings()
+    documents = [document("a", "Course fees"), document("b", "Campus location")]
+    sync_vectorstore(NumpyVectorStore(embeddings, str(tmp_path)), documents, str(tmp_path))
+
+    embeddings.embedded.clear()
+    # A fresh process reopens the saved store and manifest
+    changes = sync_vectorstore(NumpyVectorStore(embeddings, str(tmp_path)), documents, str(tmp_path))
+    assert changes == {"added": 0, "updated": 0, "deleted": 0, "unchanged": 2}
+    assert embeddings.embedded == []
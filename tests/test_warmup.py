@@ -0,0 +1,16 @@
+import threading
+import time
+from utils import knowledge_base, warmup
+
+def test_wait_gives_up_after_the_timeout(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(knowledge_base, "warm_up", release.wait)
+    monkeypatch.setattr(warmup, "_thread", None)
+    monkeypatch.setattr(warmup, "status", {"state": "not started", "seconds": None, "error": None})
+    start = time.perf_counter()
+    assert not warmup.wait(timeout=0.1)
+    assert time.perf_counter() - start < 5
+    assert warmup.running()
+    release.set()
+    assert warmup.wait()
+    assert not warmup.running()
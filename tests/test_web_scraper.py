@@ -0,0 +1,64 @@
+import json
+import pytest
+from benchmarks.fixture_site import start_fixture_site
+from webScraper import EthicalWebScraper
+
+@pytest.fixture
+def site():
+    server = start_fixture_site(pages=12, latency=0.0)
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+def make_scraper(base_url, output_dir):
+    return EthicalWebScraper(base_url, str(output_dir), concurrency=2, rate_limit=0)
+
+def dataset_urls(scraper):
+    with open(scraper.dataset_path, encoding='utf-8') as f:
+        return [json.loads(line)["url"] for line in f]
+
+@pytest.mark.parametrize("max_pages", [100, 5])
+def test_finished_crawl_runs_again(site, tmp_path, max_pages):
+    first = make_scraper(site, tmp_path).scrape_site(max_pages=max_pages)
+    assert first > 0
+    assert not (tmp_path / "crawl_state.json").exists()
+
+    # The default resume=True must not restore a crawl that already finished
+    scraper = make_scraper(site, tmp_path)
+    assert scraper.scrape_site(max_pages=max_pages) == first
+    assert len(dataset_urls(scraper)) == first
+
+def test_interrupted_crawl_resumes(site, tmp_path, monkeypatch):
+    scraper = make_scraper(site, tmp_path)
+    scraper.checkpoint_every = 1
+    fetch = scraper.fetch
+    calls = []
+    def failing_fetch(url):
+        calls.append(url)
+        if len(calls) > 4:
+            raise KeyboardInterrupt
+        return fetch(url)
+    monkeypatch.setattr(scraper, "fetch", failing_fetch)
+    with pytest.raises(KeyboardInterrupt):
+        scraper.scrape_site()
+    assert (tmp_path / "crawl_state.json").exists()
+
+    resumed = make_scraper(site, tmp_path)
+    total = resumed.scrape_site()
+    urls = dataset_urls(resumed)
+    assert total == len(urls) == len(set(urls)) == 12
+
+def test_robots_rules_for_our_user_agent_apply(site, tmp_path):
+    scraper = make_scraper(site, tmp_path)
+    scraper.rp.parse(["User-agent: Ethical Web Scraper", "Disallow: /staff", "Crawl-delay: 2"])
+    assert not scraper.is_allowed(site + "staff/page.html")
+    assert scraper.is_allowed(site + "page-1.html")
+    assert scraper.rp.crawl_delay(scraper.USER_AGENT) == 2
+
+def test_crawl_delay_is_the_floor_for_the_rate_limit(tmp_path):
+    server = start_fixture_site(pages=2, latency=0.0, crawl_delay=1)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_port}/"
+        assert EthicalWebScraper(base_url, str(tmp_path), rate_limit=0).throttle.delay == 1
+        assert EthicalWebScraper(base_url, str(tmp_path), rate_limit=2).throttle.delay == 2
+    finally:
+        server.shutdown()
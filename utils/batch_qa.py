@@ -0,0 +1,181 @@
+"""Answer a JSONL file of questions headlessly.
+
+Each input line is {"question": "...", "id": optional}. Answers, sources and
+timings are appended to the output JSONL as they complete, so an interrupted
+run resumes by skipping ids already answered; failed questions are retried and
+their error lines dropped.
+
+Every OpenAI call a question makes (classification, embeddings, compression,
+the answer) is admitted by the process-wide scheduler in helper_functions/llm.py
+at background priority, so --rpm and --tpm are the account's API limits.
+
+    python -m utils.batch_qa questions.jsonl answers.jsonl --concurrency 8 --rpm 500 --tpm 200000
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Set
+from helper_functions import llm, tracing
+from helper_functions import rate_limit
+from utils.vector_store import PERSIST_DIRECTORY, get_audience_retrievers, IngestProgress
+from utils import index_versions
+from utils.chat_chain import create_chat_chain, process_query
+from utils.intent_classifier import create_intent_classifier, LABELS
+from utils.semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+def read_questions(path: str) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            record.setdefault("id", str(line_number))
+            yield record
+
+def compact_output(path: str) -> Set[str]:
+    """Rewrite the output with one answer per id, dropping failed attempts; returns the ids answered.
+
+    Failed questions are retried by the next run, so their error lines would
+    otherwise sit next to the answers that replace them.
+    """
+    if not Path(path).exists():
+        return set()
+    answered = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if "error" not in record:
+                answered[str(record["id"])] = record
+    tmp_path = Path(path).with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        for record in answered.values():
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return set(answered)
+
+class BatchRunner:
+    """Classifies and answers questions concurrently under shared rate limits"""
+
+    def __init__(self, vector_store, model: str = "gpt-4o-mini",
+                 persist_directory: str = PERSIST_DIRECTORY):
+        chat_model = llm.get_chat_model(model)
+        retrievers = get_audience_retrievers(vector_store, LABELS, persist_directory)
+        self.chains = {label: create_chat_chain(vector_store, label, llm=chat_model, retriever=retrievers[label]) for label in LABELS}
+        self.classify_intent = create_intent_classifier()
+        # Repeated FAQs within a run are answered once
+        self.cache = SemanticCache()
+
+    def answer(self, record: Dict) -> Dict:
+        question = record["question"]
+        result = {"id": record["id"], "question": question}
+        start = time.perf_counter()
+        try:
+            # Each API call waits for the shared quota; inside the app process interactive turns go first
+            with tracing.trace("batch.question") as trace, \
+                    rate_limit.client_context(session=f"batch:{record['id']}", priority=rate_limit.BACKGROUND):
+                classify_start = time.perf_counter()
+                user_type = self.classify_intent(question)
+                answer_start = time.perf_counter()
+                with tracing.span("batch.answer"):
+                    response = process_query(
+                        self.chains.get(user_type, self.chains['general question']),
+                        question, [], user_type=user_type, cache=self.cache
+                    )
+            result.update({
+                "user_type": user_type,
+                "answer": response["answer"],
+                "sources": [
+                    {key: document.metadata.get(key) for key in ("source", "url", "title", "audience")}
+                    for document in response["source_documents"]
+                ],
+                "cached": response["cached"],
+                "tokens": trace.tokens if trace is not None else None,
+                "timings_ms": {
+                    "classify": (answer_start - classify_start) * 1000,
+                    "answer": (time.perf_counter() - answer_start) * 1000,
+                    "total": (time.perf_counter() - start) * 1000,
+                },
+            })
+        except Exception as e:
+            logger.error(f"Error answering {record['id']}: {e}")
+            result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    def run(self, records: Iterator[Dict], output_path: str, concurrency: int) -> Dict[str, int]:
+        counts = {"answered": 0, "failed": 0}
+        write_lock = threading.Lock()
+        # Bounded submission keeps memory flat however long the input is
+        slots = threading.BoundedSemaphore(concurrency * 2)
+
+        with open(output_path, 'a', encoding='utf-8') as output:
+            def work(record):
+                try:
+                    result = self.answer(record)
+                    with write_lock:
+                        output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        output.flush()
+                        counts["failed" if "error" in result else "answered"] += 1
+                        done = counts["answered"] + counts["failed"]
+                        if done % 50 == 0:
+                            logger.info(f"{done} questions processed ({counts['failed']} failed)")
+                finally:
+                    slots.release()
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for record in records:
+                    slots.acquire()
+                    executor.submit(work, record)
+        return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the RAG pipeline")
+    parser.add_argument("input", help="JSONL with one {\"question\", \"id\"} object per line")
+    parser.add_argument("output", help="JSONL answers are appended to")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=llm.REQUESTS_PER_MINUTE,
+                        help="OpenAI requests per minute, every chat and embedding call counted (default: OPENAI_RPM)")
+    parser.add_argument("--tpm", type=float, default=llm.TOKENS_PER_MINUTE,
+                        help="OpenAI tokens per minute (default: OPENAI_TPM)")
+    parser.add_argument("--no-resume", action="store_true", help="Start a new output instead of resuming the existing one")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.no_resume:
+        Path(args.output).unlink(missing_ok=True)
+    done = compact_output(args.output)
+    if done:
+        logger.info(f"Resuming: {len(done)} questions already answered")
+    llm.scheduler.set_limits(args.rpm, args.tpm)
+    records = (record for record in read_questions(args.input) if str(record["id"]) not in done)
+
+    # Answers come from the active index version; one is built first if there is none
+    version = index_versions.current_version(PERSIST_DIRECTORY)
+    if version is None:
+        version = index_versions.build(PERSIST_DIRECTORY, progress=IngestProgress(lambda p: logger.info(p.summary())))
+    logger.info(f"Answering from index version {version}")
+    runner = BatchRunner(index_versions.open_version(PERSIST_DIRECTORY, version),
+                         persist_directory=index_versions.version_directory(PERSIST_DIRECTORY, version))
+    start = time.perf_counter()
+    counts = runner.run(records, args.output, args.concurrency)
+    elapsed = time.perf_counter() - start
+    print(f"Answered {counts['answered']} questions ({counts['failed']} failed) in {elapsed:.1f}s; "
+          f"semantic cache hit rate {runner.cache.metrics['hit_rate']:.0%}, "
+          f"p95 rate-limit wait {llm.scheduler.metrics()['priorities']['background']['wait_p95_ms']:.0f} ms")
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import math
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+BM25_FILENAME = "bm25_index.json"
+
+# Course codes (TGS-2021008563), fees ($1,234.50) and ordinary words
+TOKEN_PATTERN = re.compile(r"\$?[a-z0-9]+(?:[.,/-][a-z0-9]+)*")
+QUOTED_PATTERN = re.compile(r'"([^"]+)"')
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; compound tokens also emit their parts so 'tgs' matches 'tgs-2021'"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.replace(',', '') if token[0] == '$' or token[0].isdigit() else token
+        tokens.append(token)
+        parts = re.split(r"[.,/$-]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """In-process Okapi BM25 over an inverted index of term -> [(chunk, term frequency)]"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.avg_length = 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], texts: List[str], metadatas: List[Dict], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            index.add(chunk_id, text, metadata)
+        index.finalize()
+        return index
+
+    def add(self, chunk_id: str, text: str, metadata: Dict):
+        """Index one chunk; call finalize() once all chunks are added"""
+        position = len(self.ids)
+        self.ids.append(chunk_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        counts = Counter(tokenize(text))
+        self.doc_lengths.append(sum(counts.values()))
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, []).append((position, frequency))
+
+    def finalize(self):
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        total = len(self.doc_lengths)
+        self.idf = {term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for term, posting in self.postings.items()}
+
+    def search(self, query: str, k: int = 4, audiences: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        """Return up to k (position, score) pairs, best first, optionally only from some audiences"""
+        scores = Counter()
+        if not self.avg_length:
+            # No chunks, or none with any tokens
+            return []
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for position, frequency in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / self.avg_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        if audiences is not None:
+            scores = Counter({position: score for position, score in scores.items()
+                              if self.metadatas[position].get("audience") in audiences})
+        return scores.most_common(k)
+
+    def document(self, position: int) -> Document:
+        return Document(page_content=self.texts[position], metadata=dict(self.metadatas[position]))
+
+    def save(self, persist_directory: str):
+        path = Path(persist_directory) / BM25_FILENAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                "k1": self.k1, "b": self.b,
+                "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas,
+                "doc_lengths": self.doc_lengths, "postings": self.postings,
+            }, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "BM25Index":
+        with open(Path(persist_directory) / BM25_FILENAME, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids, index.texts, index.metadatas = data["ids"], data["texts"], data["metadatas"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: [tuple(entry) for entry in posting] for term, posting in data["postings"].items()}
+        index.finalize()
+        return index
+
+def exact_terms(query: str) -> List[str]:
+    """Quoted phrases and code-like tokens (letters mixed with digits, e.g. TGS-2021008563).
+
+    Plain numbers such as ages, levels or fees are left out: they are too
+    common in the corpus to identify a chunk on their own.
+    """
+    phrases = [phrase.lower().strip() for phrase in QUOTED_PATTERN.findall(query)]
+    codes = [token for token in TOKEN_PATTERN.findall(query.lower())
+             if any(ch.isdigit() for ch in token) and any(ch.isalpha() for ch in token)]
+    return [term for term in phrases + codes if term]
+
+def contains_term(text: str, term: str) -> bool:
+    """True if term occurs in text as whole tokens, e.g. 'level 2' in 'level 2 fees' but not in 'level 20'"""
+    return re.search(rf"(?<![a-z0-9]){re.escape(term)}(?![a-z0-9])", text.lower()) is not None
+
+def _document_key(document: Document) -> str:
+    return document.metadata.get("chunk_id") or document.page_content
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuse BM25 and dense results with reciprocal rank fusion.
+
+    Queries built around exact terms (quoted phrases, course codes) that the
+    best lexical hit contains as whole tokens are answered from BM25 alone,
+    without an embedding call.
+    """
+
+    dense_retriever: BaseRetriever
+    lexical_index: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    audiences: Optional[List[str]] = None  # Restricts BM25 hits; the dense retriever carries its own filter
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical = self.lexical_index.search(query, k=self.fetch_k, audiences=self.audiences)
+
+        terms = exact_terms(query)
+        if terms and lexical:
+            best_text = self.lexical_index.texts[lexical[0][0]]
+            if all(contains_term(best_text, term) for term in terms):
+                return [self.lexical_index.document(position) for position, _ in lexical[:self.k]]
+
+        dense = self.dense_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+
+        fused = Counter()
+        documents = {}
+        for rank, (position, _) in enumerate(lexical):
+            document = self.lexical_index.document(position)
+            key = _document_key(document)
+            documents[key] = document
+            fused[key] += 1 / (self.rrf_k + rank + 1)
+        for rank, document in enumerate(dense):
+            key = _document_key(document)
+            documents.setdefault(key, document)
+            fused[key] += 1 / (self.rrf_k + rank + 1)
+
+        return [documents[key] for key, _ in fused.most_common(self.k)]
@@ -1,8 +1,19 @@
+import time
+import asyncio
+import logging
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.output_parsers import StrOutputParser
 from langchain.chains import create_history_aware_retriever
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from helper_functions import tracing
+from helper_functions import llm as llm_client
+from utils.vector_store import audience_filter
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the intent classifier before searching speculatively
+SPECULATIVE_RETRIEVAL_AFTER = 0.05
 
 def get_custom_prompt(user_type):
     """Get custom prompt based on user type"""
@@ -60,18 +71,24 @@ def get_custom_prompt(user_type):
     
     return question_prompt, contextualize_prompt
 
-def create_chat_chain(vectorstore, user_type):
+def create_chat_chain(vectorstore, user_type, llm=None, retriever=None):
     """Create conversation chain with custom prompt and source document tracking"""
-    # Initialize LLM
-    llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0)
+    # Initialize LLM, unless a shared client is passed in
+    if llm is None:
+        llm = llm_client.get_chat_model()
     
     # Get custom prompts
     question_prompt, contextualize_prompt = get_custom_prompt(user_type)
     
+    # Without a prebuilt retriever, search only this user type's audience partition
+    if retriever is None:
+        search_filter = audience_filter(user_type)
+        retriever = vectorstore.as_retriever(search_kwargs={"filter": search_filter} if search_filter else {})
+
     # Create history-aware retriever
     history_aware_retriever = create_history_aware_retriever(
         llm, 
-        vectorstore.as_retriever(), 
+        retriever, 
         contextualize_prompt
     )
     
@@ -89,15 +106,166 @@ def create_chat_chain(vectorstore, user_type):
     
     return retrieval_chain
 
+def create_contextualize_chain(llm):
+    """Create the chain that rewrites a follow-up into a standalone question"""
+    # The contextualize prompt is the same for every user type
+    _, contextualize_prompt = get_custom_prompt("general question")
+    return contextualize_prompt | llm | StrOutputParser()
+
+def create_answer_chain(llm, user_type):
+    """Create the chain that answers a question from already retrieved documents"""
+    question_prompt, _ = get_custom_prompt(user_type)
+    return create_stuff_documents_chain(llm, question_prompt)
+
+def format_chat_history(chat_history):
+    """Render (question, answer, ...) turns as a transcript for the prompts"""
+    return "\n".join(f"Human: {turn[0]}\nAssistant: {turn[1]}" for turn in chat_history)
+
+async def apre_retrieve(question, chat_history, classify_intent, contextualize_chain, retriever, cache=None):
+    """Run the stages that come before generation with as much overlap as possible.
+
+    Intent classification runs alongside the question rewrite, which is skipped
+    entirely when there is no chat history. Retrieval starts as soon as the
+    standalone question is known, without waiting for the classifier.
+
+    retriever may also be a dict of retrievers per user type (see
+    get_audience_retrievers). If the classifier is still running after
+    SPECULATIVE_RETRIEVAL_AFTER (e.g. its LLM fallback), the 'general question' retriever, which searches every
+    audience, starts speculatively; its results are kept if that is the label,
+    and otherwise the labelled audience's partition is searched.
+
+    With a SemanticCache, the standalone question is looked up once the label
+    is known; on a hit, "cached" holds the entry and retrieved documents are
+    discarded.
+    """
+    def classify():
+        with tracing.span("intent.classify"):
+            return classify_intent(question)
+
+    def partition(user_type):
+        if isinstance(retriever, dict):
+            return retriever.get(user_type, retriever['general question'])
+        return retriever
+
+    async def retrieve(target, query, **attributes):
+        with tracing.span("retrieval", **attributes) as span:
+            documents = await target.ainvoke(query)
+            span.set(documents=len(documents))
+        return documents
+
+    classification = asyncio.create_task(asyncio.to_thread(classify))
+
+    if chat_history:
+        with tracing.span("chain.rewrite"):
+            standalone_question = await contextualize_chain.ainvoke({
+                "input": question,
+                "chat_history": format_chat_history(chat_history)
+            })
+    else:
+        standalone_question = question
+
+    # The local classifier answers within milliseconds; only a slower one (its
+    # LLM fallback) is worth searching speculatively for
+    await asyncio.wait({classification}, timeout=SPECULATIVE_RETRIEVAL_AFTER)
+    speculative = None
+    if not classification.done():
+        speculative_retriever = partition('general question')
+        speculative = asyncio.create_task(retrieve(speculative_retriever, standalone_question, speculative=True))
+        # A discarded search's outcome is not needed, including any error
+        speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+    user_type = await classification
+
+    cached = None
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.lookup, user_type, standalone_question)
+    if cached is not None:
+        documents = cached.source_documents
+    elif speculative is not None and partition(user_type) is speculative_retriever:
+        documents = await speculative
+    else:
+        documents = await retrieve(partition(user_type), standalone_question)
+    if speculative is not None and not speculative.done():
+        speculative.cancel()
+
+    return {
+        "user_type": user_type,
+        "standalone_question": standalone_question,
+        "documents": documents,
+        "cached": cached
+    }
+
+def pre_retrieve(question, chat_history, classify_intent, contextualize_chain, retriever, cache=None):
+    """Synchronous entry point for apre_retrieve, e.g. from a Streamlit script.
+
+    Runs on the shared event loop so the async HTTP connection pool is reused across turns.
+    """
+    return llm_client.run_async(apre_retrieve(question, chat_history, classify_intent, contextualize_chain, retriever, cache))
+
 # Example usage with source document tracking
-def process_query(retrieval_chain, query, chat_history):
-    """Process a query with the retrieval chain and return sources"""
+def process_query(retrieval_chain, query, chat_history, user_type=None, cache=None):
+    """Process a query with the retrieval chain and return sources.
+
+    When a SemanticCache is given, a question without chat history is already
+    standalone, so it is answered from the cache if a similar one was seen.
+    """
+    use_cache = cache is not None and user_type is not None and not chat_history
+    if use_cache:
+        entry = cache.lookup(user_type, query)
+        if entry is not None:
+            return {"answer": entry.answer, "source_documents": entry.source_documents, "cached": True}
+
+    start = time.perf_counter()
     result = retrieval_chain.invoke({
         "input": query,
         "chat_history": chat_history
     })
     
-    return {
+    response = {
         "answer": result['answer'],
-        "source_documents": result.get('context', [])  # Retrieve the context/source documents
-    }
\ No newline at end of file
+        "source_documents": result.get('context', []),  # Retrieve the context/source documents
+        "cached": False
+    }
+    if use_cache:
+        cache.store(user_type, query, response["answer"], response["source_documents"], time.perf_counter() - start)
+    return response
+
+
+class StreamedAnswer:
+    """Iterate over answer tokens as they are generated, keeping sources and timings.
+
+    The full answer is available once iteration finishes; time_to_first_token
+    is the latency the user actually perceives.
+    """
+
+    def __init__(self, start_stream, source_documents=None):
+        self.start_stream = start_stream
+        self.answer = ""
+        self.source_documents = source_documents or []
+        self.time_to_first_token = None
+        self.total_time = None
+
+    def __iter__(self):
+        start = time.perf_counter()
+        # Token usage reported by the model's callback lands on this span
+        with tracing.span("chain.generate") as span:
+            for token in self.start_stream():
+                if token:
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - start
+                    self.answer += token
+                    yield token
+            self.total_time = time.perf_counter() - start
+            span.set(time_to_first_token_ms=(self.time_to_first_token or self.total_time) * 1000)
+        # Its own stage, so the admin page shows first-token percentiles across turns
+        tracing.record_span("chain.first_token", self.time_to_first_token or self.total_time)
+        logger.info(
+            "Streamed answer: first token %.3fs, total %.3fs",
+            self.time_to_first_token or self.total_time, self.total_time
+        )
+
+def stream_answer(answer_chain, query, documents):
+    """Stream the answer to a query from documents retrieved by pre_retrieve"""
+    return StreamedAnswer(
+        lambda: answer_chain.stream({"input": query, "context": documents}),
+        source_documents=documents
+    )
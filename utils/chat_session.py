@@ -0,0 +1,80 @@
+import sys
+import math
+import threading
+import weakref
+import itertools
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List
+
+# Turns shown per session; older ones are dropped from the display history
+MAX_TURNS = 50
+
+_lock = threading.Lock()
+_histories = weakref.WeakSet()
+# Turn IDs stay the same while older turns drop out, so widgets can be keyed by them
+_turn_ids = itertools.count()
+
+
+class Turn:
+    """One displayed exchange, citing its sources by chunk ID and score instead of holding documents"""
+
+    __slots__ = ("id", "question", "answer", "chunk_ids", "scores")
+
+    def __init__(self, question: str, answer: str, documents: Iterable = ()):
+        self.id = next(_turn_ids)
+        self.question = question
+        self.answer = answer
+        # Only chunks from the index can be looked up again
+        documents = [document for document in documents if document.metadata.get("chunk_id")]
+        self.chunk_ids = tuple(document.metadata["chunk_id"] for document in documents)
+        # The compressor's sentence score, NaN when compression is off
+        self.scores = array('f', (document.metadata.get("sentence_score", math.nan) for document in documents))
+
+    @property
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self.id) + sys.getsizeof(self.question) + sys.getsizeof(self.answer)
+                + sys.getsizeof(self.chunk_ids) + sum(sys.getsizeof(chunk_id) for chunk_id in self.chunk_ids)
+                + sys.getsizeof(self.scores))
+
+
+class ChatHistory:
+    """What a session shows the user: a bounded list of compact turns.
+
+    The history sent to the model is kept separately by ContextWindow. Sources
+    are resolved from the shared vector store only when a turn's sources are
+    displayed (see utils.vector_store.get_documents).
+    """
+
+    def __init__(self, max_turns: int = MAX_TURNS):
+        self.turns = deque(maxlen=max_turns)
+        with _lock:
+            _histories.add(self)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add_turn(self, question: str, answer: str, documents: Iterable = ()) -> Turn:
+        turn = Turn(question, answer, documents)
+        self.turns.append(turn)
+        return turn
+
+    def clear(self):
+        self.turns.clear()
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.turns) + sum(turn.nbytes for turn in self.turns)
+
+def memory_stats() -> Dict[str, int]:
+    """Live chat histories across all sessions in this process and the memory they hold"""
+    with _lock:
+        histories: List[ChatHistory] = list(_histories)
+    return {
+        "sessions": len(histories),
+        "turns": sum(len(history) for history in histories),
+        "bytes": sum(history.nbytes for history in histories),
+    }
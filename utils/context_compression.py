@@ -0,0 +1,130 @@
+import os
+import math
+from collections import Counter
+from typing import List, Optional, Sequence
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
+from langchain_core.embeddings import Embeddings
+from helper_functions import llm, tracing
+from utils.bm25 import tokenize
+from utils.dedup import split_segments
+
+# Set CONTEXT_COMPRESSION=0 to stuff whole retrieved chunks into the prompt
+ENABLED = os.getenv('CONTEXT_COMPRESSION', '1') != '0'
+
+# Candidates retrieved per question before MMR keeps the top k
+FETCH_K = 10
+# 1.0 ranks by relevance alone, 0.0 by diversity alone
+MMR_LAMBDA = 0.7
+# Upper bound for the retrieved context once compressed
+MAX_CONTEXT_TOKENS = 600
+# Sentences scoring below this fraction of the best sentence are dropped
+MIN_RELATIVE_SCORE = 0.2
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def mmr_select(relevance: Sequence[float], vectors: Sequence[Sequence[float]], k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """Indices of k vectors chosen by maximal marginal relevance, in selection order"""
+    if not len(vectors) or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything already selected
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+class ContextCompressor(BaseDocumentCompressor):
+    """Diversify retrieved chunks with MMR, then keep only the sentences relevant to the query.
+
+    Neighbouring chunks overlap, so sentences already kept from an earlier
+    chunk are skipped. Sentences are scored by the IDF-weighted query terms
+    they contain (IDF over the candidate sentences) and kept best first until
+    max_tokens is spent; each chunk keeps at least its best sentence. Kept
+    sentences stay in document order, and metadata still cites the original
+    chunk, plus its best kept sentence's score as sentence_score. That score
+    ranks sentences for one query; it is not a similarity to the query.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embeddings: Embeddings
+    k: int = 4
+    lambda_mult: float = MMR_LAMBDA
+    max_tokens: int = MAX_CONTEXT_TOKENS
+    min_relative_score: float = MIN_RELATIVE_SCORE
+
+    def diversify(self, documents: Sequence[Document], query: str) -> List[Document]:
+        if len(documents) <= self.k:
+            return list(documents)
+        # Relevance comes from the retriever's ranking, which for the hybrid
+        # retriever already fuses BM25 with dense similarity; cosine similarity
+        # between chunks (cached since ingestion) measures redundancy
+        vectors = self.embeddings.embed_documents([document.page_content for document in documents])
+        relevance = 1 - np.arange(len(documents)) / len(documents)
+        return [documents[i] for i in mmr_select(relevance, vectors, self.k, self.lambda_mult)]
+
+    def extract(self, documents: Sequence[Document], query: str) -> List[Document]:
+        query_terms = set(tokenize(query))
+        seen = set()
+        sentences = []  # (document index, position, text, terms)
+        for index, document in enumerate(documents):
+            for line in split_segments(document.page_content):
+                for sentence in line:
+                    key = ' '.join(sentence.lower().split())
+                    if not key or key in seen:
+                        continue
+                    seen.add(key)
+                    sentences.append((index, len(sentences), sentence.strip(), set(tokenize(sentence))))
+
+        frequency = Counter(term for *_, terms in sentences for term in terms & query_terms)
+        def score(terms):
+            return sum(math.log(1 + len(sentences) / frequency[term]) for term in terms & query_terms)
+        scored = [(score(terms), index, position, text) for index, position, text, terms in sentences]
+        best_score = max((item[0] for item in scored), default=0.0)
+
+        # Each document's best sentence first (its lead sentence if nothing matches), then the rest by score
+        ranked = sorted(scored, key=lambda item: (-item[0], item[2]))
+        leaders = {}
+        for item in ranked:
+            leaders.setdefault(item[1], item)
+        others = [item for item in ranked
+                  if leaders[item[1]] is not item and item[0] > 0 and item[0] >= best_score * self.min_relative_score]
+
+        kept = {index: [] for index in range(len(documents))}
+        used = 0
+        for item in list(leaders.values()) + others:
+            tokens = llm.count_tokens(item[3])
+            if used + tokens > self.max_tokens:
+                continue
+            kept[item[1]].append(item)
+            used += tokens
+
+        compressed = []
+        for index, document in enumerate(documents):
+            if kept[index]:
+                text = ' '.join(text for _, _, _, text in sorted(kept[index], key=lambda item: item[2]))
+                metadata = {**document.metadata, "sentence_score": max(item[0] for item in kept[index])}
+                compressed.append(Document(page_content=text, metadata=metadata))
+        return compressed
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        with tracing.span("context.compress", documents_in=len(documents)) as span:
+            selected = self.extract(self.diversify(documents, query), query)
+            span.set(documents_out=len(selected))
+        return selected
@@ -0,0 +1,109 @@
+from typing import List
+from helper_functions import llm
+
+# Per-turn prompt budget in tokens, shared by history, retrieved context and question
+MAX_PROMPT_TOKENS = 4000
+# Upper bound for retrieved context; history gets what is left after the question
+CONTEXT_BUDGET = 2500
+# Turns remembered at most; far more than ever fit the budget
+MAX_TURNS = 50
+
+SUMMARY_PROMPT = """Summarise the following conversation between a user and the Temasek Polytechnic assistant in at most 120 words. Keep course names, fees, dates and partnership details.
+
+Previous summary:
+{summary}
+
+Conversation:
+{transcript}"""
+
+
+class ContextWindow:
+    """Keeps each turn's prompt within a token budget, however long the chat runs.
+
+    Token counts are computed once when a turn is added, so selecting history is
+    a walk over cached integers. Turns that no longer fit are dropped, or folded
+    into a running summary when summarize is enabled.
+    """
+
+    def __init__(self, max_prompt_tokens: int = MAX_PROMPT_TOKENS, context_budget: int = CONTEXT_BUDGET, summarize: bool = False,
+                 max_turns: int = MAX_TURNS):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_budget = context_budget
+        self.summarize = summarize
+        self.max_turns = max_turns
+        self.turns = []  # (question, answer, tokens)
+        self.summary = ""
+        self.summary_tokens = 0
+        self._summarized = 0  # Number of leading turns already folded into the summary
+        self.usage = {}
+
+    def add_turn(self, question: str, answer: str):
+        tokens = llm.count_tokens(f"Human: {question}\nAssistant: {answer}")
+        self.turns.append((question, answer, tokens))
+        excess = len(self.turns) - self.max_turns
+        if excess > 0:
+            # Fold the oldest turns into the summary before forgetting them
+            if self.summarize and self._summarized < excess:
+                self._fold_into_summary(excess)
+            del self.turns[:excess]
+            self._summarized = max(0, self._summarized - excess)
+
+    def clear(self):
+        self.turns = []
+        self.summary = ""
+        self.summary_tokens = 0
+        self._summarized = 0
+
+    def _fold_into_summary(self, upto: int):
+        """Summarise turns [_summarized, upto) into the running summary"""
+        transcript = "\n".join(f"Human: {q}\nAssistant: {a}" for q, a, _ in self.turns[self._summarized:upto])
+        self.summary = llm.get_completion(SUMMARY_PROMPT.format(summary=self.summary or "(none)", transcript=transcript))
+        self.summary_tokens = llm.count_tokens(self.summary)
+        self._summarized = upto
+
+    def select_history(self, question: str) -> List[tuple]:
+        """Return the most recent (question, answer) turns that fit the history budget"""
+        question_tokens = llm.count_tokens(question)
+        budget = self.max_prompt_tokens - self.context_budget - question_tokens
+
+        kept = 0
+        used = 0
+        for _, _, tokens in reversed(self.turns[self._summarized:]):
+            if used + tokens + self.summary_tokens > budget:
+                break
+            used += tokens
+            kept += 1
+        first_kept = len(self.turns) - kept
+
+        if self.summarize and first_kept > self._summarized:
+            self._fold_into_summary(first_kept)
+
+        history = [(q, a) for q, a, _ in self.turns[first_kept:]]
+        history_tokens = used
+        if self.summary:
+            history.insert(0, ("(Summary of the earlier conversation)", self.summary))
+            history_tokens += self.summary_tokens
+
+        self.usage = {"question": question_tokens, "history": history_tokens, "context": 0}
+        return history
+
+    def fit_documents(self, documents: List) -> List:
+        """Keep retrieved documents, best first, until the remaining budget is spent"""
+        budget = min(
+            self.context_budget,
+            self.max_prompt_tokens - self.usage.get("question", 0) - self.usage.get("history", 0)
+        )
+        kept = []
+        used = 0
+        for document in documents:
+            tokens = llm.count_tokens(document.page_content)
+            if used + tokens > budget:
+                break
+            kept.append(document)
+            used += tokens
+        self.usage["context"] = used
+        return kept
+
+    @property
+    def tokens_used(self) -> int:
+        return sum(self.usage.values())
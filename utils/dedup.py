@@ -0,0 +1,108 @@
+import re
+import zlib
+import hashlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# A passage counts as boilerplate once it appears verbatim on this many pages
+BOILERPLATE_MIN_DOCUMENTS = 3
+BOILERPLATE_MIN_FRACTION = 0.1
+
+# Chunks whose estimated Jaccard similarity over word shingles reaches the
+# threshold are near-duplicates; bands x rows must equal the permutation count
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+DUPLICATE_THRESHOLD = 0.8
+
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+# Smallest prime above 2**32: a * x + b must wrap many times for the permutations to differ
+_PRIME = 4294967311
+
+def split_segments(text: str) -> List[List[str]]:
+    """Lines of sentence-level segments; scraped pages are mostly one long line"""
+    return [SENTENCE_PATTERN.split(line) for line in text.split('\n')]
+
+def _segment_key(segment: str) -> bytes:
+    return hashlib.blake2b(' '.join(segment.lower().split()).encode('utf-8'), digest_size=8).digest()
+
+
+class BoilerplateFilter:
+    """Drops sentences repeated verbatim across many pages (cookie notices, banners, contact blocks).
+
+    fit() needs one pass over the corpus but only keeps a counter of segment
+    hashes, so the documents themselves can still be streamed afterwards.
+    """
+
+    def __init__(self, min_documents: int = BOILERPLATE_MIN_DOCUMENTS, min_fraction: float = BOILERPLATE_MIN_FRACTION):
+        self.min_documents = min_documents
+        self.min_fraction = min_fraction
+        self.document_frequency: Counter = Counter()
+        self.documents = 0
+
+    def fit(self, documents: Iterable[Dict]) -> "BoilerplateFilter":
+        for document in documents:
+            self.documents += 1
+            self.document_frequency.update({
+                _segment_key(segment)
+                for line in split_segments(document["text"]) for segment in line if segment.strip()
+            })
+        return self
+
+    @property
+    def cutoff(self) -> int:
+        return max(self.min_documents, int(self.documents * self.min_fraction))
+
+    def strip(self, text: str) -> Tuple[str, List[str]]:
+        """Return the text without boilerplate segments, plus the segments removed"""
+        cutoff = self.cutoff
+        kept_lines, removed = [], []
+        for line in split_segments(text):
+            kept = []
+            for segment in line:
+                if segment.strip() and self.document_frequency[_segment_key(segment)] >= cutoff:
+                    removed.append(segment)
+                else:
+                    kept.append(segment)
+            kept_lines.append(' '.join(kept))
+        return '\n'.join(kept_lines), removed
+
+
+class NearDuplicateFilter:
+    """Streaming MinHash/LSH detector for near-duplicate chunks; the first copy seen is kept"""
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, num_permutations: int = NUM_PERMUTATIONS,
+                 bands: int = LSH_BANDS, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        if num_permutations % bands:
+            raise ValueError("num_permutations must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.shingle_size = shingle_size
+        # Shingle hashes are 32-bit, so a * x + b stays below 2**64 before the modulo
+        self._a = rng.integers(1, 1 << 32, size=num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_permutations, dtype=np.uint64)
+        self._buckets: Dict[Tuple[str, int, bytes], List[str]] = defaultdict(list)
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def check(self, key: str, text: str, partition: str = "") -> Optional[str]:
+        """Return the key of an earlier near-duplicate of text in the same partition, or remember text and return None"""
+        signature = self.signature(text)
+        bands = [(partition, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+        candidates = {candidate for band in bands for candidate in self._buckets.get(band, ())}
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return candidate
+        self._signatures[key] = signature
+        for band in bands:
+            self._buckets[band].append(key)
+        return None
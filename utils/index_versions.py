@@ -0,0 +1,272 @@
+"""Blue/green builds of the knowledge base index.
+
+Every build goes into its own directory under <persist directory>/versions/
+and is only activated once a smoke query finds results in it. The CURRENT
+file names the active version and is replaced atomically, so readers see
+either the old index or the new one, never a half-built one. Earlier versions
+are kept for rollback.
+
+    python -m utils.index_versions build [data/cet_courses data/partnerships] [--backend numpy] [--no-activate]
+    python -m utils.index_versions list
+    python -m utils.index_versions rollback
+    python -m utils.index_versions activate <version>
+
+Running apps pick up a newly activated version within VERSION_CHECK_SECONDS
+(see utils/knowledge_base.py).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from utils.vector_store import (
+    PERSIST_DIRECTORIES, VECTOR_BACKEND, DATA_DIRECTORIES, UPSERT_BATCH_SIZE,
+    IngestProgress, build_vectorstore, open_vectorstore, get_retriever
+)
+from utils.bm25 import BM25_FILENAME
+
+VERSIONS_DIRECTORY = "versions"
+CURRENT_FILENAME = "CURRENT"
+VERSION_FILENAME = "version.json"
+# Validated versions kept on disk, the active one included
+KEEP_VERSIONS = 3
+# A build directory without version.json this old was left by a crashed build
+STALE_BUILD_SECONDS = 3600
+
+# Each must return at least one chunk from a new version before it is activated
+SMOKE_QUERIES = [
+    "What courses does Temasek Polytechnic offer?",
+    "How can my company partner with Temasek Polytechnic?",
+]
+# A rebuild that loses more than half the chunks of the active version is
+# more likely a broken scrape than a real change
+MIN_CHUNK_RATIO = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class IndexValidationError(Exception):
+    """A newly built index failed validation and was not activated"""
+
+
+def version_directory(root: str, version: str) -> str:
+    return str(Path(root) / VERSIONS_DIRECTORY / version)
+
+def read_version(root: str, version: str) -> Optional[Dict]:
+    """Metadata of a validated version, or None if it is missing or unfinished"""
+    try:
+        with open(Path(version_directory(root, version)) / VERSION_FILENAME, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _write_json_atomic(path: Path, data):
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def current_version(root: str) -> Optional[str]:
+    """The active version, or None before the first blue/green build"""
+    try:
+        return json.loads((Path(root) / CURRENT_FILENAME).read_text(encoding='utf-8'))["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def list_versions(root: str) -> List[Dict]:
+    """Validated versions, oldest first"""
+    versions_path = Path(root) / VERSIONS_DIRECTORY
+    if not versions_path.is_dir():
+        return []
+    versions = [read_version(root, path.name) for path in versions_path.iterdir() if path.is_dir()]
+    return sorted((version for version in versions if version), key=lambda version: version["created"])
+
+def activate(root: str, version: str):
+    """Make version the active index; the pointer is swapped atomically"""
+    if read_version(root, version) is None:
+        raise ValueError(f"No validated index version {version!r} in {root}")
+    _write_json_atomic(Path(root) / CURRENT_FILENAME, {"version": version, "activated": time.time()})
+    logger.info(f"Activated index version {version}")
+
+def previous_version(root: str) -> Optional[str]:
+    """The newest validated version older than the active one"""
+    versions = list_versions(root)
+    names = [version["version"] for version in versions]
+    current = current_version(root)
+    older = versions[:names.index(current)] if current in names else versions
+    return older[-1]["version"] if older else None
+
+def rollback(root: str) -> str:
+    """Reactivate the version before the active one and return its name"""
+    version = previous_version(root)
+    if version is None:
+        raise ValueError(f"No earlier index version to roll back to in {root}")
+    activate(root, version)
+    return version
+
+def prune(root: str, keep: int = KEEP_VERSIONS) -> List[str]:
+    """Delete versions beyond the newest keep (never the active one) and stale failed builds"""
+    current = current_version(root)
+    validated = [version["version"] for version in list_versions(root)]
+    removed = [version for version in validated[:-keep] if version != current] if keep > 0 else []
+    versions_path = Path(root) / VERSIONS_DIRECTORY
+    if versions_path.is_dir():
+        for path in versions_path.iterdir():
+            if path.is_dir() and path.name not in validated and time.time() - path.stat().st_mtime > STALE_BUILD_SECONDS:
+                removed.append(path.name)
+    for version in removed:
+        shutil.rmtree(version_directory(root, version), ignore_errors=True)
+    return removed
+
+def count_chunks(vector_store) -> int:
+    return len(vector_store.get(include=[])["ids"])
+
+def validate(vector_store, persist_directory: str, minimum_chunks: int = 1) -> int:
+    """Smoke-test an index before it goes live; returns its chunk count"""
+    chunks = count_chunks(vector_store)
+    if chunks < max(1, minimum_chunks):
+        raise IndexValidationError(f"Index has {chunks} chunks, expected at least {max(1, minimum_chunks)}")
+    # Plain hybrid search: this checks the index, not the context compressor
+    retriever = get_retriever(vector_store, persist_directory, compress=False)
+    for query in SMOKE_QUERIES:
+        if not retriever.invoke(query):
+            raise IndexValidationError(f"Smoke query returned nothing: {query!r}")
+    return chunks
+
+def _seed(root: str, persist_directory: str, backend: str, seed_from: Optional[str]) -> Optional[str]:
+    """Start a build from a copy of a working version, so only changed chunks are written.
+
+    Nothing writes to a version once it is validated: the app and the
+    retrieval service only query it, and SQLite readers leave the database
+    file as it is, so a served version can be copied. The copy's BM25 index is
+    left out and rebuilt from the chunks, and a version that does not open
+    and count its chunks is not copied at all. Returns the version copied, or
+    None to start empty.
+    """
+    metadata = read_version(root, seed_from or "")
+    if metadata is None or metadata["backend"] != backend:
+        return None
+    try:
+        count_chunks(open_version(root, seed_from))
+    except Exception:
+        logger.exception(f"Not seeding from index version {seed_from}, it does not open; building from scratch")
+        return None
+    shutil.copytree(version_directory(root, seed_from), persist_directory,
+                    ignore=shutil.ignore_patterns(VERSION_FILENAME, BM25_FILENAME))
+    return seed_from
+
+def build(root: Optional[str] = None, directories: Iterable[str] = DATA_DIRECTORIES,
+          progress: Optional[IngestProgress] = None, batch_size: int = UPSERT_BATCH_SIZE,
+          backend: str = VECTOR_BACKEND, dedup: bool = True, activate_version: bool = True,
+          seed_from: Optional[str] = None) -> str:
+    """Build a new index version next to the active one, validate it and (by default) activate it.
+
+    The build starts from a copy of seed_from (the active version by default,
+    "" for none) and syncs it with the data, so progress reports real changes
+    and only changed chunks are written. A build that fails or does not
+    validate is deleted and the active version stays.
+    """
+    root = root or PERSIST_DIRECTORIES[backend]
+    directories = list(directories)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    persist_directory = version_directory(root, version)
+    start = time.perf_counter()
+    try:
+        seeded_from = _seed(root, persist_directory, backend, current_version(root) if seed_from is None else seed_from)
+        vector_store = build_vectorstore(persist_directory, directories, progress, batch_size, backend, dedup)
+        active = current_version(root)
+        active_chunks = (read_version(root, active) or {}).get("chunks", 0) if active else 0
+        chunks = validate(vector_store, persist_directory, int(active_chunks * MIN_CHUNK_RATIO))
+    except BaseException:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+        raise
+    # version.json is written last: only validated builds have one
+    _write_json_atomic(Path(persist_directory) / VERSION_FILENAME, {
+        "version": version,
+        "backend": backend,
+        "created": time.time(),
+        "chunks": chunks,
+        "directories": directories,
+        "seeded_from": seeded_from,
+        "build_seconds": time.perf_counter() - start,
+    })
+    logger.info(f"Built index version {version} with {chunks} chunks")
+    if activate_version:
+        activate(root, version)
+    return version
+
+def open_version(root: str, version: str):
+    """Open a built version with the backend it was built with"""
+    metadata = read_version(root, version)
+    if metadata is None:
+        raise ValueError(f"No validated index version {version!r} in {root}")
+    return open_vectorstore(version_directory(root, version), metadata["backend"])
+
+def is_stale(root: str, directories: Iterable[str] = DATA_DIRECTORIES) -> bool:
+    """True if no version is active or a data file changed after the active version was built"""
+    metadata = read_version(root, current_version(root) or "")
+    if metadata is None:
+        return True
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        # The directory's own mtime changes when files are added or removed
+        if os.stat(directory).st_mtime > metadata["created"]:
+            return True
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.stat().st_mtime > metadata["created"]:
+                return True
+    return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, list, activate or roll back knowledge base index versions")
+    parser.add_argument("--backend", choices=sorted(PERSIST_DIRECTORIES), default=VECTOR_BACKEND)
+    parser.add_argument("--root", help="Defaults to chroma_db or vector_index depending on the backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build and validate a new version, then activate it")
+    build_parser.add_argument("directories", nargs="*", default=DATA_DIRECTORIES, help="Directories of scraped JSON documents")
+    build_parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE)
+    build_parser.add_argument("--no-dedup", action="store_true")
+    build_parser.add_argument("--no-activate", action="store_true", help="Build and validate only")
+    commands.add_parser("list", help="List validated versions")
+    commands.add_parser("rollback", help="Reactivate the previous version")
+    activate_parser = commands.add_parser("activate", help="Activate a specific version")
+    activate_parser.add_argument("version")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    root = args.root or PERSIST_DIRECTORIES[args.backend]
+    try:
+        if args.command == "build":
+            progress = IngestProgress(lambda p: logger.info(p.summary()))
+            version = build(root, args.directories, progress, args.batch_size, args.backend,
+                            not args.no_dedup, not args.no_activate)
+            for error in progress.errors:
+                logger.error(error)
+            print(f"Built index version {version}: {progress.summary()}")
+            prune(root)
+        elif args.command == "list":
+            current = current_version(root)
+            for version in list_versions(root):
+                marker = "*" if version["version"] == current else " "
+                created = datetime.fromtimestamp(version["created"]).isoformat(timespec='seconds')
+                print(f"{marker} {version['version']}  {created}  {version['chunks']} chunks  {version['backend']}")
+        elif args.command == "rollback":
+            print(f"Rolled back to index version {rollback(root)}")
+        else:
+            activate(root, args.version)
+            print(f"Activated index version {args.version}")
+    except (IndexValidationError, ValueError) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,154 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List
+from helper_functions import llm, tracing
 
-from crewai import Agent, Task, Crew
-from langchain_openai import ChatOpenAI
+LABELS = ('adult_learner', 'industrial_partner', 'general question')
+
+# Corpora that describe what each audience asks about
+CORPUS_DIRECTORIES = {
+    'adult_learner': 'data/cet_courses',
+    'industrial_partner': 'data/partnerships',
+}
+
+# Hand-picked vocabulary that anchors each label, mirroring the crew's instructions
+SEED_KEYWORDS = {
+    'adult_learner': """course courses training train learn learning learner skills skill upskill reskill
+        skillsfuture certificate certification diploma module modules fee fees subsidy subsidies funding enrol
+        enroll enrolment registration register class classes part-time adult career workshop programme
+        program syllabus prerequisite prerequisites lesson lessons cet study""",
+    'industrial_partner': """partner partners partnership partnerships collaborate collaboration collaborations
+        industry industrial company companies business businesses enterprise enterprises project projects
+        research joint internship internships sponsor sponsorship consultancy innovation solutions
+        co-develop develop mou attachment hire hiring talent""",
+    'general question': """campus location address where open house hours contact email phone library
+        canteen food parking bus mrt directions map admission admissions polytechnic school schools
+        student students principal history facilities weather hello hi thanks""",
+}
+
+# Minimum probability the local classifier needs before we skip the LLM
+CONFIDENCE_THRESHOLD = 0.5
+CACHE_SIZE = 1024
+
+STOPWORDS = set("""a an and are as at be by can do does for from how i in is it me my of on or our
+    the this to what when which who will with you your we us about any there their they tp temasek""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9][a-z0-9\-]*", text.lower()) if token not in STOPWORDS]
+
+def _load_corpus(directory_path: str) -> List[str]:
+    """Text of every scraped document in a directory, JSON files and dataset.jsonl alike"""
+    # Read with the ingestion pipeline's reader so both see the same documents
+    from utils.vector_store import iter_documents
+    return [document["text"] for document in iter_documents([directory_path])]
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {term: value / norm for term, value in vector.items()} if norm else {}
+
+
+class LocalIntentClassifier:
+    """TF-IDF centroid classifier built from the scraped corpora and seed keywords"""
+
+    def __init__(self, seed_weight: float = 1.0, temperature: float = 20.0):
+        self.temperature = temperature
+        class_docs = {label: [tokenize(text) for text in _load_corpus(directory)]
+                      for label, directory in CORPUS_DIRECTORIES.items()}
+        seeds = {label: tokenize(text) for label, text in SEED_KEYWORDS.items()}
+
+        all_docs = [doc for docs in class_docs.values() for doc in docs] + list(seeds.values())
+        document_frequency = Counter(term for doc in all_docs for term in set(doc))
+        self.idf = {term: math.log((1 + len(all_docs)) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        self.centroids = {}
+        for label in LABELS:
+            centroid = Counter()
+            docs = class_docs.get(label, [])
+            for doc in docs:
+                for term, value in self._vectorize(doc).items():
+                    centroid[term] += value / len(docs)
+            # Seeds weigh as much as the whole corpus so short queries hit them
+            for term, value in self._vectorize(seeds[label]).items():
+                centroid[term] += seed_weight * value
+            self.centroids[label] = _normalize(centroid)
+
+    def _vectorize(self, tokens: List[str]) -> Dict[str, float]:
+        counts = Counter(token for token in tokens if token in self.idf)
+        return _normalize({term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items()})
+
+    def predict(self, query: str):
+        """Return (label, confidence) where confidence is a softmax over centroid similarities"""
+        vector = self._vectorize(tokenize(query))
+        if not vector:
+            return 'general question', 0.0
+        similarities = {label: sum(value * centroid.get(term, 0.0) for term, value in vector.items())
+                        for label, centroid in self.centroids.items()}
+        exps = {label: math.exp(self.temperature * sim) for label, sim in similarities.items()}
+        total = sum(exps.values())
+        label = max(exps, key=exps.get)
+        return label, exps[label] / total
+
+
+class IntentClassifier:
+    """Local fast path with an LRU cache, falling back to the CrewAI crew when unsure"""
+
+    def __init__(self, threshold: float = CONFIDENCE_THRESHOLD, cache_size: int = CACHE_SIZE):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.local = LocalIntentClassifier()
+        self._crew_classify = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "cache_hits": 0, "local": 0, "llm_fallbacks": 0}
+
+    @property
+    def fallback_rate(self) -> float:
+        classified = self.stats["local"] + self.stats["llm_fallbacks"]
+        return self.stats["llm_fallbacks"] / classified if classified else 0.0
+
+    def _llm_classify(self, query: str) -> str:
+        if self._crew_classify is None:
+            self._crew_classify = create_intent_classification_crew()
+        answer = self._crew_classify(query).strip().strip('\'"`.').lower()
+        return answer if answer in LABELS else 'general question'
+
+    def __call__(self, query: str) -> str:
+        key = ' '.join(query.lower().split())
+        with self._lock:
+            self.stats["calls"] += 1
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self._cache[key]
+
+        label, confidence = self.local.predict(query)
+        if confidence >= self.threshold:
+            counter = "local"
+        else:
+            with tracing.span("intent.llm_fallback", confidence=confidence):
+                label = self._llm_classify(query)
+            counter = "llm_fallbacks"
+
+        with self._lock:
+            self.stats[counter] += 1
+            self._cache[key] = label
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return label
+
+def create_intent_classifier(threshold: float = CONFIDENCE_THRESHOLD) -> IntentClassifier:
+    """Create the fast local intent classifier with CrewAI fallback"""
+    return IntentClassifier(threshold=threshold)
 
 def create_intent_classification_crew():
     """Create CrewAI crew for intent classification"""
+    # CrewAI takes seconds to import and is only needed for the rare LLM fallback
+    from helper_functions.sqlite_compat import use_pysqlite3
+    use_pysqlite3()
+    from crewai import Agent, Task, Crew
     intent_classifier = Agent(
         role='Intent Classifier',
         goal='Accurately classify user queries as either CET course-related or industrial partnership-related or general-question',
@@ -14,7 +156,7 @@ def create_intent_classification_crew():
         You have deep knowledge of both educational courses and industrial partnerships.""",
         verbose=True,
         allow_delegation=False,
-        llm=ChatOpenAI(model_name="gpt-4o-mini", temperature=0)
+        llm=llm.get_chat_model()
     )
     
     def classify_intent(query: str) -> str:
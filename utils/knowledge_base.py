@@ -0,0 +1,276 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+from langchain_core.documents import Document
+from utils import vector_store
+from utils.vector_store import PERSIST_DIRECTORY, get_audience_retrievers, IngestProgress
+from utils.chat_chain import create_answer_chain, create_contextualize_chain
+from utils.intent_classifier import create_intent_classifier, LABELS
+from utils.semantic_cache import SemanticCache
+from utils import index_versions
+from utils import retrieval_service
+from helper_functions import llm as llm_client
+from helper_functions import rate_limit
+
+# How often requests check whether another process activated a new index version
+VERSION_CHECK_SECONDS = 5
+
+# Process-wide resources shared by every Streamlit session. Module globals live
+# as long as the server process, so only chat history needs to be per session.
+_lock = threading.RLock()
+# The active index version with its store and retrievers. A swap replaces the
+# whole dict in one assignment, so a request that already holds it finishes
+# on the old version while the next one sees the new.
+_index: Optional[Dict] = None
+_answer_chains = {}
+_pipeline = {}
+_intent_classifier = None
+_semantic_cache = SemanticCache()
+
+# Shared retrieval service replicas send dense searches to; None searches in process
+_retrieval_service_url: Optional[str] = retrieval_service.SERVICE_URL
+
+_swap_lock = threading.Lock()
+# Versions that could not be opened; activating them elsewhere is not retried until reset()
+_failed_versions = set()
+_rebuild_thread: Optional[threading.Thread] = None
+rebuild_status: Dict = {"state": "idle", "version": None, "seconds": None, "error": None}
+
+logger = logging.getLogger(__name__)
+
+def _get_llm():
+    """One chat model client shared by every chain"""
+    return llm_client.get_chat_model()
+
+def _log_progress() -> IngestProgress:
+    return IngestProgress(lambda p: logger.info(p.summary()))
+
+def _open_index(version: str) -> Dict:
+    """Open an index version and build its retrievers, off the request path"""
+    persist_directory = index_versions.version_directory(PERSIST_DIRECTORY, version)
+    index = {"version": version, "vector_store": None, "checked": time.monotonic()}
+    if not _retrieval_service_url:
+        _local_vectorstore(index)
+    # Dense searches from every session are micro-batched, or sent to the shared
+    # service, in which case the local store is only opened if it is unreachable
+    service = retrieval_service.connect(_retrieval_service_url, lambda: _local_vectorstore(index))
+    index.update({
+        "service": service,
+        # Loading the BM25 index here also fails fast on a damaged version
+        "retrievers": get_audience_retrievers(index["vector_store"], LABELS, persist_directory, service=service),
+    })
+    return index
+
+def _local_vectorstore(index: Dict):
+    """The version's vector store in this process, opened on first use"""
+    if index["vector_store"] is None:
+        with _lock:
+            if index["vector_store"] is None:
+                index["vector_store"] = index_versions.open_version(PERSIST_DIRECTORY, index["version"])
+    return index["vector_store"]
+
+def _load_index() -> Dict:
+    """Open the active version, falling back to the previous one if it cannot be opened.
+
+    Replicas using a shared retrieval service never build a version; the
+    service does.
+    """
+    version = index_versions.current_version(PERSIST_DIRECTORY)
+    if version is None:
+        if _retrieval_service_url:
+            raise RuntimeError(f"No index version in {PERSIST_DIRECTORY} yet: start the retrieval service "
+                               f"at {_retrieval_service_url} first, it builds the first one")
+        # Nothing to serve yet, so the first build has to be waited for
+        version = index_versions.build(PERSIST_DIRECTORY, progress=_log_progress())
+    try:
+        return _open_index(version)
+    except Exception:
+        logger.exception(f"Could not open index version {version}")
+        _failed_versions.add(version)
+        previous = index_versions.previous_version(PERSIST_DIRECTORY)
+        if previous is None:
+            if _retrieval_service_url:
+                raise
+            # Not from a copy of the version that just failed
+            return _open_index(index_versions.build(PERSIST_DIRECTORY, progress=_log_progress(), seed_from=""))
+        # Serve the previous version while a replacement, seeded from it, is built in the background
+        index = _open_index(previous)
+        if not _retrieval_service_url:
+            rebuild_index(seed_from=previous)
+        return index
+
+def _get_index() -> Dict:
+    index = _index
+    if index is None:
+        with _lock:
+            if _index is None:
+                _set_index(_load_index())
+            index = _index
+    elif time.monotonic() - index["checked"] > VERSION_CHECK_SECONDS:
+        index["checked"] = time.monotonic()
+        version = index_versions.current_version(PERSIST_DIRECTORY)
+        if version is not None and version != index["version"] and version not in _failed_versions:
+            # Activated elsewhere (CLI or another server process): swap without making this request wait
+            threading.Thread(target=_swap_quietly, args=(version,), name="index-swap", daemon=True).start()
+    return index
+
+def _set_index(index: Dict):
+    global _index
+    with _lock:
+        _index = index
+        # Cached answers may cite chunks that are not in this version
+        _semantic_cache.invalidate()
+
+def _swap_quietly(version: str):
+    if not _swap_lock.acquire(blocking=False):
+        return
+    try:
+        if _index is None or _index["version"] != version:
+            _set_index(_open_index(version))
+            logger.info(f"Now serving index version {version}")
+    except Exception:
+        logger.exception(f"Could not swap to index version {version}; not retrying it")
+        _failed_versions.add(version)
+    finally:
+        _swap_lock.release()
+
+def swap_index(version: str):
+    """Serve another index version to every session without restarting or blocking requests"""
+    index = _open_index(version)
+    with _swap_lock:
+        _set_index(index)
+        _failed_versions.discard(version)
+    logger.info(f"Now serving index version {version}")
+
+def _rebuild(seed_from: Optional[str]):
+    start = time.perf_counter()
+    rebuild_status.update(state="running", error=None)
+    try:
+        version = index_versions.build(PERSIST_DIRECTORY, progress=_log_progress(), seed_from=seed_from)
+        swap_index(version)
+        index_versions.prune(PERSIST_DIRECTORY)
+        rebuild_status.update(state="done", version=version)
+    except Exception as e:
+        # The active version keeps serving
+        logger.exception("Index rebuild failed")
+        rebuild_status.update(state="failed", error=f"{type(e).__name__}: {e}")
+    rebuild_status["seconds"] = time.perf_counter() - start
+
+def rebuild_index(seed_from: Optional[str] = None) -> threading.Thread:
+    """Build, validate and swap in a new index version in the background; one build at a time.
+
+    The build is seeded from seed_from, by default the version being served,
+    never from one that failed to open.
+    """
+    global _rebuild_thread
+    with _lock:
+        if _rebuild_thread is None or not _rebuild_thread.is_alive():
+            if seed_from is None:
+                seed_from = _index["version"] if _index is not None else ""
+            if seed_from in _failed_versions:
+                seed_from = ""
+            _rebuild_thread = threading.Thread(target=_rebuild, args=(seed_from,), name="index-rebuild", daemon=True)
+            _rebuild_thread.start()
+        return _rebuild_thread
+
+def rollback_index() -> str:
+    """Reactivate the previous index version and serve it to every session"""
+    version = index_versions.rollback(PERSIST_DIRECTORY)
+    swap_index(version)
+    return version
+
+def use_local_retrieval():
+    """Search in process whatever RETRIEVAL_SERVICE_URL says; the retrieval service itself runs this way"""
+    global _retrieval_service_url
+    with _lock:
+        _retrieval_service_url = None
+        if _index is not None and _index["service"] is not None and hasattr(_index["service"], "url"):
+            # Reopen on the next request without the remote client
+            reset()
+
+def get_index_version() -> str:
+    """Name of the index version being served"""
+    return _get_index()["version"]
+
+def get_retrieval_service():
+    """Return the service batching dense searches over the active version, or None if batching is off"""
+    return _get_index()["service"]
+
+def get_vectorstore():
+    """Return the shared vector store, initializing it on first use"""
+    return _local_vectorstore(_get_index())
+
+def get_documents(chunk_ids: List[str]) -> List[Document]:
+    """Chunks of the active version by ID, from the shared retrieval service if there is one"""
+    index = _get_index()
+    if index["service"] is not None:
+        return index["service"].get_documents(chunk_ids)
+    return vector_store.get_documents(_local_vectorstore(index), chunk_ids)
+
+def _build_pipeline():
+    """Build the per-stage chains used by pre_retrieve; they do not depend on the index"""
+    with _lock:
+        if not _pipeline:
+            llm = _get_llm()
+            _answer_chains.update({label: create_answer_chain(llm, label) for label in LABELS})
+            _pipeline.update({"contextualize_chain": create_contextualize_chain(llm)})
+
+def get_partitioned_retrievers():
+    """Return the shared retrievers per user type, each limited to its audience partition"""
+    return _get_index()["retrievers"]
+
+def get_contextualize_chain():
+    """Return the shared chain that rewrites follow-ups into standalone questions"""
+    if not _pipeline:
+        _build_pipeline()
+    return _pipeline["contextualize_chain"]
+
+def get_answer_chain(user_type: str):
+    """Return the prebuilt answer-generation chain for a user type"""
+    if not _pipeline:
+        _build_pipeline()
+    return _answer_chains.get(user_type, _answer_chains['general question'])
+
+def get_intent_classifier():
+    """Return the shared intent classifier, whose cache spans all sessions"""
+    global _intent_classifier
+    if _intent_classifier is None:
+        with _lock:
+            if _intent_classifier is None:
+                _intent_classifier = create_intent_classifier()
+    return _intent_classifier
+
+def get_semantic_cache() -> SemanticCache:
+    """Return the shared semantic answer cache"""
+    return _semantic_cache
+
+def warm_up():
+    """Build every shared resource ahead of the first question, without Streamlit output.
+
+    Meant for a background thread (see utils/warmup.py): a page that asks for
+    a resource still being built waits on the same lock instead of building it
+    twice. If the data changed since the active index was built, a new version
+    is built in the background while the current one serves.
+    """
+    _get_index()
+    # With a shared retrieval service, the service rebuilds instead
+    if not _retrieval_service_url and index_versions.is_stale(PERSIST_DIRECTORY):
+        rebuild_index()
+    get_intent_classifier()
+    _build_pipeline()
+    llm_client.get_encoding()
+    # One search opens the embedding cache and the HTTP connection and pages in the index
+    with rate_limit.client_context(session="warmup", priority=rate_limit.BACKGROUND):
+        get_partitioned_retrievers()['general question'].invoke("What courses does Temasek Polytechnic offer?")
+
+def reset():
+    """Drop the shared store and chains so the next request reopens them"""
+    global _index
+    with _lock:
+        _index = None
+        _failed_versions.clear()
+        _answer_chains.clear()
+        _pipeline.clear()
+        # Cached answers may cite chunks that no longer exist
+        _semantic_cache.invalidate()
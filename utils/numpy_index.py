@@ -0,0 +1,279 @@
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+INDEX_FILENAME = "index.json"
+VECTORS_FILENAME = "vectors.npy"
+SCALES_FILENAME = "scales.npy"
+INDEX_VERSION = 1
+
+# Storage options: int8 keeps a quarter of the float32 RAM, and text-embedding-3
+# vectors can be truncated to a prefix of their dimensions and renormalized
+DEFAULT_DTYPE = os.getenv('VECTOR_INDEX_DTYPE', 'float32')
+DEFAULT_DIMENSIONS = int(os.getenv('VECTOR_INDEX_DIMENSIONS', '0')) or None
+
+# Rows scored per block, so int8 search never materializes a full float32 copy
+SEARCH_BLOCK_ROWS = 8192
+
+def _normalize(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    if dimensions:
+        vectors = vectors[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization, returning (codes, scales)"""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _matches(metadata: Dict, filter: Dict) -> bool:
+    """Chroma-style equality filters, plus {"key": {"$in": [...]}} and "$and"/"$or" lists"""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine search over a memory-mapped matrix of normalized embeddings.
+
+    Embeddings are stored as one .npy file (float32, or int8 with per-row
+    scales) that is memory-mapped on open, so loading costs no more than
+    reading the small JSON sidecar of ids, texts and metadata. A query is a
+    single matrix-vector product followed by a top-k partition.
+
+    Writes (add_texts/delete) happen in memory; call save() to persist them.
+    """
+
+    def __init__(self, embedding_function: Embeddings, persist_directory: Optional[str] = None,
+                 dtype: str = DEFAULT_DTYPE, dimensions: Optional[int] = DEFAULT_DIMENSIONS):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported vector index dtype: {dtype}")
+        self._embedding = embedding_function
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        self.dimensions = dimensions
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = None
+        self._scales = None
+        self._masks: Dict[str, np.ndarray] = {}
+        if persist_directory and (Path(persist_directory) / INDEX_FILENAME).exists():
+            self._load(persist_directory)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of vector storage, the part that scales with the corpus"""
+        if self._vectors is None:
+            return 0
+        return self._vectors.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    def _load(self, persist_directory: str):
+        directory = Path(persist_directory)
+        with open(directory / INDEX_FILENAME, 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        if index.get("version") != INDEX_VERSION:
+            # Opening it empty would let a sync trust a manifest that lists every chunk as stored
+            raise ValueError(f"Vector index in {directory} has format version {index.get('version')}, "
+                             f"expected {INDEX_VERSION}; rebuild it")
+        self.dtype = index["dtype"]
+        self.dimensions = index["dimensions"]
+        self.ids = index["ids"]
+        self.texts = index["texts"]
+        self.metadatas = index["metadatas"]
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        if self.ids:
+            self._vectors = np.load(directory / VECTORS_FILENAME, mmap_mode='r')
+            if self.dtype == "int8":
+                self._scales = np.load(directory / SCALES_FILENAME)
+
+    def save(self, persist_directory: Optional[str] = None):
+        """Write vectors and the JSON sidecar, replacing each file atomically"""
+        directory = Path(persist_directory or self.persist_directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def replace(name, write):
+            tmp_path = directory / f"{name}.tmp"
+            with open(tmp_path, 'wb') as file:
+                write(file)
+            os.replace(tmp_path, directory / name)
+
+        if self._vectors is not None:
+            replace(VECTORS_FILENAME, lambda file: np.save(file, np.ascontiguousarray(self._vectors)))
+            if self._scales is not None:
+                replace(SCALES_FILENAME, lambda file: np.save(file, self._scales))
+        index = {
+            "version": INDEX_VERSION, "dtype": self.dtype, "dimensions": self.dimensions,
+            "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas,
+        }
+        replace(INDEX_FILENAME, lambda file: file.write(json.dumps(index).encode('utf-8')))
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32), self.dimensions)
+        if self.dtype == "int8":
+            return quantize(vectors)
+        return vectors, None
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed and upsert texts; existing ids are overwritten in place"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"{len(self.ids) + i}" for i in range(len(texts))]
+        rows, scales = self._encode(np.array(self._embedding.embed_documents(texts), dtype=np.float32))
+
+        # A memory-mapped matrix is read-only, so the first write copies it into RAM
+        if self._vectors is not None and not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors)
+
+        new_rows = []
+        for row, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            position = self._positions.get(chunk_id)
+            if position is None:
+                self._positions[chunk_id] = len(self.ids)
+                self.ids.append(chunk_id)
+                self.texts.append(text)
+                self.metadatas.append(metadata or {})
+                new_rows.append(row)
+            else:
+                self.texts[position] = text
+                self.metadatas[position] = metadata or {}
+                self._vectors[position] = rows[row]
+                if scales is not None:
+                    self._scales[position] = scales[row]
+
+        if new_rows:
+            if self._vectors is None:
+                self._vectors, self._scales = rows[new_rows], (scales[new_rows] if scales is not None else None)
+            else:
+                self._vectors = np.concatenate([self._vectors, rows[new_rows]])
+                if scales is not None:
+                    self._scales = np.concatenate([self._scales, scales[new_rows]])
+        self._masks.clear()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        removed = {self._positions[chunk_id] for chunk_id in ids or [] if chunk_id in self._positions}
+        if not removed:
+            return False
+        keep = [position for position in range(len(self.ids)) if position not in removed]
+        self.ids = [self.ids[position] for position in keep]
+        self.texts = [self.texts[position] for position in keep]
+        self.metadatas = [self.metadatas[position] for position in keep]
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        self._vectors = self._vectors[keep] if keep else None
+        if self._scales is not None:
+            self._scales = self._scales[keep] if keep else None
+        self._masks.clear()
+        return True
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs: Any) -> Dict:
+        """Chroma-compatible subset of get(), enough for the ingestion pipeline"""
+        positions = range(len(self.ids)) if ids is None else [self._positions[i] for i in ids if i in self._positions]
+        result = {"ids": [self.ids[position] for position in positions]}
+        include = ["documents", "metadatas"] if include is None else include
+        if "documents" in include:
+            result["documents"] = [self.texts[position] for position in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[position] for position in positions]
+        return result
+
+    def _mask(self, filter: Dict) -> np.ndarray:
+        # Masks are cached per filter, since the app only ever uses a handful of them
+        key = json.dumps(filter, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((_matches(metadata, filter) for metadata in self.metadatas), dtype=bool, count=len(self.metadatas))
+            self._masks[key] = mask
+        return mask
+
+    def search_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None) -> List[Tuple[int, float]]:
+        """Top-k (position, cosine similarity) pairs for a query embedding"""
+        return self.search_vectors([embedding], k, filter)[0]
+
+    def search_vectors(self, embeddings: List[List[float]], k: int = 4, filter: Optional[Dict] = None) -> List[List[Tuple[int, float]]]:
+        """search_vector() for many queries at once: one pass over the matrix scores them all"""
+        if self._vectors is None or k <= 0 or not len(embeddings):
+            return [[] for _ in embeddings]
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32), self.dimensions).T
+        if self.dtype == "int8":
+            scores = np.concatenate([
+                self._vectors[start:start + SEARCH_BLOCK_ROWS].astype(np.float32) @ queries
+                for start in range(0, len(self._vectors), SEARCH_BLOCK_ROWS)
+            ]) * self._scales[:, None]
+        else:
+            scores = self._vectors @ queries
+
+        if filter:
+            scores = np.where(self._mask(filter)[:, None], scores, -np.inf)
+        k = min(k, len(scores))
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append([(int(position), float(column[position])) for position in top if column[position] != -np.inf])
+        return results
+
+    def _document(self, position: int) -> Document:
+        return Document(page_content=self.texts[position], metadata=self.metadatas[position])
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._document(position), score) for position, score in self.search_vector(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 4, filter: Optional[Dict] = None) -> List[List[Document]]:
+        return [[self._document(position) for position, _ in hits] for hits in self.search_vectors(embeddings, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory: Optional[str] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding, persist_directory=persist_directory, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        if persist_directory:
+            store.save()
+        return store
@@ -0,0 +1,310 @@
+"""Micro-batched dense retrieval shared by every session.
+
+Concurrent searches are held for up to BATCH_WINDOW_MS and then served
+together: the distinct queries are embedded in one call and searched with one
+batched query per (k, filter). Each search waits at most the window, and under
+load there are far fewer embedding calls.
+
+The service runs inside the app process by default. Several Streamlit
+replicas can instead share one on localhost, so only it loads the dense index:
+
+    python -m utils.retrieval_service serve [--port 8765]
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:8765 streamlit run Home.py
+
+Replicas still search their own BM25 index, and read index versions from
+the shared persist directory without building any; the service builds them.
+A replica opens its local copy of the dense index only if the service cannot
+be reached.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import contextvars
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from pydantic import ConfigDict
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from helper_functions import tracing
+from helper_functions import rate_limit
+
+# How long a search waits for others to share its batch; 0 searches directly
+BATCH_WINDOW_MS = float(os.getenv('RETRIEVAL_BATCH_WINDOW_MS', '5'))
+MAX_BATCH_SIZE = int(os.getenv('RETRIEVAL_MAX_BATCH_SIZE', '32'))
+# Set to share one service between replicas, e.g. http://127.0.0.1:8765
+SERVICE_URL = os.getenv('RETRIEVAL_SERVICE_URL')
+DEFAULT_PORT = 8765
+REMOTE_TIMEOUT_SECONDS = 10
+# The dispatcher thread exits after this long without searches and restarts on demand
+IDLE_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+class _Search:
+    __slots__ = ("query", "k", "filter", "priority", "context", "future", "batch_size")
+
+    def __init__(self, query: str, k: int, filter: Optional[Dict]):
+        self.query = query
+        self.k = k
+        self.filter = filter
+        self.priority = rate_limit.current_priority()
+        # The batch's embedding call runs in one caller's context, keeping its trace and rate-limit session
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.batch_size = 1
+
+
+class RetrievalService:
+    """Collects concurrent dense searches over one vector store and serves them in batches"""
+
+    def __init__(self, vector_store, window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.vector_store = vector_store
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = {"searches": 0, "batches": 0, "max_batch_size": 0}
+        self._queue: "queue.Queue[_Search]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        """Top-k documents for query; blocks for at most the batch window plus the batch itself"""
+        request = _Search(query, k, filter)
+        with tracing.span("retrieval.batched_search") as span:
+            self._queue.put(request)
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+                    self._thread.start()
+            documents = request.future.result()
+            span.set(batch_size=request.batch_size)
+        return documents
+
+    def get_documents(self, chunk_ids: List[str]) -> List[Document]:
+        """Chunks by ID, in the order given"""
+        from utils.vector_store import get_documents
+        return get_documents(self.vector_store, chunk_ids)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=IDLE_SECONDS)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._serve(batch)
+
+    def _serve(self, batch: List[_Search]):
+        queries = list(dict.fromkeys(request.query for request in batch))
+        # The batch queues for the rate limit at its most urgent caller's priority
+        lead = min(batch, key=lambda request: request.priority)
+        embeddings = self.vector_store.embeddings
+        # Query embeddings stay out of the on-disk document cache when the embeddings support it
+        embed = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        try:
+            vectors = dict(zip(queries, lead.context.run(embed, queries)))
+            groups: Dict[str, List[_Search]] = {}
+            for request in batch:
+                groups.setdefault(json.dumps([request.k, request.filter], sort_keys=True), []).append(request)
+            for requests in groups.values():
+                results = self._search_many([vectors[request.query] for request in requests], requests[0].k, requests[0].filter)
+                for request, documents in zip(requests, results):
+                    request.batch_size = len(batch)
+                    request.future.set_result(documents)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        self.stats["searches"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+
+    def _search_many(self, vectors: List[List[float]], k: int, filter: Optional[Dict]) -> List[List[Document]]:
+        store = self.vector_store
+        if hasattr(store, "similarity_search_by_vectors"):
+            return store.similarity_search_by_vectors(vectors, k, filter)
+        collection = getattr(store, "_collection", None)
+        if collection is not None:
+            # Chroma answers several query embeddings in one call
+            results = collection.query(query_embeddings=vectors, n_results=k, where=filter or None,
+                                       include=["documents", "metadatas"])
+            return [
+                [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+                for texts, metadatas in zip(results["documents"], results["metadatas"])
+            ]
+        return [store.similarity_search_by_vector(vector, k, filter=filter) for vector in vectors]
+
+
+class RemoteRetrievalService:
+    """Client for a retrieval service on localhost.
+
+    If the service is down, requests go to a local service created by
+    open_fallback, on first need only, so a replica does not load its own
+    copy of the dense index while the shared one is up.
+    """
+
+    def __init__(self, url: str, open_fallback: Optional[Callable[[], RetrievalService]] = None,
+                 timeout: float = REMOTE_TIMEOUT_SECONDS):
+        import httpx
+        self.url = url
+        self.open_fallback = open_fallback
+        self.client = httpx.Client(base_url=url, timeout=timeout)
+        self.stats = {"searches": 0, "fallbacks": 0}
+        self._fallback: Optional[RetrievalService] = None
+        self._lock = threading.Lock()
+
+    def _post(self, path: str, body: Dict) -> Optional[Dict]:
+        """The JSON response, or None if the service is unreachable and there is a fallback.
+
+        Error statuses are raised, not hidden behind the local index: a service
+        that answers is up, and its errors need fixing there.
+        """
+        import httpx
+        try:
+            with tracing.span("retrieval.remote", path=path):
+                response = self.client.post(path, json=body)
+                response.raise_for_status()
+            return response.json()
+        except httpx.TransportError as e:
+            if self.open_fallback is None:
+                raise
+            logger.warning(f"Retrieval service at {self.url} unavailable, using the local index: {e}")
+            self.stats["fallbacks"] += 1
+            return None
+
+    def fallback(self) -> RetrievalService:
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = self.open_fallback()
+            return self._fallback
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        self.stats["searches"] += 1
+        result = self._post("/search", {"query": query, "k": k, "filter": filter, "priority": rate_limit.current_priority()})
+        if result is None:
+            return self.fallback().search(query, k, filter)
+        return [Document(**document) for document in result["documents"]]
+
+    def get_documents(self, chunk_ids: List[str]) -> List[Document]:
+        if not chunk_ids:
+            return []
+        result = self._post("/documents", {"ids": list(chunk_ids)})
+        if result is None:
+            return self.fallback().get_documents(chunk_ids)
+        return [Document(**document) for document in result["documents"]]
+
+
+class BatchedRetriever(BaseRetriever):
+    """Dense retriever whose searches go through a (local or remote) retrieval service"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    service: Any
+    k: int = 4
+    filter: Optional[Dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.service.search(query, self.k, self.filter)
+
+def connect(service_url: Optional[str], open_vector_store: Callable[[], Any]):
+    """The service dense searches should go through, or None to search the vector store directly.
+
+    With a service_url, searches go to the shared service at that address and
+    open_vector_store is only called if it is unreachable.
+    """
+    if service_url:
+        return RemoteRetrievalService(service_url, open_fallback=lambda: RetrievalService(open_vector_store()))
+    if BATCH_WINDOW_MS <= 0:
+        return None
+    return RetrievalService(open_vector_store())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, status: int, body: Dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        from utils import knowledge_base
+        if self.path != "/health":
+            return self._send(404, {"error": "not found"})
+        self._send(200, {"version": knowledge_base.get_index_version(), **knowledge_base.get_retrieval_service().stats})
+
+    def do_POST(self):
+        from utils import knowledge_base
+        if self.path not in ("/search", "/documents"):
+            return self._send(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/documents":
+                documents = knowledge_base.get_documents(body["ids"])
+            else:
+                # The service follows index versions as they are activated, like the app does
+                service = knowledge_base.get_retrieval_service()
+                with rate_limit.client_context(priority=body.get("priority")):
+                    documents = service.search(body["query"], int(body.get("k", 4)), body.get("filter"))
+        except Exception as e:
+            logger.exception("Search failed")
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, {"documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in documents]})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Serve batched searches over the active index version; call serve_forever() on the result"""
+    from utils import knowledge_base
+    # This process is the service: it must search locally even if RETRIEVAL_SERVICE_URL
+    # is set, or it would forward every search to itself
+    knowledge_base.use_local_retrieval()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve micro-batched dense retrieval to app replicas")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = serve(args.host, args.port)
+    from utils import knowledge_base, index_versions
+    logger.info(f"Serving index version {knowledge_base.get_index_version()} on http://{args.host}:{server.server_port}")
+    # Replicas never build versions, so the service keeps the index current for them
+    if index_versions.is_stale(knowledge_base.PERSIST_DIRECTORY):
+        knowledge_base.rebuild_index()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
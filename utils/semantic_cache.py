@@ -0,0 +1,121 @@
+import time
+import threading
+from typing import List, Optional
+import numpy as np
+from helper_functions.embeddings import embed_texts
+from helper_functions import tracing
+
+# Cosine similarity above which two standalone questions count as the same
+SIMILARITY_THRESHOLD = 0.95
+TTL_SECONDS = 6 * 60 * 60
+MAX_ENTRIES = 1000
+
+
+class CacheEntry:
+    __slots__ = ("question", "vector", "answer", "source_documents", "created", "last_used", "latency")
+
+    def __init__(self, question, vector, answer, source_documents, latency):
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.source_documents = source_documents
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.latency = latency
+
+
+class SemanticCache:
+    """Answer cache keyed on the embedding of a standalone question, per user type.
+
+    Entries expire after ttl_seconds and the least recently used entry is
+    evicted once a user type holds max_entries. Lookups are one matrix-vector
+    product over the cached question embeddings.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, ttl_seconds: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._matrices = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(embed_texts([question], persist=False)[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, user_type: str):
+        entries = self._entries.get(user_type)
+        if not entries:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, entry in entries.items() if entry.created < cutoff]
+        for key in expired:
+            del entries[key]
+        if expired:
+            self._matrices.pop(user_type, None)
+
+    def lookup(self, user_type: str, question: str) -> Optional[CacheEntry]:
+        """Return the cached answer for a similar question, or None on a miss"""
+        with tracing.span("cache.lookup") as span:
+            entry = self._lookup(user_type, question)
+            span.set(hit=entry is not None)
+        return entry
+
+    def _lookup(self, user_type: str, question: str) -> Optional[CacheEntry]:
+        vector = self._embed(question)
+        with self._lock:
+            self._expire(user_type)
+            entries = self._entries.get(user_type)
+            if not entries:
+                self.misses += 1
+                return None
+
+            if user_type not in self._matrices:
+                keys = list(entries)
+                self._matrices[user_type] = (keys, np.stack([entries[key].vector for key in keys]))
+            keys, matrix = self._matrices[user_type]
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = entries[keys[best]]
+            entry.last_used = time.monotonic()
+            self.hits += 1
+            self.latency_saved += entry.latency
+            return entry
+
+    def store(self, user_type: str, question: str, answer: str, source_documents: List, latency: float):
+        """Remember an answer together with how long it took to produce"""
+        vector = self._embed(question)
+        key = ' '.join(question.lower().split())
+        with self._lock:
+            entries = self._entries.setdefault(user_type, {})
+            entries[key] = CacheEntry(question, vector, answer, source_documents, latency)
+            if len(entries) > self.max_entries:
+                # Evict the least recently used entry
+                del entries[min(entries, key=lambda k: entries[k].last_used)]
+            self._matrices.pop(user_type, None)
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the vector store has been rebuilt"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    @property
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved,
+            "entries": sum(len(entries) for entries in self._entries.values()),
+        }
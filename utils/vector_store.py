@@ -1,114 +1,443 @@
 import os
+import sys
+import hashlib
+import logging
+import argparse
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Callable
 import json
-import streamlit as st
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-
-def load_json_files(directory_path: str) -> List[Dict]:
-    """Load multiple JSON files from a directory with error handling"""
-    json_files = []
-    
-    # Check if directory exists
-    if not os.path.exists(directory_path):
-        st.error(f"Directory not found: {directory_path}")
-        return json_files
-    
-    # List all files in directory
-    files = list(Path(directory_path).glob('*.json'))
-    if not files:
-        st.warning(f"No JSON files found in {directory_path}")
-        return json_files
-    
-    # Process each file
-    for file_path in files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                st.info(f"Processing file: {file_path}")
-                data = json.load(file)
-                if not data.get('content'):
-                    st.warning(f"No content found in {file_path}")
+from langchain_core.documents import Document
+from helper_functions import llm
+from helper_functions import rate_limit
+from helper_functions.embeddings import CachedOpenAIEmbeddings
+from utils.bm25 import BM25Index, HybridRetriever, BM25_FILENAME
+from utils.dedup import BoilerplateFilter, NearDuplicateFilter
+from utils import context_compression
+
+# "chroma" (default) or "numpy" for the in-process memory-mapped index in utils/numpy_index.py
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')
+PERSIST_DIRECTORIES = {"chroma": "chroma_db", "numpy": "vector_index"}
+PERSIST_DIRECTORY = PERSIST_DIRECTORIES[VECTOR_BACKEND]
+DATA_DIRECTORIES = ["data/cet_courses", "data/partnerships"]
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+# Audience partition of each data directory, matching the intent classifier's labels.
+# Chunks from any other directory are "general" and searched for every audience.
+AUDIENCES = {"cet_courses": "adult_learner", "partnerships": "industrial_partner"}
+GENERAL_AUDIENCE = "general"
+
+# Ingestion tunables: files parsed in parallel, and chunks embedded and upserted per batch
+READ_WORKERS = 8
+UPSERT_BATCH_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+class IngestProgress:
+    """Aggregated ingestion counters, reported once per batch rather than per file"""
+
+    def __init__(self, callback: Optional[Callable[["IngestProgress"], None]] = None):
+        self.callback = callback
+        self.files_read = 0
+        self.files_skipped = 0
+        self.errors: List[str] = []
+        self.chunks = 0
+        self.changes = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        # What deduplication kept out of the index, and the tokens that were indexed
+        self.boilerplate_segments = 0
+        self.duplicate_chunks = 0
+        self.tokens_removed = 0
+        self.tokens_indexed = 0
+
+    def report(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    def summary(self) -> str:
+        summary = (
+            f"{self.files_read} files read ({self.files_skipped} skipped, {len(self.errors)} errors), "
+            f"{self.chunks} chunks: {self.changes['added']} added, {self.changes['updated']} updated, "
+            f"{self.changes['deleted']} deleted, {self.changes['unchanged']} unchanged"
+        )
+        if self.tokens_removed:
+            saved = self.tokens_removed / (self.tokens_removed + self.tokens_indexed)
+            summary += (
+                f"; dedup removed {self.boilerplate_segments} boilerplate passages and "
+                f"{self.duplicate_chunks} near-duplicate chunks (~{self.tokens_removed} tokens, {saved:.0%} of embedding input)"
+            )
+        return summary
+
+def audience_for_directory(directory_path: str) -> str:
+    return AUDIENCES.get(Path(directory_path).name, GENERAL_AUDIENCE)
+
+def audience_filter(user_type: Optional[str]) -> Optional[Dict]:
+    """Metadata filter restricting a search to one audience's partition, or None to search everything"""
+    if user_type not in AUDIENCES.values():
+        return None
+    return {"audience": {"$in": [user_type, GENERAL_AUDIENCE]}}
+
+def content_hash(text: str) -> str:
+    """Stable content hash used to detect changed documents and chunks"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def document_from_record(source: str, data: Dict) -> Dict:
+    """Turn one scraped record into {"source", "text"}, or {"source", "skipped"} if it has no content"""
+    if not data.get('content'):
+        return {"source": source, "skipped": f"No content found in {source}"}
+
+    processed_text = f"URL: {data.get('url', 'No URL')}\n"
+    processed_text += f"Title: {data.get('title', 'No Title')}\n"
+    processed_text += f"Content: {data.get('content', 'No Content')}"
+    return {"source": source, "text": processed_text, "url": data.get('url', ''), "title": data.get('title', '')}
+
+def read_document(file_path: Path) -> Dict:
+    """Parse one scraped JSON file into {"source", "text"}, or {"source", "error"}"""
+    source = file_path.as_posix()
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except json.JSONDecodeError as e:
+        return {"source": source, "error": f"Error decoding JSON from {file_path}: {str(e)}"}
+    except Exception as e:
+        return {"source": source, "error": f"Error processing {file_path}: {str(e)}"}
+    return document_from_record(source, data)
+
+def read_jsonl(file_path: Path) -> Iterator[Dict]:
+    """Stream documents from a scraper dataset.jsonl, one record per line.
+
+    Records are keyed by URL rather than line number, so a re-crawl that
+    visits pages in a different order does not look like changed chunks.
+    """
+    path = file_path.as_posix()
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
                     continue
-                    
-                processed_text = f"URL: {data.get('url', 'No URL')}\n"
-                processed_text += f"Title: {data.get('title', 'No Title')}\n"
-                processed_text += f"Content: {data.get('content', 'No Content')}"
-                
-                if len(processed_text.strip()) > 0:
-                    json_files.append(processed_text)
-                else:
-                    st.warning(f"Processed text is empty for {file_path}")
-                
-        except json.JSONDecodeError as e:
-            st.error(f"Error decoding JSON from {file_path}: {str(e)}")
-        except Exception as e:
-            st.error(f"Error processing {file_path}: {str(e)}")
-    
-    return json_files
-
-def initialize_vectorstore():
-    """Initialize Chroma vectorstore with document data if it doesn't exist"""
-    persist_directory = "chroma_db"
-    
-    # Check for existing vector store
-    if os.path.exists(persist_directory):
-        try:
-            embeddings = OpenAIEmbeddings()
-            vector_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-            st.success("Successfully loaded existing vector store")
-            return vector_store
-        except Exception as e:
-            st.error(f"Error loading existing vector store: {str(e)}")
-            # If loading fails, we'll recreate the vector store
-            import shutil
-            shutil.rmtree(persist_directory, ignore_errors=True)
-    
-    # Load data from both directories
-    st.info("Loading CET course data...")
-    cet_data = load_json_files("data/cet_courses")
-    st.info(f"Loaded {len(cet_data)} CET course documents")
-    
-    st.info("Loading partnership data...")
-    partnership_data = load_json_files("data/partnerships")
-    st.info(f"Loaded {len(partnership_data)} partnership documents")
-    
-    all_texts = cet_data + partnership_data
-    
-    if not all_texts:
-        st.error("No valid documents found to create vector store")
-        raise ValueError("No documents available for vector store creation")
-    
-    # Split texts
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield {"source": f"{path}:{line_number}", "error": f"Error decoding JSON from {file_path} line {line_number}: {str(e)}"}
+                    continue
+                yield document_from_record(f"{path}#{data.get('url', line_number)}", data)
+    except Exception as e:
+        yield {"source": path, "error": f"Error processing {file_path}: {str(e)}"}
+
+def iter_documents(directories: Iterable[str], progress: Optional[IngestProgress] = None, max_workers: int = READ_WORKERS) -> Iterator[Dict]:
+    """Read and parse scraped JSON and JSONL files, yielding documents in a stable order.
+
+    JSON files are read in parallel in windows of a few per worker, and JSONL
+    datasets are streamed line by line, so only a bounded number of parsed
+    documents is held in memory at any time.
+    """
+    progress = progress or IngestProgress()
+    files, datasets = [], []
+    for directory_path in directories:
+        if not os.path.exists(directory_path):
+            progress.errors.append(f"Directory not found: {directory_path}")
+            continue
+        audience = audience_for_directory(directory_path)
+        files.extend((path, audience) for path in sorted(Path(directory_path).glob('*.json')))
+        datasets.extend((path, audience) for path in sorted(Path(directory_path).glob('*.jsonl')))
+
+    def tally(documents, audience):
+        # Documents inherit the audience partition of the directory they were read from
+        for document in documents:
+            if "error" in document:
+                progress.errors.append(document["error"])
+            elif "skipped" in document:
+                progress.files_skipped += 1
+            else:
+                progress.files_read += 1
+                document["audience"] = audience
+                yield document
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        file_iter = iter(files)
+        while True:
+            window = list(islice(file_iter, max_workers * 4))
+            if not window:
+                break
+            for (_, audience), document in zip(window, executor.map(read_document, [path for path, _ in window])):
+                yield from tally([document], audience)
+
+    for dataset_path, audience in datasets:
+        yield from tally(read_jsonl(dataset_path), audience)
+
+def iter_chunks(documents: Iterable[Dict]) -> Iterator[Dict]:
+    """Split documents into chunks keyed by a stable per-document chunk ID.
+
+    The hash covers the metadata as well as the text, so a metadata change
+    (e.g. a page moving to another audience) re-upserts the chunk.
+    """
+    # Imported here since only ingestion needs it, and it is slow to import
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         length_function=len
     )
-    
-    texts = []
-    for text in all_texts:
-        chunks = text_splitter.split_text(text)
-        texts.extend(chunks)
-        
-    st.info(f"Created {len(texts)} text chunks for indexing")
-    
-    if not texts:
-        st.error("No text chunks created after splitting")
-        raise ValueError("Text splitting resulted in no chunks")
-    
+    for document in documents:
+        source = document["source"]
+        for index, chunk in enumerate(text_splitter.split_text(document["text"])):
+            chunk_id = f"{source}#{index}"
+            metadata = {
+                "source": source,
+                "chunk_id": chunk_id,
+                "url": document.get("url", ""),
+                "title": document.get("title", ""),
+                "audience": document.get("audience", GENERAL_AUDIENCE),
+            }
+            yield {
+                "id": chunk_id,
+                "text": chunk,
+                "hash": content_hash(chunk + json.dumps(metadata, sort_keys=True)),
+                "source": source,
+                "metadata": metadata,
+            }
+
+def strip_boilerplate(documents: Iterable[Dict], boilerplate: BoilerplateFilter, progress: IngestProgress) -> Iterator[Dict]:
+    """Remove passages repeated across many pages before the documents are chunked"""
+    for document in documents:
+        text, removed = boilerplate.strip(document["text"])
+        if removed:
+            progress.boilerplate_segments += len(removed)
+            progress.tokens_removed += llm.count_tokens(' '.join(removed))
+        yield {**document, "text": text}
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def load_manifest(persist_directory: str = PERSIST_DIRECTORY) -> Dict:
+    """Load the index manifest, or an empty one if missing or from another version"""
+    manifest_path = Path(persist_directory) / MANIFEST_FILENAME
+    empty = {"version": MANIFEST_VERSION, "documents": {}, "chunks": {}}
+    if not manifest_path.exists():
+        return empty
     try:
-        # Create vector store
-        embeddings = OpenAIEmbeddings()
-        vector_store = Chroma.from_texts(
-            texts=texts,
-            embedding=embeddings,
-            persist_directory=persist_directory
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return empty
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty
+    return manifest
+
+def save_manifest(manifest: Dict, persist_directory: str = PERSIST_DIRECTORY):
+    """Write the manifest atomically so a crash never leaves a half-written file"""
+    manifest_path = Path(persist_directory) / MANIFEST_FILENAME
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+def sync_vectorstore(vector_store, documents: Iterable[Dict], persist_directory: str = PERSIST_DIRECTORY,
+                     progress: Optional[IngestProgress] = None, batch_size: int = UPSERT_BATCH_SIZE,
+                     duplicates: Optional[NearDuplicateFilter] = None) -> Dict[str, int]:
+    """Stream documents into the vector store, embedding only chunks that changed.
+
+    Chunks are diffed against the manifest as they are produced and changed
+    ones are embedded and upserted batch_size at a time, so documents and
+    embeddings are never all held at once. The new manifest, the BM25 index
+    and the NearDuplicateFilter's signatures are built in memory, though, and
+    grow with the corpus. With a NearDuplicateFilter, chunks that nearly
+    repeat an earlier one are left out of the index.
+    """
+    progress = progress or IngestProgress()
+    old_manifest = load_manifest(persist_directory)
+    old_chunks = old_manifest["chunks"]
+    if not old_chunks:
+        # Stores built before manifests existed use random IDs we cannot diff against
+        existing_ids = vector_store.get(include=[])["ids"]
+        if existing_ids:
+            vector_store.delete(ids=existing_ids)
+
+    manifest = {"version": MANIFEST_VERSION, "documents": {}, "chunks": {}}
+    lexical_index = BM25Index()
+
+    def tracked(documents):
+        for document in documents:
+            manifest["documents"][document["source"]] = content_hash(document["text"])
+            yield document
+
+    def unique(chunks):
+        for chunk in chunks:
+            # Duplicates are only dropped within an audience, so every partition stays complete
+            if duplicates is not None and duplicates.check(chunk["id"], chunk["text"], chunk["metadata"]["audience"]) is not None:
+                progress.duplicate_chunks += 1
+                progress.tokens_removed += llm.count_tokens(chunk["text"])
+                continue
+            progress.tokens_indexed += llm.count_tokens(chunk["text"])
+            yield chunk
+
+    for batch in batched(unique(iter_chunks(tracked(documents))), batch_size):
+        to_embed = []
+        for chunk in batch:
+            manifest["chunks"][chunk["id"]] = chunk["hash"]
+            lexical_index.add(chunk["id"], chunk["text"], chunk["metadata"])
+            previous = old_chunks.get(chunk["id"])
+            if previous is None:
+                progress.changes["added"] += 1
+                to_embed.append(chunk)
+            elif previous != chunk["hash"]:
+                progress.changes["updated"] += 1
+                to_embed.append(chunk)
+            else:
+                progress.changes["unchanged"] += 1
+
+        # add_texts upserts, so updated chunks overwrite their previous embedding
+        if to_embed:
+            vector_store.add_texts(
+                texts=[chunk["text"] for chunk in to_embed],
+                metadatas=[chunk["metadata"] for chunk in to_embed],
+                ids=[chunk["id"] for chunk in to_embed]
+            )
+        progress.chunks += len(batch)
+        progress.report()
+
+    if not manifest["chunks"]:
+        raise ValueError("Text splitting resulted in no chunks")
+
+    deleted = [chunk_id for chunk_id in old_chunks if chunk_id not in manifest["chunks"]]
+    for batch in batched(deleted, batch_size):
+        vector_store.delete(ids=batch)
+    progress.changes["deleted"] = len(deleted)
+
+    # The lexical index is cheap to rebuild from the chunks, so rebuild it whole
+    changed = progress.changes["added"] or progress.changes["updated"] or progress.changes["deleted"]
+    if changed or not (Path(persist_directory) / BM25_FILENAME).exists():
+        lexical_index.finalize()
+        lexical_index.save(persist_directory)
+
+    # The NumPy backend keeps writes in memory until saved
+    if hasattr(vector_store, "save"):
+        vector_store.save(persist_directory)
+    save_manifest(manifest, persist_directory)
+    progress.report()
+
+    return dict(progress.changes)
+
+def get_retriever(vector_store, persist_directory: str = PERSIST_DIRECTORY, k: int = 4, user_type: Optional[str] = None,
+                  lexical_index: Optional[BM25Index] = None, compress: bool = context_compression.ENABLED,
+                  service=None):
+    """Hybrid BM25 + dense retriever, or plain dense search if no BM25 index exists.
+
+    With a user_type, both searches are restricted to that audience's partition.
+    Pass a loaded lexical_index to share one BM25 index between retrievers.
+    With compress, FETCH_K candidates are narrowed to k by MMR and cut down to
+    their relevant sentences (see utils/context_compression.py).
+    With a service (see utils/retrieval_service.py), dense searches are
+    batched with other sessions' instead of embedding and searching alone,
+    and vector_store may be None.
+    """
+    fetch_k = max(k, context_compression.FETCH_K) if compress else k
+    search_filter = audience_filter(user_type)
+    def dense(k):
+        if service is not None:
+            from utils.retrieval_service import BatchedRetriever
+            return BatchedRetriever(service=service, k=k, filter=search_filter)
+        return vector_store.as_retriever(search_kwargs={"k": k} if search_filter is None else {"k": k, "filter": search_filter})
+
+    if lexical_index is None and not (Path(persist_directory) / BM25_FILENAME).exists():
+        retriever = dense(fetch_k)
+    else:
+        retriever = HybridRetriever(
+            dense_retriever=dense(max(fetch_k, 10)),
+            lexical_index=lexical_index or BM25Index.load(persist_directory),
+            k=fetch_k,
+            audiences=search_filter["audience"]["$in"] if search_filter else None
         )
-        st.success("Successfully created and persisted new vector store")
-        return vector_store
-        
-    except Exception as e:
-        st.error(f"Error creating vector store: {str(e)}")
-        raise
\ No newline at end of file
+    if not compress:
+        return retriever
+    from langchain.retrievers.contextual_compression import ContextualCompressionRetriever
+    return ContextualCompressionRetriever(
+        base_compressor=context_compression.ContextCompressor(
+            embeddings=vector_store.embeddings if vector_store is not None else CachedOpenAIEmbeddings(), k=k),
+        base_retriever=retriever
+    )
+
+def get_audience_retrievers(vector_store, user_types: Iterable[str], persist_directory: str = PERSIST_DIRECTORY, k: int = 4,
+                            compress: bool = context_compression.ENABLED, service=None) -> Dict:
+    """One retriever per user type, each searching only its audience partition, sharing one BM25 index"""
+    lexical_index = None
+    if (Path(persist_directory) / BM25_FILENAME).exists():
+        lexical_index = BM25Index.load(persist_directory)
+    return {
+        user_type: get_retriever(vector_store, persist_directory, k, user_type=user_type, lexical_index=lexical_index,
+                                 compress=compress, service=service)
+        for user_type in user_types
+    }
+
+def get_documents(vector_store, chunk_ids: List[str]) -> List[Document]:
+    """Fetch chunks by ID, in the order given; IDs no longer in the store are skipped"""
+    if not chunk_ids:
+        return []
+    stored = vector_store.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+    by_id = {
+        chunk_id: Document(page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+    }
+    return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+def open_vectorstore(persist_directory: str = PERSIST_DIRECTORY, backend: str = VECTOR_BACKEND):
+    """Open (or create) the persistent vector store behind the cached embedding layer"""
+    if backend == "numpy":
+        from utils.numpy_index import NumpyVectorStore
+        return NumpyVectorStore(CachedOpenAIEmbeddings(), persist_directory=persist_directory)
+    from helper_functions.sqlite_compat import use_pysqlite3
+    use_pysqlite3()
+    from langchain.vectorstores import Chroma
+    return Chroma(persist_directory=persist_directory, embedding_function=CachedOpenAIEmbeddings())
+
+def build_vectorstore(persist_directory: str = PERSIST_DIRECTORY, directories: Iterable[str] = DATA_DIRECTORIES,
+                      progress: Optional[IngestProgress] = None, batch_size: int = UPSERT_BATCH_SIZE,
+                      backend: str = VECTOR_BACKEND, dedup: bool = True):
+    """Run the ingestion pipeline headlessly: read, dedup, chunk, embed and upsert"""
+    progress = progress or IngestProgress()
+    vector_store = open_vectorstore(persist_directory, backend)
+    documents = iter_documents(directories, progress)
+    duplicates = None
+    if dedup:
+        # Boilerplate is recognised by how many pages repeat it, which needs a first pass
+        boilerplate = BoilerplateFilter().fit(iter_documents(directories))
+        documents = strip_boilerplate(documents, boilerplate, progress)
+        duplicates = NearDuplicateFilter()
+    # Embedding calls queue behind users' turns for the shared quota
+    with rate_limit.client_context(session="indexing", priority=rate_limit.BACKGROUND):
+        sync_vectorstore(vector_store, documents, persist_directory, progress, batch_size, duplicates)
+    return vector_store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or incrementally update the vector store")
+    parser.add_argument("directories", nargs="*", default=DATA_DIRECTORIES, help="Directories of scraped JSON documents")
+    parser.add_argument("--backend", choices=sorted(PERSIST_DIRECTORIES), default=VECTOR_BACKEND)
+    parser.add_argument("--persist-directory", help="Update this directory in place instead of building a new version of the app's index")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Chunks embedded and upserted per batch")
+    parser.add_argument("--no-dedup", action="store_true", help="Index boilerplate and near-duplicate chunks too")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    progress = IngestProgress(lambda p: logger.info(p.summary()))
+    if args.persist_directory:
+        build_vectorstore(args.persist_directory, args.directories, progress, args.batch_size, args.backend, not args.no_dedup)
+    else:
+        # The app's own index is built as a new version and swapped in once validated
+        from utils import index_versions
+        index_versions.build(None, args.directories, progress, args.batch_size, args.backend, not args.no_dedup)
+        index_versions.prune(PERSIST_DIRECTORIES[args.backend])
+    for error in progress.errors:
+        logger.error(error)
+    print(f"Vector store synced: {progress.summary()}")
+    return 1 if progress.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
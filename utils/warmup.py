@@ -0,0 +1,50 @@
+"""Background warm-up of the shared RAG pipeline.
+
+Home.py starts it while the user is still typing the password, so the
+Assistant page finds the heavy modules imported and the vector store, chains
+and classifier built. This module itself imports nothing heavy.
+"""
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+# How long a page waits for the warm-up before telling the user to try again
+WAIT_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+status: Dict = {"state": "not started", "seconds": None, "error": None}
+
+def _run():
+    start = time.perf_counter()
+    status["state"] = "running"
+    try:
+        from utils import knowledge_base
+        knowledge_base.warm_up()
+        status["state"] = "done"
+    except Exception as e:
+        # The Assistant page builds whatever is missing itself, with errors shown in the UI
+        logger.exception("Warm-up failed")
+        status.update(state="failed", error=f"{type(e).__name__}: {e}")
+    status["seconds"] = time.perf_counter() - start
+    logger.info(f"Warm-up {status['state']} in {status['seconds']:.1f}s")
+
+def start() -> threading.Thread:
+    """Start the warm-up once per process; later calls return the same thread"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="pipeline-warmup", daemon=True)
+            _thread.start()
+        return _thread
+
+def wait(timeout: Optional[float] = WAIT_SECONDS) -> bool:
+    """Block until the warm-up has finished or timeout seconds passed; True if it succeeded"""
+    start().join(timeout)
+    return status["state"] == "done"
+
+def running() -> bool:
+    return _thread is not None and _thread.is_alive()
@@ -1,21 +1,74 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from urllib.robotparser import RobotFileParser
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urldefrag
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import time
+import os
 import json
 from pathlib import Path
 import logging
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Deque
+
+CHECKPOINT_VERSION = 1
+# Seconds between requests to one host when robots.txt sets no Crawl-delay
+DEFAULT_RATE_LIMIT = 1.0
+
+class HostThrottle:
+    """Per-host politeness gate: requests to one host start at least `delay` seconds apart"""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """Reserve the next request slot for the URL's host and sleep until it opens"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
 
 class EthicalWebScraper:
-    def __init__(self, base_url: str, output_dir: str = "scraped_data"):
+    """Crawls one site into dataset.jsonl, within robots.txt and a per-host delay.
+
+    Requests to a host start at least `rate_limit` seconds apart, so a
+    single-site crawl runs at no more than 1 / rate_limit pages per second
+    however high `concurrency` is. A shorter delay crawls faster but loads the
+    site harder; keep the default for sites you do not run. The site's
+    Crawl-delay is a floor a smaller rate_limit cannot go below.
+    """
+    USER_AGENT = 'Ethical Web Scraper for Document Creation/1.0 (Respects robots.txt)'
+
+    def __init__(self, base_url: str, output_dir: str = "scraped_data", concurrency: int = 1, checkpoint_every: int = 25,
+                 rate_limit: float = DEFAULT_RATE_LIMIT):
         self.base_url = base_url
         self.domain = urlparse(base_url).netloc
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.dataset_path = self.output_dir / "dataset.jsonl"
+        self.checkpoint_path = self.output_dir / "crawl_state.json"
+        self.checkpoint_every = checkpoint_every  # Pages between crawl state checkpoints
+        self.pages_scraped = 0
         self.visited_urls: Set[str] = set()
-        self.rate_limit = 1  # Delay between requests in seconds
+        self.seen_urls: Set[str] = set()  # Everything ever enqueued, so each URL is queued once
+        self.rate_limit = rate_limit  # Minimum delay between requests to the same host, in seconds
+        self.concurrency = concurrency  # Number of pages fetched in parallel
+
+        # Pooled keep-alive connections shared by all workers
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': self.USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9',
+        })
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(concurrency, 10))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         
         # Setup logging
         logging.basicConfig(
@@ -33,18 +86,23 @@ class EthicalWebScraper:
         except Exception as e:
             self.logger.error(f"Error reading robots.txt: {e}")
 
+        # robots.txt Crawl-delay is the floor: our rate limit can only be stricter
+        self.crawl_delay = 0.0
+        try:
+            self.crawl_delay = float(self.rp.crawl_delay(self.USER_AGENT) or 0)
+        except Exception as e:
+            self.logger.error(f"Error reading Crawl-delay: {e}")
+        self.throttle = HostThrottle(max(self.rate_limit, self.crawl_delay))
+
     def is_allowed(self, url: str) -> bool:
         """Check if scraping is allowed for this URL according to robots.txt"""
-        return self.rp.can_fetch("*", url)
+        # The same user agent the requests and the Crawl-delay lookup use
+        return self.rp.can_fetch(self.USER_AGENT, url)
 
     def get_page_content(self, url: str) -> tuple[str, List[str]]:
         """Retrieve page content and extract links"""
-        headers = {
-            'User-Agent': 'Ethical Web Scraper for Document Creation/1.0 (Respects robots.txt)',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9',
-        }
-        
-        response = requests.get(url, headers=headers)
+        self.throttle.wait(url)
+        response = self.session.get(url, timeout=30)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -59,8 +117,8 @@ class EthicalWebScraper:
         # Extract links
         links = []
         for link in soup.find_all('a', href=True):
-            full_url = urljoin(url, link['href'])
-            if self.domain in full_url and full_url not in self.visited_urls:
+            full_url = urldefrag(urljoin(url, link['href'])).url
+            if self.domain in full_url and full_url not in self.seen_urls:
                 links.append(full_url)
                 
         return content, links
@@ -75,58 +133,138 @@ class EthicalWebScraper:
             'domain': self.domain
         }
 
-    def scrape_site(self, max_pages: int = 100) -> List[Dict]:
-        """Main scraping function that crawls the website and creates documents"""
-        documents = []
-        urls_to_visit = [self.base_url]
-        
-        while urls_to_visit and len(documents) < max_pages:
-            url = urls_to_visit.pop(0)
-            
-            if url in self.visited_urls:
-                continue
-                
-            if not self.is_allowed(url):
-                self.logger.warning(f"Scraping not allowed for: {url}")
-                continue
-                
+    def enqueue(self, frontier: Deque[str], urls: List[str]):
+        """Add unseen URLs to the frontier, deduplicating at enqueue time"""
+        for url in urls:
+            url = urldefrag(url).url
+            if url not in self.seen_urls:
+                self.seen_urls.add(url)
+                frontier.append(url)
+
+    def fetch(self, url: str):
+        """Fetch one page on a worker thread; returns (url, content, links) or None"""
+        if not self.is_allowed(url):
+            self.logger.warning(f"Scraping not allowed for: {url}")
+            return None
+        try:
+            self.logger.info(f"Scraping: {url}")
+            content, new_links = self.get_page_content(url)
+            return url, content, new_links
+        except Exception as e:
+            self.logger.error(f"Error scraping {url}: {e}")
+            return None
+
+    def load_checkpoint(self, frontier: Deque[str]) -> bool:
+        """Restore crawl state from the last checkpoint; returns False when there is none to resume"""
+        if not self.checkpoint_path.exists():
+            return False
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.error(f"Ignoring unreadable checkpoint: {e}")
+            return False
+        if state.get("version") != CHECKPOINT_VERSION or state.get("base_url") != self.base_url:
+            return False
+
+        self.pages_scraped = state["pages"]
+        self.seen_urls = set(state["seen"])
+        self.visited_urls = set(state["visited"])
+        frontier.extend(state["frontier"])
+        # Pages appended after the checkpoint are still in the frontier, so drop them to avoid duplicates
+        with open(self.dataset_path, 'a+b') as f:
+            f.truncate(state["dataset_bytes"])
+        self.logger.info(f"Resuming crawl: {self.pages_scraped} pages done, {len(frontier)} queued")
+        return True
+
+    def save_checkpoint(self, frontier: Deque[str], in_flight: List[str], dataset_bytes: int):
+        """Atomically persist everything needed to resume: frontier, seen/visited sets and dataset offset"""
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "base_url": self.base_url,
+            "pages": self.pages_scraped,
+            "dataset_bytes": dataset_bytes,
+            # In-flight pages have not been written yet, so they go back on the frontier
+            "frontier": list(in_flight) + list(frontier),
+            "seen": sorted(self.seen_urls),
+            "visited": sorted(self.visited_urls),
+        }
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def scrape_site(self, max_pages: int = 100, resume: bool = True) -> int:
+        """Main scraping function that crawls the website and creates documents.
+
+        Up to `concurrency` pages are fetched at once over a shared connection
+        pool, while HostThrottle keeps each host within its politeness delay.
+        Documents are appended to dataset.jsonl as they arrive and the crawl
+        state is checkpointed every `checkpoint_every` pages, so an interrupted
+        crawl picks up where it stopped. A crawl that finishes (frontier empty
+        or `max_pages` reached) deletes its checkpoint, so the next run starts
+        afresh. Returns the number of pages scraped.
+        """
+        self.throttle.delay = max(self.rate_limit, self.crawl_delay)
+        frontier: Deque[str] = deque()
+        self.pages_scraped = 0
+        if not (resume and self.load_checkpoint(frontier)):
+            self.seen_urls, self.visited_urls = set(), set()
+            self.dataset_path.unlink(missing_ok=True)
+            self.enqueue(frontier, [self.base_url])
+
+        with open(self.dataset_path, 'ab') as dataset, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = {}
+            last_checkpoint = self.pages_scraped
+            finished = False
             try:
-                self.logger.info(f"Scraping: {url}")
-                content, new_links = self.get_page_content(url)
-                
-                # Create and save document
-                doc = self.create_document(url, content)
-                documents.append(doc)
-                
-                # Save individual documents as JSON
-                doc_filename = self.output_dir / f"doc_{len(documents)}.json"
-                with open(doc_filename, 'w', encoding='utf-8') as f:
-                    json.dump(doc, f, ensure_ascii=False, indent=2)
-                
-                # Update tracking
-                self.visited_urls.add(url)
-                urls_to_visit.extend(new_links)
-                
-                # Respect rate limiting
-                time.sleep(self.rate_limit)
-                
-            except Exception as e:
-                self.logger.error(f"Error scraping {url}: {e}")
-                continue
-        
-        # Save full dataset
-        dataset_path = self.output_dir / "full_dataset.json"
-        with open(dataset_path, 'w', encoding='utf-8') as f:
-            json.dump(documents, f, ensure_ascii=False, indent=2)
-            
-        return documents
+                while frontier or in_flight:
+                    # Keep the pool busy without fetching more pages than we can keep
+                    while frontier and len(in_flight) < self.concurrency and self.pages_scraped + len(in_flight) < max_pages:
+                        url = frontier.popleft()
+                        in_flight[executor.submit(self.fetch, url)] = url
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                        result = future.result()
+                        if result is None or self.pages_scraped >= max_pages:
+                            continue
+                        url, content, new_links = result
+
+                        # Append the document as one JSON line
+                        line = json.dumps(self.create_document(url, content), ensure_ascii=False) + '\n'
+                        dataset.write(line.encode('utf-8'))
+                        self.pages_scraped += 1
+
+                        # Update tracking
+                        self.visited_urls.add(url)
+                        self.enqueue(frontier, new_links)
+
+                    if self.pages_scraped - last_checkpoint >= self.checkpoint_every:
+                        dataset.flush()
+                        self.save_checkpoint(frontier, list(in_flight.values()), dataset.tell())
+                        last_checkpoint = self.pages_scraped
+                finished = True
+            finally:
+                dataset.flush()
+                if finished:
+                    self.checkpoint_path.unlink(missing_ok=True)
+                else:
+                    # Reached on errors and Ctrl+C, so the next run resumes from here
+                    self.save_checkpoint(frontier, list(in_flight.values()), dataset.tell())
+
+        return self.pages_scraped
 
 def main():
     # Example usage
     website_url = "https://example.com"  # Replace with target website
-    scraper = EthicalWebScraper(website_url, "scraped_documents")
-    documents = scraper.scrape_site(max_pages=50)
-    print(f"Successfully scraped {len(documents)} pages")
+    scraper = EthicalWebScraper(website_url, "scraped_documents", concurrency=4)
+    pages = scraper.scrape_site(max_pages=50)
+    print(f"Successfully scraped {pages} pages into {scraper.dataset_path}")
 
 if __name__ == "__main__":
     main()